@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""Bulk kline backfill into the local archive (resumable)"""
+
+import argparse, os, time
+from trading_bot import BinanceClient, KlineArchive, backfill
+
+def main():
+    ap=argparse.ArgumentParser(description=__doc__)
+    ap.add_argument('--archive',default=os.environ.get('BOT_ARCHIVE','data/klines'))
+    ap.add_argument('--interval',default='5m')
+    ap.add_argument('--days',type=float,default=30)
+    ap.add_argument('--workers',type=int,default=4)
+    ap.add_argument('--symbols',nargs='*',help="default: every pair the exchange lists")
+    ap.add_argument('--top',type=int,help="only the first N pairs (priority order)")
+    ap.add_argument('--base',default=os.environ.get('BOT_BASE',BinanceClient.BASE))
+    a=ap.parse_args()
+    BinanceClient.BASE=a.base
+    bc=BinanceClient(market_pool=max(4,a.workers))
+    syms=a.symbols or bc.symbols
+    if a.top: syms=syms[:a.top]
+    arc=KlineArchive(a.archive)
+    t0=time.time()
+    n=backfill(bc,arc,syms,a.interval,a.days,a.workers)
+    print(f"{n} candles for {len(syms)} symbols in {time.time()-t0:.1f}s -> {a.archive}")
+
+if __name__=='__main__':
+    main()
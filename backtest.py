@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""Backtester — replays historical candles through Agent's real strategy logic"""
+
+import argparse, glob, json, math, os, random, time
+from datetime import datetime
+import numpy as np
+import requests
+from trading_bot import Agent, BatchTA, BinanceClient, KlineArchive, INTERVAL_MS, STRATEGY
+
+# ── DATA ─────────────────────────────────────────────────────
+COLS=('t','o','h','l','c','v')
+
+def columns(a):
+    # (N,6) t,o,h,l,c,v rows -> the per-symbol column arrays align() takes
+    a=np.asarray(a,dtype=float).reshape(-1,6)
+    return {'t':a[:,0].astype(np.int64),**{k:a[:,n] for n,k in enumerate(COLS[1:],1)}}
+
+def fetch_history(sym,interval,start,end,base=BinanceClient.BASE):
+    pages=[]; t=start
+    while t<end:
+        r=requests.get(f"{base}/fapi/v1/klines",timeout=10,
+                       params={'symbol':sym,'interval':interval,'startTime':t,'endTime':end,'limit':1500})
+        batch=r.json()
+        if not isinstance(batch,list) or not batch: break
+        pages.append(np.array([k[:6] for k in batch],dtype=float))
+        t=batch[-1][0]+INTERVAL_MS[interval]
+    return columns(np.concatenate(pages) if pages else np.empty((0,6)))
+
+def load_csv_dir(path,interval,symbols=None):
+    # one file per symbol: <SYM>_<interval>.csv with columns t,o,h,l,c,v (optional header row)
+    out={}
+    for f in sorted(glob.glob(os.path.join(path,f"*_{interval}.csv"))):
+        sym=os.path.basename(f).rsplit('_',1)[0]
+        if symbols and sym not in symbols: continue
+        if not os.path.getsize(f): continue
+        with open(f) as fh: skip=0 if fh.readline()[:1].isdigit() else 1
+        out[sym]=columns(np.loadtxt(f,delimiter=',',skiprows=skip,usecols=range(6),ndmin=2))
+    return out
+
+def load_archive(path,interval,start=None,symbols=None):
+    # the memmapped hot columns / decompressed segments go to align() as they are
+    arc=KlineArchive(path); out={}
+    for sym in symbols or arc.symbols(interval):
+        v=arc.read(sym,interval,start=start)
+        if len(v['t']): out[sym]=v
+    return out
+
+def synthetic(n_sym,n_bars,interval='5m',seed=0):
+    rnd=np.random.default_rng(seed); step=INTERVAL_MS[interval]
+    t0=int(time.time()*1000)//step*step-n_bars*step
+    t=np.arange(t0,t0+n_bars*step,step,dtype=np.int64)
+    out={}
+    for i in range(n_sym):
+        r=rnd.normal(0,0.004,n_bars); c=100*np.exp(np.cumsum(r)); o=np.r_[100,c[:-1]]
+        h=np.maximum(o,c)*(1+np.abs(rnd.normal(0,0.002,n_bars)))
+        l=np.minimum(o,c)*(1-np.abs(rnd.normal(0,0.002,n_bars)))
+        v=rnd.uniform(10,1000,n_bars)
+        out[f"SYN{i:03d}USDT"]=dict(t=t,o=o,h=h,l=l,c=c,v=v)
+    return out
+
+def align(series,interval):
+    # series: {sym:{t,o,h,l,c,v column arrays, t ascending}} onto a common time grid;
+    # gaps forward-filled, pre-listing bars flat and marked untradable
+    step=INTERVAL_MS[interval]
+    syms=[s for s,v in series.items() if len(v['t'])]
+    t0=min(int(series[s]['t'][0]) for s in syms); t1=max(int(series[s]['t'][-1]) for s in syms)
+    T=(t1-t0)//step+1; S=len(syms)
+    M={k:np.full((S,T),np.nan) for k in COLS[1:]}
+    live=np.zeros((S,T),dtype=bool)
+    for i,s in enumerate(syms):
+        v=series[s]
+        j=(np.asarray(v['t'],dtype=np.int64)-t0)//step
+        for k in COLS[1:]: M[k][i,j]=v[k]
+        live[i,j[0]:]=True
+    for i in range(S):
+        c=M['c'][i]; ok=~np.isnan(c)
+        idx=np.where(ok,np.arange(T),0); np.maximum.accumulate(idx,out=idx)
+        first=np.argmax(ok); idx[:first]=first
+        fill=c[idx]
+        for k in ('o','h','l','c'):
+            row=M[k][i]; nan=np.isnan(row); row[nan]=fill[nan]
+        np.nan_to_num(M['v'][i],copy=False)
+    return syms,t0+np.arange(T,dtype=np.int64)*step,M,live
+
+# ── SIMULATION ───────────────────────────────────────────────
+class SimClient:
+    # the slice of BinanceClient Agent touches, backed by the replay arrays
+    def __init__(self,syms):
+        self.symbols=syms
+        self.prices={}
+        self.ticker={}
+    def price(self,s): return self.prices.get(s,0)
+    def info(self,s): return self.ticker.get(s,{})
+    def fetch_live_pnl(self): return {}
+
+class SimClock:
+    def __init__(self): self.ms=0
+    def __call__(self): return datetime.fromtimestamp(self.ms/1000)
+
+class Backtest:
+    def __init__(self,syms,t,M,live,balance=1000.0,fee=0.0004,slip=0.0002,max_pos=None,warmup=60,seed=0,params=None):
+        self.syms=syms; self.t=t; self.M=M; self.live=live
+        self.balance=balance; self.fee=fee; self.slip=slip
+        self.params=dict(STRATEGY,**(params or {}))
+        self.max_pos=max_pos or self.params['max_pos']; self.warmup=warmup; self.seed=seed
+
+    def precompute(self,a=0,b=None,overlap=1000):
+        # indicators for bars [a,b); the overlap before a lets EMA/RSI state converge, as the live
+        # scan's per-symbol streaming state has (Agent._score; bench.py parity checks they agree)
+        b=len(self.t) if b is None else b
+        a0=max(0,a-overlap); M=self.M
+        ind=BatchTA.indicators(*(M[k][:,a0:b] for k in ('c','h','l','v')),last=False)
+        ind={k:v[:,a-a0:] for k,v in ind.items()}
+        # mask bars that still sit inside a symbol's warmup window
+        start=np.argmax(self.live,axis=1)+self.warmup
+        ok=np.arange(a,b)[None,:]>=start[:,None]
+        return ind,ok
+
+    def run(self,pre=None,chunk=20000):
+        t_start=time.perf_counter()
+        random.seed(self.seed)
+        bc=SimClient(self.syms); clock=SimClock()
+        ag=Agent(bc,self.params); ag.clock=clock; ag.fee=self.fee; ag.slip=self.slip; ag.verbose=False
+        ag.balance=ag.start_balance=self.balance
+        self.trades=[]; self.equity=np.empty(len(self.t))
+        T=len(self.t)
+        spans=[(0,T)] if pre is not None or T<=chunk else [(a,min(a+chunk,T)) for a in range(0,T,chunk)]
+        for a,b in spans:
+            self._replay(ag,bc,clock,a,b,pre or self.precompute(a,b))
+        step=int(self.t[1]-self.t[0]) if T>1 else INTERVAL_MS['5m']
+        return dict(trades=self.trades,equity=self.equity,t=self.t,
+                    stats=stats(self.equity,self.trades,self.balance,step),
+                    elapsed=round(time.perf_counter()-t_start,2))
+
+    def _replay(self,ag,bc,clock,a,b,pre):
+        ind,ok=pre
+        M=self.M; C,H,L,O=(M[k][:,a:b] for k in ('c','h','l','o'))
+        P=self.params
+        score,conf=BatchTA.score(C,H,L,ind,prev=M['c'][:,a-1] if a else None,P=P)
+        cand=ok&(np.abs(score)>=P['min_score'])&(conf>=P['min_conf'])
+        idx={s:i for i,s in enumerate(self.syms)}
+        done=ag.trades
+        bars=set(np.nonzero(cand.any(axis=0))[0].tolist())
+        for j in range(b-a):
+            clock.ms=int(self.t[a+j])
+            if ag.positions:
+                # intrabar path: open, the wick nearer the open first, the other wick, close
+                for k in range(4):
+                    for sym,pos in ag.positions.items():
+                        i=idx[sym]
+                        if k==0: p=O[i,j]
+                        elif k==3: p=C[i,j]
+                        else: p=(L if (k==1)==(C[i,j]>=O[i,j]) else H)[i,j]
+                        if k:   # past the open the path is continuous: a crossed TP/SL fills at its
+                                # level, only a gap at the open fills beyond it
+                            lo,hi=(pos['sl'],pos['tp']) if pos['type']=='LONG' else (pos['tp'],pos['sl'])
+                            p=min(max(p,lo),hi)
+                        bc.prices[sym]=float(p)
+                    ag.update()
+                    if not ag.positions: break
+                if ag.trades>done:
+                    self.trades+=reversed(ag.history[:ag.trades-done]); done=ag.trades
+            if j in bars:
+                rows=sorted(np.nonzero(cand[:,j])[0],key=lambda i:(abs(score[i,j]),conf[i,j]),reverse=True)
+                for i in rows:
+                    if len(ag.positions)>=self.max_pos: break
+                    s=self.syms[i]
+                    if s in ag.positions: continue
+                    x={k:float(v[i,j]) for k,v in ind.items()}
+                    prev=C[i,j-1] if j else M['c'][i,a-1] if a else C[i,j]
+                    x.update(price=float(C[i,j]),prev=float(prev),hi=float(H[i,j]),lo=float(L[i,j]))
+                    d=ag._evaluate(s,x,None); d['klines']=[]
+                    d=ag.decide_from(d)
+                    if d:
+                        bc.prices[s]=d['price']; ag.open(d)
+            self.equity[a+j]=ag.balance+sum(p['pnl'] for p in ag.positions.values())
+
+def stats(equity,trades,start,step_ms):
+    eq=np.asarray(equity,dtype=float)
+    peak=np.maximum.accumulate(eq)
+    dd=float(((peak-eq)/peak).max()*100) if len(eq) else 0.0
+    r=np.diff(eq)/eq[:-1] if len(eq)>1 else np.zeros(1)
+    per_year=365*86_400_000/step_ms
+    sharpe=float(r.mean()/r.std()*math.sqrt(per_year)) if r.std()>0 else 0.0
+    wins=[t for t in trades if t['won']]
+    gp=sum(t['pnl'] for t in wins); gl=-sum(t['pnl'] for t in trades if not t['won'])
+    return dict(trades=len(trades),win_rate=round(len(wins)/len(trades)*100,1) if trades else 0.0,
+                ret_pct=round(float(eq[-1]-start)/start*100,2) if len(eq) else 0.0,
+                max_dd_pct=round(dd,2),sharpe=round(sharpe,2),
+                profit_factor=round(gp/gl,2) if gl>0 else None,
+                final=round(float(eq[-1]),2) if len(eq) else start)
+
+def main():
+    ap=argparse.ArgumentParser(description=__doc__)
+    src=ap.add_mutually_exclusive_group(required=True)
+    src.add_argument('--csv',help="directory of <SYM>_<interval>.csv files")
+    src.add_argument('--archive',help="KlineArchive directory (see backfill.py)")
+    src.add_argument('--fetch',nargs='+',metavar='SYM',help="download these symbols over REST")
+    src.add_argument('--synthetic',type=int,metavar='N',help="N random-walk symbols")
+    ap.add_argument('--interval',default='5m')
+    ap.add_argument('--days',type=float,default=30)
+    ap.add_argument('--base',default=BinanceClient.BASE)
+    ap.add_argument('--balance',type=float,default=1000)
+    ap.add_argument('--fee',type=float,default=0.0004)
+    ap.add_argument('--slip',type=float,default=0.0002)
+    ap.add_argument('--max-pos',type=int)
+    ap.add_argument('--params',help="JSON file of STRATEGY overrides (e.g. from optimize.py)")
+    ap.add_argument('--seed',type=int,default=0)
+    ap.add_argument('--out',help="write trades/equity/stats JSON here")
+    a=ap.parse_args()
+
+    t0=time.perf_counter()
+    bars=int(a.days*86_400_000/INTERVAL_MS[a.interval])
+    if a.csv: series=load_csv_dir(a.csv,a.interval)
+    elif a.archive:
+        end=int(time.time()*1000); series=load_archive(a.archive,a.interval,end-bars*INTERVAL_MS[a.interval])
+    elif a.synthetic: series=synthetic(a.synthetic,bars,a.interval,a.seed)
+    else:
+        end=int(time.time()*1000); start=end-bars*INTERVAL_MS[a.interval]
+        series={s:fetch_history(s,a.interval,start,end,a.base) for s in a.fetch}
+    syms,t,M,live=align(series,a.interval)
+    print(f"loaded {len(syms)} symbols x {len(t)} bars in {time.perf_counter()-t0:.1f}s")
+    params=None
+    if a.params:
+        with open(a.params) as f: params=json.load(f)
+    bt=Backtest(syms,t,M,live,a.balance,a.fee,a.slip,a.max_pos,seed=a.seed,params=params)
+    res=bt.run()
+    print(f"replayed in {res['elapsed']}s")
+    print('  '.join(f"{k}={v}" for k,v in res['stats'].items()))
+    if a.out:
+        with open(a.out,'w') as f:
+            json.dump(dict(stats=res['stats'],trades=res['trades'],
+                           equity=[[int(x),round(float(y),2)] for x,y in zip(res['t'],res['equity'])]),f)
+
+if __name__=='__main__':
+    main()
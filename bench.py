@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""Benchmarks for the trading_bot hot paths, with a stored baseline as regression gate"""
+
+import argparse, gc, http.client, json, math, os, platform, random, shutil, statistics, sys, tempfile, threading, time
+import numpy as np
+import trading_bot as tb
+from trading_bot import TA, BatchTA, Indicators
+
+BASELINE=os.path.join(os.path.dirname(os.path.abspath(__file__)),'bench_baseline.json')
+
+# ── FIXTURES ─────────────────────────────────────────────────
+def make_klines(n,seed=0,p0=100.0,t0=1_700_000_000_000,step=300_000):
+    rnd=random.Random(seed); p=p0; out=[]
+    for i in range(n):
+        o=p; p*=math.exp(rnd.gauss(0,0.004))
+        h=max(o,p)*(1+abs(rnd.gauss(0,0.002))); l=min(o,p)*(1-abs(rnd.gauss(0,0.002)))
+        out.append({'t':t0+i*step,'o':o,'h':h,'l':l,'c':p,'v':rnd.uniform(10,1000)})
+    return out
+
+# ── TIMING ───────────────────────────────────────────────────
+# Shared hosts drift in speed over seconds, so absolute timings swing ~2x between runs. Every
+# round of best() also times a fixed reference workload right before the case and keeps the
+# ratio: drift cancels out of it, and the median drops the rounds a burst landed in. Timings
+# are reported in seconds via this run's reference time; the gate compares them normalized.
+REF_REPS=200
+
+def _ref(d={i:float(i) for i in range(64)}):
+    # plain dict iteration and float math, the same kind of work as the hot paths
+    s=0.0
+    for k,v in d.items(): s+=v*1.0001 if k&1 else -v
+    return s
+
+_ref_s=None
+def ref_time():
+    # this run's seconds per reference call: the fastest of many short rounds
+    global _ref_s
+    if _ref_s is None:
+        out=[]
+        for _ in range(50):
+            t0=time.perf_counter()
+            for _ in range(REF_REPS): _ref()
+            out.append((time.perf_counter()-t0)/REF_REPS)
+        _ref_s=min(out)
+    return _ref_s
+
+def best(fn,reps,rounds=7):
+    # seconds per call (GC off), as the median multiple of the reference timed in the same round
+    out=[]; ref_time(); gc.collect(); gc.disable()
+    try:
+        for _ in range(rounds):
+            t0=time.perf_counter()
+            for _ in range(REF_REPS): _ref()
+            t1=time.perf_counter()
+            for _ in range(reps): fn()
+            out.append((time.perf_counter()-t1)/reps/((t1-t0)/REF_REPS))
+    finally: gc.enable()
+    return statistics.median(out)*_ref_s
+
+class FakeClient:
+    # the BinanceClient surface Agent/Engine read, over fixed fixture candles ending now
+    def __init__(self,universe,n=70,step=300_000):
+        t0=(int(time.time()*1000)//step-n+1)*step
+        self.data={f"S{i:03d}USDT":make_klines(n,seed=i,t0=t0,step=step) for i in range(universe)}
+        self.symbols=list(self.data)
+        self.prices={s:v[-1]['c'] for s,v in self.data.items()}
+        self.ticker={s:dict(price=v[-1]['c'],change=1.25,volume=1e6,high=v[-1]['h'],low=v[-1]['l'],
+                            quoteVolume=1e8) for s,v in self.data.items()}
+        self.http=tb.HttpPool(); self.limiter=tb.WeightLimiter(); self._px_lk=threading.Lock()
+    mark=tb.BinanceClient.mark      # the live feed's copy-on-write swap of prices/ticker
+    def price(self,s): return self.prices.get(s,0)
+    def info(self,s): return self.ticker.get(s,{})
+    def fetch_account(self,force=False): return None
+    def fetch_live_pnl(self): return {}
+    def klines(self,sym,interval='5m',limit=60,start=None):
+        rows=self.data[sym]
+        if start is not None: rows=[k for k in rows if k['t']>=start]
+        return rows[-limit:]
+
+def make_agent(universe,positions=0,seed=0):
+    random.seed(seed)
+    bc=FakeClient(universe); ag=tb.Agent(bc); ag.verbose=False
+    ag.balance=ag.start_balance=1000.0
+    ag.klines.min_refresh=1e9
+    for s in bc.symbols: ag.klines.refresh(s,'5m')
+    for i,s in enumerate(bc.symbols[:positions]):
+        kl=bc.data[s]
+        ag.open(dict(action='LONG' if i%2 else 'SHORT',sym=s,price=bc.prices[s],conf=60,lev=3,
+                     strat='Trend Following',reasons=['RSI asiri satim 22','MACD guclu yukari'],atr=0.1,
+                     ind=dict(rsi=22.0,macd=0.1,e20=1.0,e50=1.0,bbu=1.0,bbl=1.0,vr=1.0),klines=kl[-40:]))
+    return ag
+
+def make_engine(universe,positions=6):
+    # an Engine without the network half of __init__
+    e=tb.Engine.__new__(tb.Engine)
+    e.agent=make_agent(universe,positions); e.bc=e.agent.bc
+    e.archive=None; e.stream=None; e.user=None; e.scanner=tb.Scanner(e.agent)
+    e.running=False; e.tick=0; e.events=(); e._ev_lk=threading.Lock(); e.snap=None
+    e.hub=tb.StreamHub(); e._dirty=threading.Event(); e._ev_id=0; e._last_state=None; e._pub_lk=threading.Lock()
+    for i in range(60): e.log(f"S{i:03d}USDT LONG @ $1.2345 | Guven 66% | RSI asiri satim 22","trade")
+    for i in range(40):
+        e.agent.history.insert(0,dict(id=i+1,sym=f"S{i:03d}USDT",type='LONG',entry=1.0,exit=1.01,tp=1.02,sl=0.99,
+            pnl=1.5,pnl_pct=3.0,lev=3,strat='Breakout',reasons=['Hacim patlamasi x3.1'],why='TP',
+            time='12:00:00',ht='5m',won=True))
+    return e
+
+def batch_ind(kl):
+    c=[k['c'] for k in kl]
+    m,ms=TA.macd(c)
+    bbu,bbm,bbl=TA.bb(c)
+    return dict(rsi=TA.rsi(c),macd=m,msig=ms,e20=TA.ema(c,20),e50=TA.ema(c,50),
+                bbu=bbu,bbm=bbm,bbl=bbl,atr=TA.atr(kl))
+
+# ── CASES ────────────────────────────────────────────────────
+def bench_ta_stream(universe=200,window=60,cycles=50):
+    data=[make_klines(window+cycles,seed=i) for i in range(universe)]
+
+    # batch: a full recompute per symbol over the trailing window; every cycle costs the same
+    batch=best(lambda:[batch_ind(kl[1:1+window]) for kl in data],1)/universe
+
+    # streaming: commit the candle that just closed, peek the forming one
+    sets=[]
+    for kl in data:
+        ind=Indicators()
+        for k in kl[:window-1]: ind.push(k['t'],k['h'],k['l'],k['c'])
+        sets.append(ind)
+    def step(j):
+        for kl,ind in zip(data,sets):
+            k=kl[window-1+j]; ind.push(k['t'],k['h'],k['l'],k['c'])
+            f=kl[window+j]; ind.peek(f['h'],f['l'],f['c'])
+    it=iter(range(cycles))
+    stream=best(lambda:step(next(it)),5)/universe    # 7 rounds x 5 cycles
+    for j in it: step(j)                              # rest of the history
+
+    # equivalence: streaming over the full history vs batch over the same history
+    err=0.0
+    for kl,ind in zip(data,sets):
+        f=kl[-1]; a=ind.peek(f['h'],f['l'],f['c']); b=batch_ind(kl)
+        err=max(err,max(abs(a[k]-b[k])/max(abs(b[k]),1e-12) for k in b))
+    return dict(case='ta_stream',universe=universe,cycles=cycles,
+                batch_us=round(batch*1e6,2),stream_us=round(stream*1e6,2),
+                speedup=round(batch/stream,1),max_rel_err=err)
+
+def bench_ta_batch(universe=200,window=60):
+    data=[make_klines(window,seed=i) for i in range(universe)]
+    M={k:np.array([[r[k] for r in kl] for kl in data]) for k in 'chlv'}
+    loop=best(lambda:[batch_ind(kl) for kl in data],1)
+    vec=best(lambda:BatchTA.indicators(M['c'],M['h'],M['l'],M['v']),10)
+    return dict(case='ta_batch',universe=universe,window=window,
+                loop_ms=round(loop*1e3,2),numpy_ms=round(vec*1e3,2),speedup=round(loop/vec,1))
+
+def bench_ta_funcs(universe=200,window=60):
+    data=[make_klines(window,seed=i) for i in range(universe)]
+    closes=[[k['c'] for k in kl] for kl in data]
+    out=dict(case='ta_funcs',universe=universe,window=window)
+    for name,fn in (('rsi',TA.rsi),('ema',lambda c:TA.ema(c,20)),('macd',TA.macd),('bb',TA.bb)):
+        out[name+'_us']=round(best(lambda:[fn(c) for c in closes],5)/universe*1e6,2)
+    out['atr_us']=round(best(lambda:[TA.atr(kl) for kl in data],5)/universe*1e6,2)
+    return out
+
+def bench_agent_analyze(universe=200):
+    ag=make_agent(universe); syms=ag.bc.symbols
+    for s in syms: ag.analyze(s)                  # indicator state warm, as in a running bot
+    per=best(lambda:[ag.analyze(s) for s in syms],10)
+    whole=best(lambda:ag.analyze_all(syms,ag.klines.cap),10)
+    return dict(case='agent_analyze',universe=universe,analyze_us=round(per/universe*1e6,2),
+                analyze_all_ms=round(whole*1e3,2))
+
+def bench_parity(universe=200,bars=1500,start=600):
+    # live scoring (rings + streaming state warmed from the archive) against the backtester's
+    # converged batch scores over the same candles: every bar must score identically
+    from backtest import Backtest, align, synthetic
+    S=min(universe,10)
+    syms,t,M,live=align(synthetic(S,bars,'5m',seed=7),'5m')
+    score,_=tb.BatchTA.score(M['c'],M['h'],M['l'],Backtest(syms,t,M,live).precompute()[0])
+    root=tempfile.mkdtemp(prefix='bench-par-')
+    try:
+        bc=FakeClient(0); bc.symbols=syms
+        ag=tb.Agent(bc); ag.verbose=False; ag.klines.archive=tb.KlineArchive(root)
+        diff=n=0; t0=time.perf_counter()
+        for i,s in enumerate(syms):
+            rows=[dict(t=int(t[j]),**{k:float(M[k][i,j]) for k in 'ohlcv'}) for j in range(bars)]
+            ag.klines.archive.append(s,'5m',rows[:start-60])
+            r=ag.klines.ring(s,'5m'); r.merge(rows[start-60:start])
+            for j in range(start-1,bars):
+                if j>=start: r.merge(rows[j:j+1])
+                diff+=int(ag._score(s,r)['score']!=score[i,j]); n+=1
+        el=time.perf_counter()-t0
+    finally: shutil.rmtree(root,ignore_errors=True)
+    assert not diff, f"live and backtest scores differ on {diff}/{n} bars"
+    return dict(case='parity',symbols=S,bars=n,score_us=round(el/n*1e6,2),mismatch=diff)
+
+def bench_agent_update(universe=200,positions=500):
+    n=positions; ag=make_agent(max(universe,n),n); bc=ag.bc
+    base=dict(bc.prices); rnd=random.Random(1); moves=[]
+    for _ in range(20):       # +/-0.1% stays inside every TP/SL band, so the book stays full
+        moves.append({s:p*(1+rnd.uniform(-0.001,0.001)) for s,p in base.items()})
+    it=iter(moves*2000)
+    def step():
+        bc.prices=next(it); ag.update()
+    t=best(step,20)
+    # a price event: one symbol moved, the rest of the book is not touched
+    syms=list(ag.positions); ev=iter(syms*100)
+    def event():
+        s=next(ev); bc.prices=next(it); ag.update({s})
+    te=best(event,3000)
+    assert len(ag.positions)==n
+    return dict(case='agent_update',positions=n,update_ms=round(t*1e3,3),per_pos_us=round(t/n*1e6,2),
+                event_us=round(te*1e6,2))
+
+def bench_triggers(universe=200,n=10_000):
+    # every trigger on one symbol: a shared book (many accounts on one market), the worst case
+    # for a per-symbol index. Agent holds one position per symbol, so its books stay at one
+    # TP/SL pair and what it gains is update() touching only moved symbols (agent_update.event_us).
+    # Levels rest outside the current price and lookups wander +/-0.3%, so a few cross per call
+    rnd=random.Random(3); out=dict(case='triggers',triggers=n)
+    ps=[100*(1+rnd.uniform(-0.003,0.003)) for _ in range(1000)]
+    for m in (100,1000,n):
+        ix=tb.TriggerIndex(); flat=[]
+        t0=time.perf_counter()
+        for i in range(m//2):
+            a=100*(1+rnd.uniform(0.002,0.05)); b=100*(1-rnd.uniform(0.002,0.05))
+            side='LONG' if i%2 else 'SHORT'; tp,sl=(a,b) if side=='LONG' else (b,a)
+            ix.place('S',i,side,tp,sl); flat+=[(i,'TP',tp,side=='LONG'),(i,'SL',sl,side!='LONG')]
+        build=time.perf_counter()-t0
+        for p in ps[:50]:
+            assert sorted(ix.hits('S',p))==sorted((k,kd) for k,kd,lv,up in flat if (p>=lv if up else p<=lv))
+        it=iter(ps*1000)
+        out[f'hits_{m}_us']=round(best(lambda:ix.hits('S',next(it)),5000)*1e6,2)
+    it=iter(ps*1000)
+    def scan():
+        # the per-position comparison Agent.update used to do
+        p=next(it); return [(k,kd) for k,kd,lv,up in flat if (p>=lv if up else p<=lv)]
+    scan=best(scan,20)
+    out['scan_%d_us'%n]=round(scan*1e6,1)
+    out['speedup']=round(scan/(out[f'hits_{n}_us']/1e6),1)
+    # trailing: ratchet random stops without rebuilding
+    keys=[rnd.randrange(n//2) for _ in range(1000)]; it=iter(keys*100)
+    def trail():
+        k=next(it); sym,up,lv=ix.at[(k,'SL')]; ix.move(k,'SL',lv*(1.0001 if not up else 0.9999))
+    out['move_us']=round(best(trail,1000)*1e6,2)
+    out['build_ms']=round(build*1e3,2)
+    return out
+
+def bench_archive(universe=200,history=2000):
+    root=tempfile.mkdtemp(prefix='bench-arc-')
+    try:
+        arc=tb.KlineArchive(root)
+        data={f"S{i:03d}USDT":make_klines(history+1,seed=i) for i in range(universe)}
+        t0=time.perf_counter()
+        for s,kl in data.items(): arc.append(s,'5m',kl[:-1])
+        build=time.perf_counter()-t0
+        # one closed candle per symbol, as the live ring commits them
+        t0=time.perf_counter()
+        for s,kl in data.items(): arc.append(s,'5m',kl[-1:])
+        append=(time.perf_counter()-t0)/universe
+        s0=next(iter(data))
+        tail=best(lambda:arc.tail(s0,'5m',60),200)
+        # torn append: stray rows in some columns must not shift later candles off their timestamps
+        d=arc._dir(s0,'5m')
+        for k in 'ohlc':
+            with open(os.path.join(d,k+'.bin'),'ab') as f: f.write(np.full(2,999.0).tobytes())
+        new=make_klines(2,seed=99,t0=data[s0][-1]['t']+300_000)
+        arc.append(s0,'5m',new)
+        got=arc.tail(s0,'5m',3)
+        assert got[1:]==new and got[0]==data[s0][-1], "torn append shifted the columns"
+    finally: shutil.rmtree(root,ignore_errors=True)
+    return dict(case='archive',universe=universe,history=history,build_ms=round(build*1e3,2),
+                append_us=round(append*1e6,2),tail_us=round(tail*1e6,2))
+
+def bench_engine_state(universe=200):
+    e=make_engine(universe)
+    st=e.state(network=False)
+    t_state=best(lambda:e.state(network=False),100)
+    t_json=best(lambda:json.dumps(st,separators=(',',':')),20)
+    def pub():
+        s=e.bc.symbols[0]; p=e.bc.prices[s]*1.0001
+        e.bc.mark({s:p},{s:{'price':p}})
+        e.publish(network=False)
+    t_pub=best(pub,20)
+    s=e.bc.symbols[0]; got=json.loads(e.snap.body)['coins'][s]['price']
+    assert got==e.bc.prices[s],f"stale snapshot: {s} {got} != {e.bc.prices[s]}"
+    return dict(case='engine_state',universe=universe,state_ms=round(t_state*1e3,3),
+                json_ms=round(t_json*1e3,3),publish_ms=round(t_pub*1e3,3),bytes=len(e.snap.body))
+
+def bench_http_status(universe=200,requests=500):
+    tb.engine_g=make_engine(universe); tb.engine_g.publish(network=False)
+    srv=tb.DashServer(('127.0.0.1',0),tb.H)
+    threading.Thread(target=srv.serve_forever,daemon=True).start()
+    try:
+        c=http.client.HTTPConnection('127.0.0.1',srv.server_address[1])
+        def get(hdr):
+            c.request('GET','/api/status',headers=hdr); r=c.getresponse(); r.read(); return r
+        etag=get({}).getheader('ETag')
+        full=best(lambda:get({'Accept-Encoding':'gzip'}),requests)
+        cond=best(lambda:get({'Accept-Encoding':'gzip','If-None-Match':etag}),requests)
+        c.close()
+    finally:
+        srv.shutdown(); srv.server_close(); tb.engine_g=None
+    return dict(case='http_status',universe=universe,status_rps=round(1/full),status_304_rps=round(1/cond),
+                status_us=round(full*1e6,1))
+
+CASES={'ta_stream':bench_ta_stream,'ta_batch':bench_ta_batch,'ta_funcs':bench_ta_funcs,
+       'agent_analyze':bench_agent_analyze,'parity':bench_parity,'agent_update':bench_agent_update,'triggers':bench_triggers,'archive':bench_archive,
+       'engine_state':bench_engine_state,'http_status':bench_http_status}
+
+# ── REGRESSION GATE ──────────────────────────────────────────
+def direction(key):
+    # +1: higher is better, -1: lower is better, 0: informational
+    if key.endswith(('_us','_ms')): return -1
+    if key.endswith('_rps') or key=='speedup': return 1
+    return 0
+
+# single-pass timings (file writes, index builds) are not interleaved with the reference and
+# swing with the host: reported against the baseline, never fail the gate
+ADVISORY={'triggers.build_ms','archive.build_ms','archive.append_us','parity.score_us'}
+
+def check(results,base,tol,ref_us):
+    # -> (failures, advisory notes). Timings compare in units of each run's reference time,
+    # ratios (speedup) as they are, so the baseline carries over between machines
+    fails=[]; notes=[]
+    scale=base.get('_meta',{}).get('ref_us',0)/ref_us
+    for name,r in results.items():
+        b=base.get(name)
+        if not b: continue
+        for k,v in r.items():
+            d=direction(k); old=b.get(k)
+            if not d or not isinstance(old,(int,float)) or not old or not v: continue
+            if k!='speedup':
+                if not scale: continue       # baseline from before normalization: re-save it
+                v=v*scale if d<0 else v/scale
+            ratio=v/old if d<0 else old/v
+            if ratio>1+tol:
+                msg=f"{name}.{k}: {old} -> {v:.4g}{'' if k=='speedup' else ' normalized'} ({(ratio-1)*100:.0f}% worse)"
+                (notes if f"{name}.{k}" in ADVISORY else fails).append(msg)
+        if r.get('max_rel_err',0)>max(b.get('max_rel_err',0)*10,1e-9):
+            fails.append(f"{name}.max_rel_err: {b['max_rel_err']} -> {r['max_rel_err']}")
+    return fails,notes
+
+def main():
+    ap=argparse.ArgumentParser(description=__doc__)
+    ap.add_argument('cases',nargs='*',default=list(CASES))
+    ap.add_argument('--universe',type=int,default=200)
+    ap.add_argument('--json',action='store_true',help="print results as one JSON document")
+    ap.add_argument('--save',action='store_true',help=f"write results as the new baseline ({os.path.basename(BASELINE)})")
+    ap.add_argument('--check',action='store_true',help="fail if any normalized timing regressed past --tolerance")
+    # normalized timings stayed within ~35% of a fresh baseline over repeated runs on a shared host
+    ap.add_argument('--tolerance',type=float,default=0.5,help="allowed normalized slowdown vs baseline (0.5 = 50%%)")
+    ap.add_argument('--baseline',default=BASELINE)
+    a=ap.parse_args()
+    results={}
+    for name in a.cases:
+        r=CASES[name](universe=a.universe)
+        results[name]=r
+        if not a.json: print('  '.join(f"{k}={v}" for k,v in r.items()))
+    if a.json: print(json.dumps(results,indent=1))
+    ref_us=ref_time()*1e6
+    if a.save:
+        meta=dict(python=platform.python_version(),machine=platform.machine(),cpus=os.cpu_count(),
+                  numpy=np.__version__,ts=time.strftime('%Y-%m-%d'),ref_us=round(ref_us,4))
+        with open(a.baseline,'w') as f: json.dump(dict(_meta=meta,**results),f,indent=1)
+        print(f"baseline -> {a.baseline}",file=sys.stderr)
+    if a.check:
+        with open(a.baseline) as f: base=json.load(f)
+        if not base.get('_meta',{}).get('ref_us'):
+            sys.exit(f"{a.baseline} has no reference time; re-create it with --save")
+        fails,notes=check(results,base,a.tolerance,ref_us)
+        if fails:
+            # a burst from a neighbour can outlast every round of a case: a regression has to
+            # show up again in a fresh run of the same case
+            again={m.split('.',1)[0] for m in fails}
+            print(f"re-running {', '.join(sorted(again))} to confirm",file=sys.stderr)
+            fails,_=check({n:CASES[n](universe=a.universe) for n in again},base,a.tolerance,ref_us)
+        for m in notes: print(f"note (advisory) {m}",file=sys.stderr)
+        for m in fails: print(f"REGRESSION {m}",file=sys.stderr)
+        if fails: sys.exit(1)
+        print(f"ok: within {a.tolerance*100:.0f}% of baseline (normalized)",file=sys.stderr)
+
+if __name__=='__main__':
+    main()
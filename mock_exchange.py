@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+"""Local stand-in for Binance Futures — offline testing and load runs of trading_bot"""
+
+import argparse, hashlib, hmac, json, math, os, queue, random, socket, threading, time, zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+from trading_bot import WSConn, INTERVAL_MS, WeightLimiter
+
+BASE_SYMS=['BTCUSDT','ETHUSDT','BNBUSDT','SOLUSDT','XRPUSDT','ADAUSDT','DOGEUSDT',
+           'DOTUSDT','AVAXUSDT','LINKUSDT','LTCUSDT','BCHUSDT','ATOMUSDT','NEARUSDT']
+
+# ── SYNTHETIC MARKET ─────────────────────────────────────────
+class Market:
+    def __init__(self,n=50,seed=1,vol=0.002):
+        self.rnd=random.Random(seed)
+        self.vol=vol
+        self.symbols=(BASE_SYMS+[f"SYN{i:03d}USDT" for i in range(max(0,n-len(BASE_SYMS)))])[:n]
+        self.lk=threading.Lock()
+        self.px={}; self.open={}; self.high={}; self.low={}; self.volume={}
+        for s in self.symbols:
+            p=round(10**self.rnd.uniform(-1,4.5),4)
+            self.px[s]=self.open[s]=self.high[s]=self.low[s]=p
+            self.volume[s]=0.0
+        # lot/tick sizes scale with the starting price, roughly like the real listings
+        self.rules={}
+        for s,p in self.px.items():
+            mag=int(math.floor(math.log10(p)))
+            pp=max(1,min(6,4-mag)); qp=max(0,min(3,3-mag))
+            self.rules[s]=dict(price_prec=pp,qty_prec=qp,tick=10**-pp,step=10**-qp,
+                               max_lev=125 if s in BASE_SYMS[:2] else 50 if s in BASE_SYMS else 20)
+
+    def step(self):
+        with self.lk:
+            for s in self.symbols:
+                p=self.px[s]*math.exp(self.rnd.gauss(0,self.vol))
+                self.px[s]=p
+                self.high[s]=max(self.high[s],p); self.low[s]=min(self.low[s],p)
+                self.volume[s]+=self.rnd.uniform(1,100)
+
+    def price(self,s):
+        with self.lk: return self.px[s]
+
+    def exchange_info(self):
+        out=[]
+        for s in self.symbols:
+            r=self.rules[s]; tick=f"{r['tick']:.{r['price_prec']}f}"; step=f"{r['step']:.{r['qty_prec']}f}"
+            out.append({'symbol':s,'contractType':'PERPETUAL','status':'TRADING',
+                        'quantityPrecision':r['qty_prec'],'pricePrecision':r['price_prec'],
+                        'filters':[{'filterType':'PRICE_FILTER','tickSize':tick},
+                                   {'filterType':'LOT_SIZE','stepSize':step,'minQty':step,'maxQty':'1000000'},
+                                   {'filterType':'MARKET_LOT_SIZE','stepSize':step,'minQty':step,'maxQty':'100000'},
+                                   {'filterType':'MIN_NOTIONAL','notional':'5'}]})
+        return {'timezone':'UTC','serverTime':int(time.time()*1000),'symbols':out}
+
+    def kline(self,s,t,step):
+        # deterministic history: the same (symbol, open time) always yields the same candle
+        r=random.Random(zlib.crc32(f"{s}{t}".encode()))
+        base=self.px[s]; ph=zlib.crc32(s.encode())%1000
+        f=lambda x:base*math.exp(0.05*math.sin(x/86_400_000*2+ph)+0.01*math.sin(x/3_600_000+ph))
+        o=f(t); c=f(t+step)*math.exp(r.gauss(0,self.vol))
+        h=max(o,c)*(1+abs(r.gauss(0,self.vol))); l=min(o,c)*(1-abs(r.gauss(0,self.vol)))
+        return [t,f"{o:.6f}",f"{h:.6f}",f"{l:.6f}",f"{c:.6f}",f"{r.uniform(10,1000):.3f}",t+step-1]
+
+    def klines(self,s,interval,start=None,end=None,limit=500):
+        step=INTERVAL_MS[interval]; now=int(time.time()*1000)
+        end=min(end or now,now); limit=min(int(limit),1500)
+        t=(start+step-1)//step*step if start else (end//step-limit+1)*step
+        out=[]
+        while t<=end and len(out)<limit:
+            out.append(self.kline(s,t,step)); t+=step
+        return out
+
+    def mark_arr(self):
+        now=int(time.time()*1000)
+        with self.lk:
+            return [{'e':'markPriceUpdate','E':now,'s':s,'p':f"{p:.6f}"} for s,p in self.px.items()]
+
+    def mini_arr(self):
+        now=int(time.time()*1000)
+        with self.lk:
+            return [{'e':'24hrMiniTicker','E':now,'s':s,'c':f"{self.px[s]:.6f}",'o':f"{self.open[s]:.6f}",
+                     'h':f"{self.high[s]:.6f}",'l':f"{self.low[s]:.6f}",'v':f"{self.volume[s]:.3f}",
+                     'q':f"{self.volume[s]*self.px[s]:.3f}"} for s in self.symbols]
+
+# ── ACCOUNT ──────────────────────────────────────────────────
+class ApiError(Exception):
+    def __init__(self,status,code,msg):
+        super().__init__(msg); self.status=status; self.code=code
+
+class Account:
+    # one-way mode, cross margin; market orders fill in full at the current price
+    COND={'TAKE_PROFIT_MARKET','STOP_MARKET'}
+    def __init__(self,key,secret,balance=10_000.0,fee=0.0004):
+        self.key=key; self.secret=secret
+        self.wallet=balance; self.fee=fee
+        self.pos={}            # sym -> (signed qty, entry)
+        self.lev={}
+        self.oid=0
+        self.open={}           # resting conditional orders by id
+        self.ts={}; self.wts=0  # last change per position / of the wallet, ms
+        self.subs=[]           # user-data stream queues
+        self.lk=threading.Lock()
+
+    def set_leverage(self,mkt,sym,lev):
+        if sym not in mkt.px: raise ApiError(400,-1121,"Invalid symbol.")
+        if not 1<=lev<=mkt.rules[sym]['max_lev']: raise ApiError(400,-4028,f"Leverage {lev} is not valid")
+        with self.lk: self.lev[sym]=lev
+        return {'symbol':sym,'leverage':lev,'maxNotionalValue':'1000000'}
+
+    def order(self,mkt,q):
+        sym,side,typ=q.get('symbol'),q.get('side'),q.get('type')
+        if sym not in mkt.px: raise ApiError(400,-1121,"Invalid symbol.")
+        if side not in ('BUY','SELL'): raise ApiError(400,-1117,"Invalid side.")
+        if typ!='MARKET' and typ not in self.COND: raise ApiError(400,-1116,"Invalid orderType.")
+        r=mkt.rules[sym]; qty=float(q.get('quantity',0))
+        if qty<=0 or abs(round(qty/r['step'])*r['step']-qty)>r['step']*1e-6:
+            raise ApiError(400,-1111,"Precision is over the maximum defined for this asset.")
+        return self._park(mkt,q) if typ in self.COND else self._fill(mkt,q)
+
+    def _park(self,mkt,q):
+        # conditional orders rest until the price crosses stopPrice, then fill as market orders
+        sym,side=q['symbol'],q['side']
+        try: stop=float(q.get('stopPrice',0))
+        except ValueError: stop=0
+        if stop<=0: raise ApiError(400,-1102,"Mandatory parameter 'stopPrice' was not sent, was empty/null, or malformed.")
+        if self._hit(q['type'],side,stop,mkt.price(sym)): raise ApiError(400,-2021,"Order would immediately trigger.")
+        with self.lk:
+            self.oid+=1; oid=self.oid
+            self.open[oid]=dict(q,orderId=oid)
+        return self._resting(self.open[oid],'NEW')
+
+    def _resting(self,o,status):
+        return {'orderId':o['orderId'],'symbol':o['symbol'],'status':status,'clientOrderId':f"mock{o['orderId']}",
+                'price':'0','avgPrice':'0.00000','origQty':o['quantity'],'executedQty':'0','cumQuote':'0',
+                'stopPrice':o['stopPrice'],'reduceOnly':o.get('reduceOnly')=='true','side':o['side'],'type':o['type'],
+                'positionSide':'BOTH','workingType':o.get('workingType','CONTRACT_PRICE'),'updateTime':int(time.time()*1000)}
+
+    @staticmethod
+    def _hit(typ,side,stop,px):
+        # a SELL take-profit fires at or above its stop, a SELL stop at or below; BUY mirrors that
+        return px>=stop if (typ=='TAKE_PROFIT_MARKET')==(side=='SELL') else px<=stop
+
+    def trigger(self,mkt):
+        # after every market step; the mock's mark and last price are the same number
+        with self.lk:
+            fire=[o for o in self.open.values() if self._hit(o['type'],o['side'],float(o['stopPrice']),mkt.price(o['symbol']))]
+        for o in fire:
+            with self.lk:
+                if self.open.pop(o['orderId'],None) is None: continue      # cancelled meanwhile
+            try: self._fill(mkt,o,o['orderId'])
+            except ApiError:
+                # reduce-only with nothing left to reduce
+                now=int(time.time()*1000)
+                self._emit({'e':'ORDER_TRADE_UPDATE','E':now,'T':now,'o':{'s':o['symbol'],'c':f"mock{o['orderId']}",
+                            'S':o['side'],'o':o['type'],'q':o['quantity'],'ap':'0','x':'EXPIRED','X':'EXPIRED',
+                            'i':o['orderId'],'l':'0','z':'0','L':'0','T':now,'R':True,'ps':'BOTH','rp':'0'}})
+
+    def cancel(self,sym,oid=None):
+        with self.lk:
+            ids=[i for i,o in self.open.items() if o['symbol']==sym and oid in (None,i)]
+            out=[self.open.pop(i) for i in ids]
+        if oid is not None and not out: raise ApiError(400,-2011,"Unknown order sent.")
+        return out
+
+    def open_orders(self,sym=None):
+        with self.lk: return [self._resting(o,'NEW') for o in self.open.values() if sym in (None,o['symbol'])]
+
+    def _fill(self,mkt,q,oid=None):
+        sym,side=q['symbol'],q['side']
+        r=mkt.rules[sym]; qty=float(q['quantity'])
+        px=mkt.price(sym); dq=qty if side=='BUY' else -qty
+        with self.lk:
+            amt,entry=self.pos.get(sym,(0.0,0.0)); rp=0.0
+            if q.get('reduceOnly')=='true':
+                if amt==0 or (amt>0)==(dq>0): raise ApiError(400,-2022,"ReduceOnly Order is rejected.")
+                dq=math.copysign(min(abs(dq),abs(amt)),dq)
+            elif qty*px<5: raise ApiError(400,-4164,"Order's notional must be no smaller than 5")
+            if amt==0 or (amt>0)==(dq>0):
+                entry=(abs(amt)*entry+abs(dq)*px)/(abs(amt)+abs(dq)); amt+=dq
+            else:
+                c=min(abs(dq),abs(amt))
+                rp=(px-entry)*c*(1 if amt>0 else -1); self.wallet+=rp
+                amt+=dq
+                if abs(amt)<1e-12: amt=0.0
+                elif (amt>0)==(dq>0): entry=px          # flipped through zero
+            self.wallet-=abs(dq)*px*self.fee
+            if amt: self.pos[sym]=(amt,entry)
+            else: self.pos.pop(sym,None)
+            if oid is None: self.oid+=1; oid=self.oid
+            now=int(time.time()*1000); self.ts[sym]=self.wts=now
+            self._emit({'e':'ACCOUNT_UPDATE','E':now,'T':now,'a':{'m':'ORDER',
+                         'B':[{'a':'USDT','wb':f"{self.wallet:.8f}",'cw':f"{self.wallet:.8f}",'bc':'0'}],
+                         'P':[{'s':sym,'pa':f"{amt:.6f}",'ep':f"{entry:.6f}",'up':f"{(px-entry)*amt:.6f}",
+                               'mt':'cross','ps':'BOTH'}]}},
+                       {'e':'ORDER_TRADE_UPDATE','E':now,'T':now,'o':{
+                         's':sym,'c':f"mock{oid}",'S':side,'o':q['type'],'q':q['quantity'],'p':'0','ap':f"{px:.6f}",
+                         'x':'TRADE','X':'FILLED','i':oid,'l':f"{abs(dq):.6f}",'z':f"{abs(dq):.6f}",'L':f"{px:.6f}",
+                         'n':f"{abs(dq)*px*self.fee:.8f}",'N':'USDT','T':now,'R':q.get('reduceOnly')=='true',
+                         'ps':'BOTH','rp':f"{rp:.8f}"}})
+        done=q.get('newOrderRespType')=='RESULT'
+        return {'orderId':oid,'symbol':sym,'status':'FILLED' if done else 'NEW','clientOrderId':f"mock{oid}",
+                'price':'0','avgPrice':f"{px:.{r['price_prec']}f}" if done else '0.00000',
+                'origQty':q['quantity'],'executedQty':f"{abs(dq):.{r['qty_prec']}f}" if done else '0',
+                'cumQuote':f"{abs(dq)*px:.4f}" if done else '0','reduceOnly':q.get('reduceOnly')=='true',
+                'side':side,'type':q['type'],'positionSide':'BOTH','updateTime':now}
+
+    def _emit(self,*events):
+        for sq in list(self.subs):
+            for e in events: sq.put(e)
+
+    def positions(self,mkt,sym=None):
+        with self.lk: pos=dict(self.pos); lev=dict(self.lev)
+        out=[]
+        for s in ([sym] if sym else mkt.symbols):
+            amt,entry=pos.get(s,(0.0,0.0)); mark=mkt.price(s)
+            out.append({'symbol':s,'positionAmt':f"{amt:.6f}",'entryPrice':f"{entry:.6f}",'markPrice':f"{mark:.6f}",
+                        'unRealizedProfit':f"{(mark-entry)*amt:.6f}",'leverage':str(lev.get(s,20)),
+                        'marginType':'cross','positionSide':'BOTH','notional':f"{mark*amt:.6f}"})
+        return out
+
+    def account(self,mkt):
+        with self.lk: pos=dict(self.pos); lev=dict(self.lev); wallet=self.wallet; ts=dict(self.ts); wts=self.wts
+        unreal=sum((mkt.price(s)-e)*a for s,(a,e) in pos.items())
+        im=sum(abs(a)*mkt.price(s)/lev.get(s,20) for s,(a,e) in pos.items())
+        return {'totalWalletBalance':f"{wallet:.8f}",'totalUnrealizedProfit':f"{unreal:.8f}",
+                'totalMarginBalance':f"{wallet+unreal:.8f}",'totalInitialMargin':f"{im:.8f}",
+                'availableBalance':f"{wallet+unreal-im:.8f}",
+                'assets':[{'asset':'USDT','walletBalance':f"{wallet:.8f}",'updateTime':wts}],
+                'positions':[{'symbol':s,'positionAmt':f"{pos.get(s,(0,0))[0]:.6f}",'entryPrice':f"{pos.get(s,(0,0))[1]:.6f}",
+                              'unrealizedProfit':f"{(mkt.price(s)-pos[s][1])*pos[s][0] if s in pos else 0:.6f}",
+                              'leverage':str(lev.get(s,20)),'updateTime':t} for s,t in ts.items()]}
+
+# ── SERVER ───────────────────────────────────────────────────
+class Handler(BaseHTTPRequestHandler):
+    protocol_version='HTTP/1.1'
+    SIGNED={'/fapi/v2/account','/fapi/v2/positionRisk','/fapi/v1/leverageBracket',
+            '/fapi/v1/leverage','/fapi/v1/order','/fapi/v1/batchOrders','/fapi/v1/allOpenOrders',
+            '/fapi/v1/openOrders'}
+    KEYED={'/fapi/v1/listenKey'}     # API key header, no signature
+
+    def setup(self):
+        super().setup()
+        # as in trading_bot.H: headers and body are separate writes, Nagle would add ~40ms
+        self.connection.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+
+    def do_GET(self):
+        if self.path.startswith('/stream'):
+            return self._market_stream()
+        if self.path.startswith('/ws/'):
+            return self._user_stream(self.path[4:])
+        self._api('GET')
+
+    def do_POST(self): self._api('POST')
+    def do_PUT(self): self._api('PUT')
+    def do_DELETE(self): self._api('DELETE')
+
+    def _api(self,method):
+        srv=self.server; u=urlsplit(self.path)
+        n=int(self.headers.get('Content-Length') or 0)
+        body=self.rfile.read(n).decode() if n else ''
+        raw=u.query+('&' if u.query and body else '')+body       # Binance signs query + body
+        q=dict(parse_qsl(raw,keep_blank_values=True))
+        h=getattr(self,f"_{method.lower()}_{u.path.rsplit('/',1)[-1]}",None)
+        if not u.path.startswith('/fapi/') or h is None: return self._json({'code':-5000,'msg':'Path not found'},404)
+        if srv.latency: time.sleep(max(0,srv.rnd.gauss(srv.latency,srv.latency/4))/1000)
+        used=srv.charge(srv.weights.weight(u.path,q),u.path=='/fapi/v1/order' and method=='POST')
+        hdr={'X-MBX-USED-WEIGHT-1M':str(used[0])}
+        if u.path=='/fapi/v1/order': hdr.update({'X-MBX-ORDER-COUNT-10S':str(used[1]),'X-MBX-ORDER-COUNT-1M':str(used[2])})
+        try:
+            if used[0]>srv.weight_limit:
+                hdr['Retry-After']=str(60-int(time.time())%60)
+                raise ApiError(429,-1003,"Too many requests; current limit of IP is exceeded.")
+            if srv.error_rate and srv.rnd.random()<srv.error_rate:
+                raise ApiError(503,-1001,"Internal error; unable to process your request. Please try again.")
+            acc=self._auth(raw,q) if u.path in self.SIGNED else self._key() if u.path in self.KEYED else None
+            self._json(h(q,acc),headers=hdr)
+        except ApiError as e:
+            srv.errors+=1
+            self._json({'code':e.code,'msg':str(e)},e.status,hdr)
+
+    def _key(self):
+        acc=self.server.accounts.get(self.headers.get('X-MBX-APIKEY',''))
+        if not acc: raise ApiError(401,-2015,"Invalid API-key, IP, or permissions for action.")
+        return acc
+
+    def _auth(self,raw,q):
+        acc=self._key()
+        payload,_,sig=raw.rpartition('&signature=')
+        good=hmac.new(acc.secret.encode(),payload.encode(),hashlib.sha256).hexdigest()
+        if not sig or not hmac.compare_digest(sig,good):
+            raise ApiError(400,-1022,"Signature for this request is not valid.")
+        ts=int(q.get('timestamp',0)); now=time.time()*1000
+        if ts-now>1000 or now-ts>int(q.get('recvWindow',5000)):
+            raise ApiError(400,-1021,"Timestamp for this request is outside of the recvWindow.")
+        return acc
+
+    # public
+    def _get_exchangeInfo(self,q,acc): return self.server.market.exchange_info()
+
+    def _get_price(self,q,acc):
+        m=self.server.market; now=int(time.time()*1000)
+        with m.lk: return [{'symbol':s,'price':f"{p:.6f}",'time':now} for s,p in m.px.items()]
+
+    def _get_24hr(self,q,acc):
+        return [{'symbol':x['s'],'lastPrice':x['c'],'openPrice':x['o'],'highPrice':x['h'],
+                 'lowPrice':x['l'],'volume':x['v'],'quoteVolume':x['q'],
+                 'priceChangePercent':f"{(float(x['c'])/float(x['o'])-1)*100:.3f}"} for x in self.server.market.mini_arr()]
+
+    def _get_klines(self,q,acc):
+        m=self.server.market
+        if q.get('symbol') not in m.px: raise ApiError(400,-1121,"Invalid symbol.")
+        return m.klines(q['symbol'],q.get('interval','5m'),
+                        int(q['startTime']) if 'startTime' in q else None,
+                        int(q['endTime']) if 'endTime' in q else None,q.get('limit',500))
+
+    # signed
+    def _get_account(self,q,acc): return acc.account(self.server.market)
+
+    def _get_positionRisk(self,q,acc): return acc.positions(self.server.market,q.get('symbol'))
+
+    def _get_leverageBracket(self,q,acc):
+        m=self.server.market
+        return [{'symbol':s,'brackets':[{'bracket':1,'initialLeverage':m.rules[s]['max_lev'],
+                 'notionalCap':50000,'notionalFloor':0,'maintMarginRatio':0.004}]} for s in m.symbols]
+
+    def _post_leverage(self,q,acc):
+        return acc.set_leverage(self.server.market,q.get('symbol'),int(q.get('leverage',0)))
+
+    def _post_order(self,q,acc):
+        self.server.orders+=1
+        return acc.order(self.server.market,q)
+
+    def _post_batchOrders(self,q,acc):
+        try: orders=json.loads(q.get('batchOrders','[]'))
+        except ValueError: raise ApiError(400,-1130,"Data sent for parameter 'batchOrders' is not valid.")
+        if not 1<=len(orders)<=5: raise ApiError(400,-1130,"batchOrders takes 1 to 5 orders.")
+        out=[]
+        for o in orders:
+            self.server.orders+=1
+            try: out.append(acc.order(self.server.market,{k:str(v) for k,v in o.items()}))
+            except ApiError as e: out.append({'code':e.code,'msg':str(e)})
+        return out
+
+    def _delete_order(self,q,acc):
+        o=acc.cancel(q.get('symbol'),int(q.get('orderId',0)))[0]
+        return acc._resting(o,'CANCELED')
+
+    def _delete_allOpenOrders(self,q,acc):
+        acc.cancel(q.get('symbol'))
+        return {'code':200,'msg':"The operation of cancel all open order is done."}
+
+    def _get_openOrders(self,q,acc): return acc.open_orders(q.get('symbol'))
+
+    # user data stream
+    def _post_listenKey(self,q,acc): return {'listenKey':self.server.listen_key(acc)}
+
+    def _put_listenKey(self,q,acc):
+        if not self.server.listen_key(acc,create=False): raise ApiError(400,-1125,"This listenKey does not exist.")
+        return {}
+
+    def _delete_listenKey(self,q,acc):
+        self.server.drop_listen_keys(acc); return {}
+
+    def _json(self,obj,code=200,headers=None):
+        b=json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header('Content-Type','application/json')
+        self.send_header('Content-Length',str(len(b)))
+        for k,v in (headers or {}).items(): self.send_header(k,v)
+        self.end_headers(); self.wfile.write(b)
+
+    def _market_stream(self):
+        ws=WSConn.accept(self)
+        if not ws: return
+        srv=self.server; n=0
+        try:
+            while not srv.stopped:
+                ws.send(json.dumps({'stream':'!markPrice@arr@1s','data':srv.market.mark_arr()}))
+                if n%3==0: ws.send(json.dumps({'stream':'!miniTicker@arr','data':srv.market.mini_arr()}))
+                n+=1
+                time.sleep(srv.interval)
+        except OSError: pass
+        finally: ws.close()
+
+    def _user_stream(self,key):
+        srv=self.server; ent=srv.listen.get(key)
+        if not ent or ent[1]<time.time():
+            return self._json({'code':-1125,'msg':"This listenKey does not exist."},400)
+        ws=WSConn.accept(self)
+        if not ws: return
+        acc=ent[0]; sq=queue.SimpleQueue(); acc.subs.append(sq); ping=time.time()
+        try:
+            while not srv.stopped:
+                try: ws.send(json.dumps(sq.get(timeout=1)))
+                except queue.Empty: pass
+                now=time.time()
+                if srv.listen.get(key,(0,0))[1]<now:
+                    ws.send(json.dumps({'e':'listenKeyExpired','E':int(now*1000),'listenKey':key})); break
+                if now-ping>=srv.ping: ws.send(b'',9); ping=now
+        except OSError: pass
+        finally:
+            acc.subs.remove(sq); ws.close()
+
+    def log_message(self,*a): pass
+
+class MockExchange(ThreadingHTTPServer):
+    daemon_threads=True
+    def __init__(self,addr=('127.0.0.1',0),market=None,interval=0.25,latency=0.0,error_rate=0.0,
+                 weight_limit=2400,seed=1,key='mock',secret='mock',balance=10_000.0,listen_ttl=3600,ping=30):
+        super().__init__(addr,Handler)
+        self.market=market or Market()
+        self.interval=interval
+        self.latency=latency              # mean injected delay per REST call, ms
+        self.error_rate=error_rate        # fraction of REST calls answered with a 503
+        self.weight_limit=weight_limit
+        self.weights=WeightLimiter()      # only for its request-weight table
+        self.rnd=random.Random(seed)
+        self.accounts={key:Account(key,secret,balance)}
+        self.listen={}                    # listenKey -> [account, expiry]
+        self.listen_ttl=listen_ttl; self.ping=ping
+        self.requests=0; self.orders=0; self.errors=0
+        self._lk=threading.Lock(); self._win=0; self._used=0; self._ots=[]
+        self.stopped=False
+
+    def charge(self,w,order=False):
+        # -> (weight used this minute, orders in 10s, orders in 1m), as the real headers report
+        now=time.time()
+        with self._lk:
+            self.requests+=1
+            if int(now//60)!=self._win: self._win=int(now//60); self._used=0
+            self._used+=w
+            if order: self._ots.append(now)
+            self._ots=[t for t in self._ots if now-t<60]
+            return self._used,sum(1 for t in self._ots if now-t<10),len(self._ots)
+
+    def listen_key(self,acc,create=True):
+        # one live key per account; POST and PUT both push its expiry out
+        now=time.time()
+        with self._lk:
+            k=next((k for k,(a,exp) in self.listen.items() if a is acc and exp>now),None)
+            if k is None:
+                if not create: return None
+                k=os.urandom(32).hex()
+            self.listen[k]=[acc,now+self.listen_ttl]
+            return k
+
+    def drop_listen_keys(self,acc):
+        with self._lk:
+            for k in [k for k,(a,_) in self.listen.items() if a is acc]: del self.listen[k]
+
+    @property
+    def url(self): return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @property
+    def ws_url(self): return f"ws://127.0.0.1:{self.server_address[1]}"
+
+    def _tick(self):
+        while not self.stopped:
+            self.market.step()
+            for acc in self.accounts.values(): acc.trigger(self.market)
+            time.sleep(self.interval)
+
+    def start(self):
+        threading.Thread(target=self._tick,daemon=True).start()
+        threading.Thread(target=self.serve_forever,daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopped=True
+        self.shutdown(); self.server_close()
+
+# ── LOAD RUN ─────────────────────────────────────────────────
+def load(srv,seconds=30,seed=0,key='mock',secret='mock'):
+    # the Engine tick (prices, exits, scan + entries every 5th tick) against the mock without
+    # its sleeps; reports tick latency percentiles, request throughput and per-endpoint latency
+    import trading_bot as tb
+    random.seed(seed)
+    tb.BinanceClient.BASE=srv.url
+    bc=tb.BinanceClient(); bc.set_keys(key,secret)
+    ag=tb.Agent(bc,dict(min_score=1,min_conf=0)); ag.verbose=False    # loose gates: keep orders flowing
+    acc=bc.fetch_account(force=True)
+    ag.balance=ag.start_balance=acc['wallet'] if acc else 1000.0
+    sc=tb.Scanner(ag)
+    ticks=[]; scans=[]; req0=srv.requests; t_end=time.time()+seconds; n=0
+    while time.time()<t_end:
+        t0=time.perf_counter()
+        bc.refresh_prices(); ag.update()
+        if n%5==0:
+            for d in sc.cycle():
+                if len(ag.positions)<ag.p['max_pos']: ag.open(d)
+            scans.append((time.perf_counter()-t0)*1000)
+        else: ticks.append((time.perf_counter()-t0)*1000)
+        n+=1
+    pct=lambda a,q:round(sorted(a)[min(len(a)-1,int(len(a)*q))],1) if a else None
+    return dict(symbols=len(srv.market.symbols),seconds=seconds,ticks=n,
+                tick_p50_ms=pct(ticks,0.5),tick_p95_ms=pct(ticks,0.95),tick_max_ms=pct(ticks,1),
+                scan_p50_ms=pct(scans,0.5),scan_max_ms=pct(scans,1),
+                requests=srv.requests-req0,req_per_s=round((srv.requests-req0)/seconds,1),
+                orders=srv.orders,errors=srv.errors,trades=ag.trades,open=len(ag.positions),
+                acks={k:v for k,v in bc.order_stats().items() if k!='last'},
+                endpoints=bc.http.stats(),limiter=bc.limiter.stats())
+
+def main():
+    ap=argparse.ArgumentParser(description=__doc__)
+    ap.add_argument('--port',type=int,default=9000)
+    ap.add_argument('--symbols',type=int,default=50)
+    ap.add_argument('--interval',type=float,default=0.25)
+    ap.add_argument('--seed',type=int,default=1)
+    ap.add_argument('--latency',type=float,default=0,help="mean injected REST latency, ms")
+    ap.add_argument('--error-rate',type=float,default=0,help="fraction of REST calls failing with 503")
+    ap.add_argument('--weight-limit',type=int,default=2400)
+    ap.add_argument('--key',default='mock')
+    ap.add_argument('--secret',default='mock')
+    ap.add_argument('--load',type=float,metavar='SECONDS',help="drive the bot's tick loop against it and report")
+    a=ap.parse_args()
+    srv=MockExchange(('127.0.0.1',0 if a.load else a.port),Market(a.symbols,a.seed),a.interval,
+                     a.latency,a.error_rate,a.weight_limit,a.seed,a.key,a.secret).start()
+    if a.load:
+        try: print(json.dumps(load(srv,a.load,a.seed,a.key,a.secret),indent=1))
+        finally: srv.stop()
+        return
+    print(f"mock exchange on {srv.url}  (BOT_BASE={srv.url} BOT_WS_BASE={srv.ws_url}, keys {a.key}/{a.secret})")
+    try:
+        while True: time.sleep(1)
+    except KeyboardInterrupt:
+        srv.stop()
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""Parameter sweep — grid or random search over STRATEGY, walk-forward, process pool"""
+
+import argparse, itertools, json, os, random, time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from backtest import Backtest, align, load_archive, load_csv_dir, synthetic, fetch_history
+from trading_bot import BinanceClient, INTERVAL_MS, STRATEGY
+
+# candidate values per parameter; anything not swept keeps its STRATEGY default
+SPACE=dict(
+    rsi_os=(20,25,28),rsi_os_weak=(30,32,35),rsi_ob_weak=(65,68,70),rsi_ob=(72,75,80),
+    min_score=(3,4,5),min_conf=(30,45,55),
+    tp=(0.012,0.018,0.025,0.035),sl=(0.005,0.007,0.01,0.014),trail=(0.0,0.005,0.01),
+    margin=(0.05,0.08,0.12),levs=((2,3,5),(2,),(3,),(5,)),max_pos=(3,6,10))
+
+def valid(p):
+    return p['rsi_os']<p['rsi_os_weak']<p['rsi_ob_weak']<p['rsi_ob']
+
+def grid(keys):
+    for vals in itertools.product(*(SPACE[k] for k in keys)):
+        p=dict(STRATEGY,**dict(zip(keys,vals)))
+        if valid(p): yield p
+
+def sample(keys,n,seed=0):
+    rnd=random.Random(seed); seen=set(); out=[]
+    for _ in range(n*20):
+        p=dict(STRATEGY,**{k:rnd.choice(SPACE[k]) for k in keys})
+        key=json.dumps(p,sort_keys=True)
+        if valid(p) and key not in seen:
+            seen.add(key); out.append(p)
+            if len(out)>=n: break
+    return out
+
+# ── SHARED ARRAYS ────────────────────────────────────────────
+# candles and precomputed indicators live in shared memory once; workers map them
+# read-only, so a sweep of N parameter sets never copies or recomputes them
+def share(arrays):
+    blocks={}; spec={}
+    for k,a in arrays.items():
+        a=np.ascontiguousarray(a)
+        shm=shared_memory.SharedMemory(create=True,size=max(a.nbytes,1))
+        np.ndarray(a.shape,a.dtype,buffer=shm.buf)[...]=a
+        blocks[k]=shm; spec[k]=(shm.name,a.shape,a.dtype.str)
+    return blocks,spec
+
+_W={}
+def _attach(spec,meta):
+    shms={k:shared_memory.SharedMemory(name=n) for k,(n,_,_) in spec.items()}
+    _W['shm']=shms    # keep the mappings alive for the worker's lifetime
+    _W['a']={k:np.ndarray(shape,np.dtype(dt),buffer=shms[k].buf) for k,(_,shape,dt) in spec.items()}
+    _W['meta']=meta
+
+def _run(job):
+    # one backtest over bars [a,b) with params p; all arrays are views into shared memory
+    i,p,a,b=job; A=_W['a']; m=_W['meta']
+    M={k:A['M_'+k][:,a:b] for k in 'ohlcv'}
+    ind={k[4:]:v[:,a:b] for k,v in A.items() if k.startswith('ind_')}
+    bt=Backtest(m['syms'],A['t'][a:b],M,A['live'][:,a:b],m['balance'],m['fee'],m['slip'],
+                seed=m['seed'],params=p)
+    return i,a,b,bt.run(pre=(ind,A['ok'][:,a:b]))['stats']
+
+# ── RANKING ──────────────────────────────────────────────────
+RANK={'ret':('ret_pct',True),'sharpe':('sharpe',True),'dd':('max_dd_pct',False)}
+
+def rank(results,by='all'):
+    # results: [(params, stats)]; 'all' orders by the mean rank across return, drawdown, Sharpe
+    if by!='all':
+        k,hi=RANK[by]
+        return sorted(results,key=lambda r:r[1][k],reverse=hi)
+    pos=np.zeros(len(results))
+    for k,hi in RANK.values():
+        v=np.array([r[1][k] for r in results],dtype=float)
+        pos+=np.argsort(np.argsort(-v if hi else v))
+    return [results[i] for i in np.argsort(pos,kind='stable')]
+
+def folds(T,k,warmup,anchored=False):
+    # walk-forward: k+1 equal blocks; train on the block(s) before each test block
+    edges=np.linspace(warmup,T,k+2).astype(int)
+    return [(int(edges[0] if anchored else edges[i]),int(edges[i+1]),int(edges[i+2])) for i in range(k)]
+
+def cross(params,spans):
+    # every parameter set on every span
+    return [(i,p,a,b) for i,p in enumerate(params) for a,b in spans]
+
+def sweep(ex,jobs,workers):
+    # jobs: [(index, params, a, b)] -> {(index, a, b): stats}
+    out={}
+    for i,a,b,st in ex.map(_run,jobs,chunksize=max(1,len(jobs)//(workers*8))):
+        out[(i,a,b)]=st
+    return out
+
+def show(title,rows,n):
+    print(f"\n{title}")
+    for r,(p,st) in enumerate(rows[:n],1):
+        diff={k:v for k,v in p.items() if v!=STRATEGY[k]}
+        print(f"{r:3d}. ret={st['ret_pct']:7.2f}%  dd={st['max_dd_pct']:6.2f}%  sharpe={st['sharpe']:6.2f}  "
+              f"trades={st['trades']:4d}  {diff or 'defaults'}")
+
+def main():
+    ap=argparse.ArgumentParser(description=__doc__)
+    src=ap.add_mutually_exclusive_group(required=True)
+    src.add_argument('--csv',help="directory of <SYM>_<interval>.csv files")
+    src.add_argument('--archive',help="KlineArchive directory (see backfill.py)")
+    src.add_argument('--fetch',nargs='+',metavar='SYM',help="download these symbols over REST")
+    src.add_argument('--synthetic',type=int,metavar='N',help="N random-walk symbols")
+    ap.add_argument('--interval',default='5m')
+    ap.add_argument('--days',type=float,default=30)
+    ap.add_argument('--base',default=BinanceClient.BASE)
+    ap.add_argument('--vary',nargs='+',default=list(SPACE),choices=list(SPACE),help="parameters to sweep")
+    ap.add_argument('--samples',type=int,default=200,help="random draws from the grid; 0 = full grid")
+    ap.add_argument('--folds',type=int,default=0,help="walk-forward splits (0 = whole period)")
+    ap.add_argument('--anchored',action='store_true',help="walk-forward train windows start at bar 0")
+    ap.add_argument('--rank',default='all',choices=['all',*RANK])
+    ap.add_argument('--workers',type=int,default=os.cpu_count())
+    ap.add_argument('--balance',type=float,default=1000)
+    ap.add_argument('--fee',type=float,default=0.0004)
+    ap.add_argument('--slip',type=float,default=0.0002)
+    ap.add_argument('--seed',type=int,default=0)
+    ap.add_argument('--top',type=int,default=10)
+    ap.add_argument('--out',help="write the best parameter set here (JSON, usable as BOT_PARAMS)")
+    a=ap.parse_args()
+
+    t0=time.perf_counter()
+    bars=int(a.days*86_400_000/INTERVAL_MS[a.interval])
+    end=int(time.time()*1000); start=end-bars*INTERVAL_MS[a.interval]
+    if a.csv: series=load_csv_dir(a.csv,a.interval)
+    elif a.archive: series=load_archive(a.archive,a.interval,start)
+    elif a.synthetic: series=synthetic(a.synthetic,bars,a.interval,a.seed)
+    else: series={s:fetch_history(s,a.interval,start,end,a.base) for s in a.fetch}
+    syms,t,M,live=align(series,a.interval)
+    bt=Backtest(syms,t,M,live)
+    ind,ok=bt.precompute()
+    print(f"{len(syms)} symbols x {len(t)} bars, indicators in {time.perf_counter()-t0:.1f}s")
+
+    params=list(grid(a.vary)) if a.samples==0 else sample(a.vary,a.samples,a.seed)
+    blocks,spec=share(dict(t=t,live=live,ok=ok,**{'M_'+k:v for k,v in M.items()},
+                           **{'ind_'+k:v for k,v in ind.items()}))
+    del ind,ok
+    meta=dict(syms=syms,balance=a.balance,fee=a.fee,slip=a.slip,seed=a.seed)
+    best=None
+    try:
+        with ProcessPoolExecutor(a.workers,initializer=_attach,initargs=(spec,meta)) as ex:
+            t1=time.perf_counter()
+            if not a.folds:
+                res=sweep(ex,cross(params,[(0,len(t))]),a.workers)
+                ranked=rank([(p,res[(i,0,len(t))]) for i,p in enumerate(params)],a.rank)
+                show(f"{len(params)} parameter sets in {time.perf_counter()-t1:.1f}s",ranked,a.top)
+                best=ranked[0][0]
+            else:
+                F=folds(len(t),a.folds,bt.warmup,a.anchored)
+                res=sweep(ex,cross(params,[(s,m) for s,m,_ in F]),a.workers)
+                picks=[]
+                for s,m,e in F:
+                    picks.append(rank([(p,res[(i,s,m)]) for i,p in enumerate(params)],a.rank)[0][0])
+                # each fold's pick on its own test span, the defaults on every one: 2k backtests
+                D=len(picks)
+                oos=sweep(ex,[(f,p,m,e) for f,(p,(_,m,e)) in enumerate(zip(picks,F))]+
+                             [(D,dict(STRATEGY),m,e) for _,m,e in F],a.workers)
+                print(f"{len(params)} parameter sets x {len(F)} folds in {time.perf_counter()-t1:.1f}s")
+                for f,((s,m,e),p) in enumerate(zip(F,picks)):
+                    st=oos[(f,m,e)]; d=oos[(D,m,e)]
+                    print(f"fold {f+1}: train [{s},{m}) test [{m},{e})  out-of-sample ret={st['ret_pct']}% "
+                          f"dd={st['max_dd_pct']}% sharpe={st['sharpe']}  (defaults ret={d['ret_pct']}%)")
+                # overall: the parameter set with the best mean in-sample rank across folds
+                score={i:0 for i in range(len(params))}
+                for s,m,_ in F:
+                    for r,(p,_) in enumerate(rank([(i,res[(i,s,m)]) for i in range(len(params))],a.rank)):
+                        score[p]+=r
+                order=sorted(score,key=score.get)
+                show("most stable across folds (last train window shown)",
+                     [(params[i],res[(i,F[-1][0],F[-1][1])]) for i in order],a.top)
+                best=params[order[0]]
+    finally:
+        for shm in blocks.values(): shm.close(); shm.unlink()
+    if a.out and best:
+        with open(a.out,'w') as f: json.dump(best,f,indent=1)
+        print(f"\nbest -> {a.out}")
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Live exit bookkeeping against a stub client: every counted leg must come back exactly once"""
+
+import time
+import trading_bot as tb
+
+class StubClient:
+    # the slice of BinanceClient the Agent/Executor exit path touches
+    api_key='k'; book=None; bus=None
+    def __init__(self,qty=None,batch=None,raises=()):
+        self.symbols=[]; self.prices={}; self.ticker={}
+        self.qty=qty or {}           # sym -> exchange size (None: unreadable)
+        self.batch=batch or {}       # sym -> close result; missing legs fill
+        self.raises=set(raises)      # calls that blow up: 'qty', 'batch', 'cancel'
+        self.sent=[]; self.cancelled=[]
+    def price(self,s): return 1.0
+    def fetch_live_pnl(self): return {}
+    def fetch_account(self,force=False): return {'wallet':990.0}
+    def get_pos_qty(self,s):
+        if 'qty' in self.raises: raise ConnectionError('pos down')
+        return self.qty.get(s)
+    def close_batch(self,legs,t0=None):
+        if 'batch' in self.raises: raise ConnectionError('batch down')
+        self.sent.append([s for s,_,_ in legs])
+        return [self.batch.get(s,{'orderId':1,'avgPrice':'1.0'}) for s,_,_ in legs]
+    def cancel_all(self,s):
+        if 'cancel' in self.raises: raise ConnectionError('cancel down')
+        self.cancelled.append(s); return True
+
+class StubBook:
+    # AccountBook after a snapshot: fills arrive off the user stream
+    synced=True; epoch=0
+    def __init__(self): self.fills=[]
+    def since(self,n): return [f for f in self.fills if f['n']>n],len(self.fills)
+    def holds(self,s): return True
+    def fill(self,sym,oid,avg):
+        self.fills.append(dict(n=len(self.fills)+1,sym=sym,id=oid,status='FILLED',avg=avg))
+
+def agent(bc,syms,qty=1.0,prot=False):
+    ag=tb.Agent(bc); ag.verbose=False; ag.balance=ag.start_balance=1000.0
+    for s in syms:
+        ag.positions[s]=dict(type='LONG',entry=1.0,cur=1.0,tp=1.1,sl=0.9,sz=10,lev=3,pnl=0,pnl_pct=0,
+                             strat='Breakout',reasons=[],ind={},klines=[],t0='2026-01-01T00:00:00',conf=60,
+                             max_pnl=0,min_pnl=0,live=True,qty=qty,trail=0,prot={'tp_px':1.1} if prot else None)
+    return ag
+
+def idle(ag,timeout=5):
+    # settle until the executor has nothing in flight (booked exits queue a wallet refresh)
+    end=time.time()+timeout
+    ag.settle()
+    while ag.ex.inflight and time.time()<end:
+        time.sleep(0.01); ag.settle()
+    return ag.ex.inflight
+
+def flatten(ag):
+    _,futs=ag.flatten()
+    legs=[l for f in futs for l in f.result(5)]
+    assert idle(ag)==0          # a lost leg would leave inflight above 0 for good
+    return dict(legs)
+
+def test_partial_batch_failure():
+    syms=[f"S{i}USDT" for i in range(7)]         # two requests: 5 + 2
+    bc=StubClient(batch={'S1USDT':{'code':-2022,'msg':'ReduceOnly rejected'},'S6USDT':{'code':-1,'msg':'timeout'}})
+    ag=agent(bc,syms)
+    legs=flatten(ag)
+    assert [len(x) for x in bc.sent]==[5,2]
+    assert not legs['S1USDT'].get('orderId') and 'orderId' in legs['S0USDT']
+    assert sorted(ag.positions)==['S1USDT','S6USDT']    # failed legs stay open for a retry
+    assert not any(p.get('closing') for p in ag.positions.values())
+    assert ag.trades==5 and ag.balance==990.0        # the wallet sync was not blocked
+
+def test_unknown_size_leg():
+    # untracked size: a confirmed 0 is already flat, an unreadable size is not closed
+    bc=StubClient(qty={'AUSDT':None,'BUSDT':0.0,'CUSDT':2.0})
+    ag=agent(bc,['AUSDT','BUSDT','CUSDT'],qty=0)
+    legs=flatten(ag)
+    assert bc.sent==[['CUSDT']]
+    assert legs['AUSDT']['msg']=='size unknown' and legs['BUSDT']=={'orderId':None}
+    assert list(ag.positions)==['AUSDT'] and not ag.positions['AUSDT'].get('closing')
+
+def test_exception_in_job_releases_inflight():
+    for raises in (('qty',),('batch',),('cancel',)):
+        bc=StubClient(raises=raises)
+        ag=agent(bc,['AUSDT','BUSDT'],qty=0 if raises==('qty',) else 1.0,prot=True)
+        legs=flatten(ag)
+        assert len(legs)==2, raises
+        assert not any(p.get('closing') for p in ag.positions.values()), raises
+        # a cancel failure after the exit filled still books the exit
+        assert (ag.trades==2)==(raises==('cancel',)), raises
+    # with nothing in flight the wallet sync applies again
+    ag.ex.account(); idle(ag)
+    assert ag.balance==990.0
+
+def test_tp_fill_before_protect_ack():
+    # the TP leg fills on the exchange before its placement result reaches settle()
+    bc=StubClient(); bc.book=StubBook()
+    ag=agent(bc,['AUSDT'])
+    ag.positions['AUSDT']['prot_wait']=True
+    bc.book.fill('AUSDT',11,1.1)
+    ag.settle()
+    assert 'AUSDT' in ag.positions and ag._fills_wait     # held, not consumed and dropped
+    ag.ex._run('protect','AUSDT',lambda:(1.1,0.9,1.0,[{'orderId':11},{'orderId':12}]))
+    idle(ag)
+    assert not ag.positions and ag.history[0]['why']=='TP' and not ag._fills_wait
+    assert bc.cancelled==['AUSDT']                       # the SL leg left behind
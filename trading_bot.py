@@ -1,20 +1,389 @@
 #!/usr/bin/env python3
 """AI Trading Bot v4.0 — Professional Dashboard"""
 
-import random, time, json, threading, webbrowser, requests
+import os, random, time, json, threading, queue, bisect, webbrowser, requests
+import numpy as np
+import socket, ssl, struct, base64, hashlib, gzip
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+# ── HTTP POOL ─────────────────────────────────────────────────
+# Keep-alive sessions per lane: 'market' for public data (prices, tickers, klines),
+# 'trade' for signed account/order calls so a slow scan never holds an order socket.
+class HttpPool:
+    LANES=('market','trade')
+    def __init__(self,market_pool=16,trade_pool=4):
+        self.sizes={'market':market_pool,'trade':trade_pool}
+        self.sessions={l:self._session(self.sizes[l]) for l in self.LANES}
+        self.lat={}
+        self._lk=threading.Lock()
+
+    @staticmethod
+    def _session(size):
+        s=requests.Session()
+        a=HTTPAdapter(pool_connections=4,pool_maxsize=size,pool_block=True)
+        s.mount('https://',a); s.mount('http://',a)
+        return s
+
+    def request(self,lane,method,url,key=None,**kw):
+        t0=time.perf_counter(); ok=False
+        try:
+            r=self.sessions[lane].request(method,url,**kw)
+            ok=r.status_code<500
+            return r
+        finally:
+            self._record(key or url,(time.perf_counter()-t0)*1000,ok)
+
+    def _record(self,key,ms,ok):
+        with self._lk:
+            c=self.lat.get(key)
+            if c is None: c=self.lat[key]={'n':0,'err':0,'total_ms':0.0,'max_ms':0.0,'last_ms':0.0}
+            c['n']+=1; c['total_ms']+=ms; c['last_ms']=ms
+            if ms>c['max_ms']: c['max_ms']=ms
+            if not ok: c['err']+=1
+
+    def stats(self):
+        with self._lk:
+            return {k:dict(n=c['n'],err=c['err'],avg_ms=round(c['total_ms']/c['n'],1),
+                           max_ms=round(c['max_ms'],1),last_ms=round(c['last_ms'],1))
+                    for k,c in self.lat.items() if c['n']}
+
+    def close(self):
+        for s in self.sessions.values(): s.close()
+
+# ── WEBSOCKET ─────────────────────────────────────────────────
+# Minimal RFC 6455 framing shared by the stream clients and the local stand-in servers.
+WS_GUID="258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+class WSClosed(ConnectionError): pass
+
+class WSConn:
+    def __init__(self,sock,rfile,mask):
+        self.sock=sock; self.rfile=rfile; self.mask=mask
+        self._wlk=threading.Lock()
+
+    @staticmethod
+    def accept_key(key):
+        return base64.b64encode(hashlib.sha1((key+WS_GUID).encode()).digest()).decode()
+
+    @classmethod
+    def connect(cls,url,timeout=10):
+        u=urlsplit(url)
+        port=u.port or (443 if u.scheme=='wss' else 80)
+        sock=socket.create_connection((u.hostname,port),timeout=timeout)
+        if u.scheme=='wss':
+            sock=ssl.create_default_context().wrap_socket(sock,server_hostname=u.hostname)
+        key=base64.b64encode(os.urandom(16)).decode()
+        path=(u.path or '/')+('?'+u.query if u.query else '')
+        sock.sendall((f"GET {path} HTTP/1.1\r\nHost: {u.hostname}:{port}\r\nUpgrade: websocket\r\n"
+                      f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+        rfile=sock.makefile('rb')
+        status=rfile.readline().decode('latin-1')
+        hdrs={}
+        while True:
+            ln=rfile.readline().decode('latin-1').strip()
+            if not ln: break
+            k,_,v=ln.partition(':'); hdrs[k.strip().lower()]=v.strip()
+        if ' 101 ' not in status or hdrs.get('sec-websocket-accept')!=cls.accept_key(key):
+            sock.close(); raise WSClosed(f"handshake failed: {status.strip()}")
+        return cls(sock,rfile,True)
+
+    @classmethod
+    def accept(cls,h):
+        # h is a BaseHTTPRequestHandler that received an Upgrade request
+        key=h.headers.get('Sec-WebSocket-Key')
+        if not key or h.headers.get('Upgrade','').lower()!='websocket':
+            h.send_error(400); return None
+        h.send_response(101)
+        h.send_header('Upgrade','websocket'); h.send_header('Connection','Upgrade')
+        h.send_header('Sec-WebSocket-Accept',cls.accept_key(key))
+        h.end_headers(); h.wfile.flush()
+        h.close_connection=True
+        return cls(h.connection,h.rfile,False)
+
+    def send(self,data,op=1):
+        if isinstance(data,str): data=data.encode()
+        n=len(data)
+        hdr=bytes([0x80|op])
+        mb=0x80 if self.mask else 0
+        if n<126: hdr+=bytes([mb|n])
+        elif n<65536: hdr+=bytes([mb|126])+struct.pack('!H',n)
+        else: hdr+=bytes([mb|127])+struct.pack('!Q',n)
+        if self.mask:
+            m=os.urandom(4); hdr+=m; data=self._xor(data,m)
+        with self._wlk: self.sock.sendall(hdr+data)
+
+    @staticmethod
+    def _xor(data,m):
+        n=len(data)
+        k=(m*(n//4+1))[:n]
+        return (int.from_bytes(data,'big')^int.from_bytes(k,'big')).to_bytes(n,'big') if n else b''
+
+    def _read(self,n):
+        b=self.rfile.read(n)
+        if len(b)<n: raise WSClosed("eof")
+        return b
+
+    def recv(self):
+        buf=b''; first=None
+        while True:
+            b0,b1=self._read(2)
+            op=b0&0x0f; n=b1&0x7f
+            if n==126: n=struct.unpack('!H',self._read(2))[0]
+            elif n==127: n=struct.unpack('!Q',self._read(8))[0]
+            m=self._read(4) if b1&0x80 else None
+            data=self._read(n)
+            if m: data=self._xor(data,m)
+            if op==8: raise WSClosed("closed by peer")
+            if op==9: self.send(data,10); continue
+            if op==10: continue
+            if op in (1,2): first=op; buf=data
+            else: buf+=data
+            if b0&0x80:
+                return buf.decode() if first==1 else buf
+
+    def close(self):
+        try: self.send(b'',8)
+        except Exception: pass
+        try: self.sock.close()
+        except Exception: pass
+
+# ── RATE LIMITER ──────────────────────────────────────────────
+# Tracks Binance request weight per minute (local charges, synced from X-MBX-USED-WEIGHT-*)
+# and order counts. Lanes by priority: 'order' may use the whole budget, 'account' and
+# 'market' queue once they reach the reserve line, 'scan' is shed first.
+class RateLimited(Exception): pass
+
+class WeightLimiter:
+    WEIGHTS={'/fapi/v1/exchangeInfo':1,'/fapi/v1/ticker/price':2,'/fapi/v1/ticker/24hr':40,
+             '/fapi/v2/account':5,'/fapi/v2/positionRisk':5,'/fapi/v1/leverageBracket':1,
+             '/fapi/v1/order':1,'/fapi/v1/leverage':1,'/fapi/v1/batchOrders':5,'/fapi/v1/allOpenOrders':1}
+    LANES={'/fapi/v1/order':'order','/fapi/v1/leverage':'order','/fapi/v1/batchOrders':'order',
+           '/fapi/v1/allOpenOrders':'order',
+           '/fapi/v2/account':'account','/fapi/v2/positionRisk':'account','/fapi/v1/leverageBracket':'account',
+           '/fapi/v1/listenKey':'account',
+           '/fapi/v1/klines':'scan'}
+    ORDER_PATHS={'/fapi/v1/order','/fapi/v1/batchOrders'}
+
+    def __init__(self,limit=2400,orders_10s=300,orders_1m=1200,reserve=0.2,shed=0.6,max_wait=30):
+        self.limit=limit
+        self.orders_10s=orders_10s; self.orders_1m=orders_1m
+        self.caps={'order':limit,'account':limit*(1-reserve),'market':limit*(1-reserve),'scan':limit*shed}
+        self.max_wait=max_wait
+        self.win=0; self.used=0
+        self.order_ts=deque()
+        self.hdr_orders=(0,0,0)
+        self.banned_until=0
+        self.shed=0; self.waits=0
+        self._cv=threading.Condition()
+
+    def weight(self,path,params=None):
+        if path=='/fapi/v1/klines': return KlineStore.weight(int((params or {}).get('limit',500)))
+        return self.WEIGHTS.get(path,1)
+
+    def _roll(self,now):
+        w=int(now//60)
+        if w!=self.win: self.win=w; self.used=0; self._cv.notify_all()
+        while self.order_ts and now-self.order_ts[0]>60: self.order_ts.popleft()
+
+    def _orders_ok(self,now,n=1):
+        recent=sum(1 for t in self.order_ts if now-t<10)
+        minute=len(self.order_ts)
+        ts,h10,h1m=self.hdr_orders
+        if now-ts<10: recent=max(recent,h10)
+        if int(ts//60)==self.win: minute=max(minute,h1m)
+        return recent+n<=self.orders_10s and minute+n<=self.orders_1m
+
+    def headroom(self,lane):
+        with self._cv:
+            self._roll(time.time())
+            return max(0,int(self.caps[lane]-self.used))
+
+    def acquire(self,path,params=None,lane=None):
+        lane=lane or self.LANES.get(path,'market')
+        w=self.weight(path,params)
+        n=len(json.loads(params['batchOrders'])) if path=='/fapi/v1/batchOrders' else 1
+        deadline=time.time()+(2 if lane=='order' else self.max_wait)
+        with self._cv:
+            while True:
+                now=time.time(); self._roll(now)
+                ready=now>=self.banned_until and self.used+w<=self.caps[lane]
+                if ready and path in self.ORDER_PATHS: ready=self._orders_ok(now,n)
+                if ready:
+                    self.used+=w
+                    if path in self.ORDER_PATHS: self.order_ts.extend([now]*n)
+                    return w
+                if lane=='scan' or now>=deadline:
+                    self.shed+=1
+                    raise RateLimited(f"{lane} {path} over budget ({self.used}/{self.limit})")
+                self.waits+=1
+                if now<self.banned_until: nxt=self.banned_until
+                elif self.used+w>self.caps[lane]: nxt=(self.win+1)*60
+                else: nxt=now+0.1
+                self._cv.wait(max(0.05,min(nxt,deadline)-now))
+
+    def observe(self,status,headers):
+        now=time.time()
+        with self._cv:
+            self._roll(now)
+            for k,v in headers.items():
+                k=k.lower()
+                if k.startswith('x-mbx-used-weight-') and k.endswith('1m'):
+                    self.used=max(self.used,int(v))
+                elif k=='x-mbx-order-count-10s': self.hdr_orders=(now,int(v),self.hdr_orders[2])
+                elif k=='x-mbx-order-count-1m': self.hdr_orders=(now,self.hdr_orders[1],int(v))
+            if status in (418,429):
+                self.banned_until=now+int(headers.get('Retry-After',60))
+                print(f"[RATE] HTTP {status}, backing off until {datetime.fromtimestamp(self.banned_until):%H:%M:%S}")
+
+    def stats(self):
+        with self._cv:
+            self._roll(time.time())
+            return dict(used=self.used,limit=self.limit,orders_1m=len(self.order_ts),
+                        shed=self.shed,waits=self.waits,banned=self.banned_until>time.time())
+
+# ── SYMBOL RULES ──────────────────────────────────────────────
+# exchangeInfo indexed once per symbol so the order path rounds without a network hop.
+class SymbolRules:
+    DEFAULT=dict(qty_prec=3,price_prec=2,tick=0.01,step=0.001,min_qty=0.001,max_qty=0,
+                 mkt_step=0.001,mkt_min_qty=0.001,mkt_max_qty=0,min_notional=5.0,max_lev=None)
+    def __init__(self,path=None):
+        self.path=path
+        self.by_sym={}
+        self.ts=0
+        if path: self.load_file()
+
+    def load(self,info):
+        idx={}
+        for s in info.get('symbols',[]):
+            r=dict(self.DEFAULT,qty_prec=s.get('quantityPrecision',3),price_prec=s.get('pricePrecision',2),
+                   status=s.get('status'),contract=s.get('contractType'))
+            for f in s.get('filters',[]):
+                ft=f.get('filterType')
+                if ft=='PRICE_FILTER': r['tick']=float(f['tickSize'])
+                elif ft=='LOT_SIZE':
+                    r['step']=float(f['stepSize']); r['min_qty']=float(f['minQty']); r['max_qty']=float(f['maxQty'])
+                elif ft=='MARKET_LOT_SIZE':
+                    r['mkt_step']=float(f['stepSize']); r['mkt_min_qty']=float(f['minQty']); r['mkt_max_qty']=float(f['maxQty'])
+                elif ft=='MIN_NOTIONAL': r['min_notional']=float(f.get('notional',f.get('minNotional',5)))
+            old=self.by_sym.get(s['symbol'])
+            if old: r['max_lev']=old.get('max_lev')
+            idx[s['symbol']]=r
+        if idx:
+            self.by_sym=idx; self.ts=time.time()
+            self.save_file()
+        return len(idx)
+
+    def load_brackets(self,brackets):
+        for b in brackets:
+            r=self.by_sym.get(b.get('symbol'))
+            if r and b.get('brackets'):
+                r['max_lev']=max(int(x['initialLeverage']) for x in b['brackets'])
+        self.save_file()
+
+    def get(self,sym): return self.by_sym.get(sym,self.DEFAULT)
+
+    @staticmethod
+    def _floor(x,step):
+        return int(x/step+1e-9)*step if step>0 else x
+
+    def round_qty(self,sym,qty,market=True):
+        r=self.get(sym)
+        step=r['mkt_step'] if market else r['step']
+        mn=r['mkt_min_qty'] if market else r['min_qty']
+        mx=r['mkt_max_qty'] if market else r['max_qty']
+        q=max(self._floor(qty,step),mn)
+        if mx>0: q=min(q,mx)
+        return round(q,r['qty_prec'])
+
+    def fmt_qty(self,sym,qty):
+        # the wire format: fixed-point at the symbol's precision, never str(float)'s 1e-05
+        return f"{qty:.{self.get(sym)['qty_prec']}f}"
+
+    def round_price(self,sym,price):
+        r=self.get(sym)
+        return round(round(price/r['tick'])*r['tick'] if r['tick']>0 else price,r['price_prec'])
+
+    def fmt_price(self,sym,price):
+        return f"{self.round_price(sym,price):.{self.get(sym)['price_prec']}f}"
+
+    def load_file(self):
+        try:
+            with open(self.path) as f: d=json.load(f)
+            self.by_sym=d.get('rules',{}); self.ts=d.get('ts',0)
+            print(f"✓ {len(self.by_sym)} symbol rules from {self.path}")
+        except FileNotFoundError: pass
+        except Exception as e: print(f"rules cache error: {e}")
+
+    def save_file(self):
+        if not self.path: return
+        try:
+            tmp=self.path+'.tmp'
+            with open(tmp,'w') as f: json.dump({'ts':self.ts,'rules':self.by_sym},f)
+            os.replace(tmp,self.path)
+        except Exception as e: print(f"rules save error: {e}")
+
+# ── PRICE EVENTS ──────────────────────────────────────────────
+# Producers (streams, REST refreshes, finished executor jobs) publish the symbols whose price
+# moved; the engine sleeps in take() until there is something to act on. Bursts coalesce into
+# one set, and t0 is the earliest unconsumed publish, for event-to-ack latency.
+class PriceBus:
+    def __init__(self):
+        self.cv=threading.Condition()
+        self.moved=set()
+        self.t0=None
+        self.events=0
+
+    def publish(self,syms=()):
+        # an empty publish just wakes the consumer (order results, account events)
+        with self.cv:
+            self.moved.update(syms)
+            if self.t0 is None: self.t0=time.perf_counter()
+            self.events+=1
+            self.cv.notify()
+
+    def take(self,timeout=None):
+        # -> (moved symbols, t0); t0 is None when the wait timed out with nothing new
+        with self.cv:
+            if self.t0 is None: self.cv.wait(timeout)
+            moved,t0=self.moved,self.t0
+            self.moved=set(); self.t0=None
+            return moved,t0
 
 # ── BINANCE CLIENT ────────────────────────────────────────────
 class BinanceClient:
-    BASE = "https://testnet.binancefuture.com"
-    def __init__(self):
+    BASE = os.environ.get('BOT_BASE') or "https://testnet.binancefuture.com"
+    WS_BASE = "wss://stream.binancefuture.com"
+    def __init__(self,market_pool=16,trade_pool=4,rules_path=None):
         self.symbols=[]
-        self.ticker={}
+        self.ticker={}               # copy-on-write, like prices: replaced by mark(), never edited
         self.prices={}
+        self._px_lk=threading.Lock() # serializes writers only; readers take the current reference
+        self.http=HttpPool(market_pool,trade_pool)
+        self.limiter=WeightLimiter()
+        self.rules=SymbolRules(rules_path)
+        self.lev={}                  # leverage the exchange holds per symbol; /leverage only on change
+        self.acks=deque(maxlen=500)  # per-order latency records
+        self.book=None               # AccountBook, set by UserStream
+        self.bus=PriceBus()
         self._fetch_symbols()
         self._fetch_tickers()
 
+    def _req(self,method,path,lane,**kw):
+        self.limiter.acquire(path,kw.get('params'))
+        r=self.http.request(lane,method,f"{self.BASE}{path}",key=path,**kw)
+        self.limiter.observe(r.status_code,r.headers)
+        return r
+
+    def _get(self,path,lane='market',**kw): return self._req('GET',path,lane,**kw)
+
+    def _post(self,path,lane='trade',**kw): return self._req('POST',path,lane,**kw)
+
     def _fetch_symbols(self):
         PRIORITY=['BTCUSDT','ETHUSDT','BNBUSDT','SOLUSDT','XRPUSDT',
             'ADAUSDT','DOGEUSDT','DOTUSDT','MATICUSDT','AVAXUSDT',
@@ -31,26 +400,52 @@ class BinanceClient:
             'TRXUSDT','DASHUSDT','ONTUSDT','CELOUSDT','LRCUSDT',
             'OCEANUSDT','STORJUSDT','RENUSDT','SKLUSDT','FETUSDT']
         try:
-            r=requests.get(f"{self.BASE}/fapi/v1/exchangeInfo",timeout=10)
-            valid={s['symbol'] for s in r.json()['symbols']
+            r=self._get("/fapi/v1/exchangeInfo",timeout=10)
+            info=r.json()
+            self.rules.load(info)
+            valid={s['symbol'] for s in info['symbols']
                    if s['symbol'].endswith('USDT')
                    and s['contractType']=='PERPETUAL'
                    and s['status']=='TRADING'}
+        except Exception as e:
+            print(f"symbols error: {e}")
+            valid={s for s,r in self.rules.by_sym.items()
+                   if s.endswith('USDT') and r.get('contract')=='PERPETUAL' and r.get('status')=='TRADING'}
+        if valid:
             self.symbols=[s for s in PRIORITY if s in valid]
             rest=[s for s in valid if s not in self.symbols]
             self.symbols+=rest
             print(f"✓ {len(self.symbols)} pairs loaded")
-        except Exception as e:
-            print(f"symbols error: {e}")
+        else:
             self.symbols=PRIORITY[:10]
 
+    def refresh_rules(self):
+        try:
+            n=self.rules.load(self._get("/fapi/v1/exchangeInfo",timeout=10).json())
+            if getattr(self,'api_key',None):
+                p=self._sign({'timestamp':int(time.time()*1000),'recvWindow':5000})
+                b=self._get("/fapi/v1/leverageBracket",lane='trade',params=p,
+                            headers={'X-MBX-APIKEY':self.api_key},timeout=10).json()
+                if isinstance(b,list): self.rules.load_brackets(b)
+            return n
+        except Exception as e:
+            print(f"rules refresh error: {e}")
+        return 0
+
+    def start_rules_refresh(self,every=3600):
+        def loop():
+            while True:
+                time.sleep(every); self.refresh_rules()
+        threading.Thread(target=loop,daemon=True).start()
+
     def _fetch_tickers(self):
         try:
-            r=requests.get(f"{self.BASE}/fapi/v1/ticker/24hr",timeout=10)
+            r=self._get("/fapi/v1/ticker/24hr",timeout=10)
+            px={}; tk={}
             for t in r.json():
                 s=t['symbol']
                 if s in self.symbols:
-                    self.ticker[s]={
+                    tk[s]={
                         'price':float(t['lastPrice']),
                         'change':float(t['priceChangePercent']),
                         'volume':float(t['volume']),
@@ -58,42 +453,44 @@ class BinanceClient:
                         'low':float(t['lowPrice']),
                         'quoteVolume':float(t['quoteVolume']),
                     }
-                    self.prices[s]=float(t['lastPrice'])
+                    px[s]=float(t['lastPrice'])
+            self.mark(px,tk)
             print(f"✓ {len(self.ticker)} prices loaded")
         except Exception as e:
             print(f"ticker error: {e}")
 
     def refresh_prices(self):
         try:
-            r=requests.get(f"{self.BASE}/fapi/v1/ticker/price",timeout=5)
-            for t in r.json():
-                if t['symbol'] in self.symbols:
-                    p=float(t['price'])
-                    self.prices[t['symbol']]=p
-                    if t['symbol'] in self.ticker:
-                        self.ticker[t['symbol']]['price']=p
+            r=self._get("/fapi/v1/ticker/price",timeout=5)
+            px={t['symbol']:float(t['price']) for t in r.json() if t['symbol'] in self.symbols}
+            moved=self.mark(px,{s:{'price':p} for s,p in px.items() if s in self.ticker})
+            if moved: self.bus.publish(moved)
         except: pass
 
     def refresh_tickers(self):
         try:
-            r=requests.get(f"{self.BASE}/fapi/v1/ticker/24hr",timeout=10)
+            r=self._get("/fapi/v1/ticker/24hr",timeout=10)
+            px={}; tk={}
             for t in r.json():
                 s=t['symbol']
                 if s in self.symbols:
-                    self.ticker[s].update({
+                    tk[s]={
                         'price':float(t['lastPrice']),
                         'change':float(t['priceChangePercent']),
                         'volume':float(t['volume']),
                         'high':float(t['highPrice']),
                         'low':float(t['lowPrice']),
-                    })
-                    self.prices[s]=float(t['lastPrice'])
+                    }
+                    px[s]=float(t['lastPrice'])
+            moved=self.mark(px,tk)
+            if moved: self.bus.publish(moved)
         except: pass
 
-    def klines(self, symbol, interval='5m', limit=60):
+    def klines(self, symbol, interval='5m', limit=60, start=None):
         try:
-            r=requests.get(f"{self.BASE}/fapi/v1/klines",
-                params={'symbol':symbol,'interval':interval,'limit':limit},timeout=10)
+            q={'symbol':symbol,'interval':interval,'limit':limit}
+            if start is not None: q['startTime']=start
+            r=self._get("/fapi/v1/klines",params=q,timeout=10)
             return [{'t':k[0],'o':float(k[1]),'h':float(k[2]),
                      'l':float(k[3]),'c':float(k[4]),'v':float(k[5])}
                     for k in r.json()]
@@ -102,8 +499,38 @@ class BinanceClient:
     def price(self,s): return self.prices.get(s,0)
     def info(self,s): return self.ticker.get(s,{})
 
+    def mark(self,px,tk=None):
+        # px {sym: price}, tk {sym: ticker fields to merge} -> symbols whose price moved.
+        # Writers build new maps and swap them in, so a reader iterating either map, or
+        # holding one ticker entry, never sees it resized or half-written
+        with self._px_lk:
+            prices=self.prices
+            moved=[s for s,p in px.items() if prices.get(s)!=p]
+            if tk:
+                t=dict(self.ticker)
+                for s,f in tk.items(): t[s]={**t.get(s,{}),**f}
+                self.ticker=t
+            if moved: self.prices={**prices,**px}
+        return moved
+
     def set_keys(self,ak,sk):
         self.api_key=ak; self.api_secret=sk
+        self.lev={}
+        def warm():
+            self.refresh_rules(); self.load_leverage()
+        threading.Thread(target=warm,daemon=True).start()
+
+    def load_leverage(self):
+        # prime the leverage cache from positionRisk, so first orders skip /leverage too
+        try:
+            p=self._sign({'timestamp':int(time.time()*1000),'recvWindow':5000})
+            r=self._get("/fapi/v2/positionRisk",lane='trade',params=p,
+                        headers={'X-MBX-APIKEY':self.api_key},timeout=10).json()
+            if isinstance(r,list):
+                for x in r:
+                    if x.get('leverage'): self.lev[x['symbol']]=int(x['leverage'])
+        except Exception as e:
+            print(f"leverage load error: {e}")
 
     def _sign(self,params):
         import hmac,hashlib,urllib.parse
@@ -111,16 +538,27 @@ class BinanceClient:
         params['signature']=hmac.new(sk.encode() if False else self.api_secret.encode(),qs.encode(),hashlib.sha256).hexdigest()
         return params
 
+    def streamed(self): return bool(self.book and self.book.synced)
+
+    def account_info(self):
+        p=self._sign({'timestamp':int(time.time()*1000),'recvWindow':5000})
+        return self._get("/fapi/v2/account",lane='trade',params=p,
+                         headers={'X-MBX-APIKEY':self.api_key},timeout=10).json()
+
+    def listen_key(self,method='POST'):
+        # POST opens (or returns the live) key, PUT extends it 60 min, DELETE closes it
+        d=self._req(method,"/fapi/v1/listenKey",'trade',headers={'X-MBX-APIKEY':self.api_key},timeout=10).json()
+        if method=='POST': return d.get('listenKey')
+        return 'code' not in d
+
     def fetch_account(self,force=False):
         if not getattr(self,'api_key',None): return None
+        if not force and self.streamed(): return self.book.account(self.prices)
         now=time.time()
         if not force and getattr(self,'_acc_ts',0) and now-self._acc_ts<30:
             return self._acc
         try:
-            p=self._sign({'timestamp':int(now*1000),'recvWindow':5000})
-            r=requests.get(f"{self.BASE}/fapi/v2/account",params=p,
-                           headers={'X-MBX-APIKEY':self.api_key},timeout=10)
-            d=r.json()
+            d=self.account_info()
             if 'totalWalletBalance' in d:
                 self._acc={'wallet':float(d['totalWalletBalance']),
                            'available':float(d.get('availableBalance',d['totalWalletBalance'])),
@@ -137,49 +575,138 @@ class BinanceClient:
     def set_leverage(self,symbol,lev):
         try:
             p=self._sign({'symbol':symbol,'leverage':lev,'timestamp':int(time.time()*1000),'recvWindow':5000})
-            requests.post(f"{self.BASE}/fapi/v1/leverage",params=p,
-                          headers={'X-MBX-APIKEY':self.api_key},timeout=10)
-        except: pass
-
-    def place_order(self,symbol,side,margin_usdt,leverage):
+            d=self._post("/fapi/v1/leverage",params=p,
+                          headers={'X-MBX-APIKEY':self.api_key},timeout=10).json()
+            if d.get('leverage')==lev: self.lev[symbol]=lev; return True
+            self.lev.pop(symbol,None)
+            print(f"[LEV ERR] {symbol}: {d.get('msg','?')}")
+        except Exception as e:
+            self.lev.pop(symbol,None)
+            print(f"[LEV EX] {symbol}: {e}")
+        return False
+
+    def order_qty(self,symbol,margin_usdt,leverage):
+        # leverage clamp + qty from the cached rules and the local price; no network
+        rl=self.rules; r=rl.get(symbol)
+        if r['max_lev']: leverage=min(leverage,r['max_lev'])
+        pr=self.price(symbol)
+        if pr<=0: return leverage,0
+        qty=rl.round_qty(symbol,margin_usdt*leverage/pr)
+        mn=r['min_notional']*1.1
+        if qty*pr<mn: qty=rl.round_qty(symbol,mn/pr*1.1)
+        return leverage,qty
+
+    def _ack(self,kind,symbol,t0,t1,ok):
+        t2=time.perf_counter()
+        self.acks.append(dict(kind=kind,sym=symbol,ok=ok,ts=round(time.time(),3),
+                              tick_to_ack_ms=round((t2-t0)*1000,1),prep_ms=round((t1-t0)*1000,1),
+                              rtt_ms=round((t2-t1)*1000,1)))
+
+    def order_stats(self):
+        a=[x for x in self.acks if x['ok']]
+        if not a: return dict(n=0,failed=len(self.acks))
+        tt=sorted(x['tick_to_ack_ms'] for x in a)
+        return dict(n=len(a),failed=len(self.acks)-len(a),
+                    tick_to_ack_p50_ms=tt[len(tt)//2],tick_to_ack_p95_ms=tt[min(len(tt)-1,int(len(tt)*0.95))],
+                    tick_to_ack_max_ms=tt[-1],rtt_avg_ms=round(sum(x['rtt_ms'] for x in a)/len(a),1),
+                    last=list(self.acks)[-5:])
+
+    def place_order(self,symbol,side,margin_usdt,leverage,t0=None):
+        # t0: perf_counter() of the tick that produced the signal, for tick-to-ack latency
         if not getattr(self,'api_key',None): return None
+        t0=t0 or time.perf_counter()
         try:
-            r0=requests.get(f"{self.BASE}/fapi/v1/exchangeInfo",timeout=10)
-            qty_prec=3; min_qty=0.001
-            for s in r0.json().get('symbols',[]):
-                if s['symbol']==symbol:
-                    qty_prec=s.get('quantityPrecision',3)
-                    for f in s.get('filters',[]):
-                        if f['filterType']=='LOT_SIZE': min_qty=float(f['minQty'])
-                    break
-            self.set_leverage(symbol,leverage)
-            pr=self.price(symbol)
-            if pr<=0: return None
-            qty=round(max(margin_usdt*leverage/pr, min_qty), qty_prec)
-            if qty*pr<5.5: qty=round(5.5/pr*1.1, qty_prec)
-            p=self._sign({'symbol':symbol,'side':side,'type':'MARKET',
-                          'quantity':qty,'timestamp':int(time.time()*1000),'recvWindow':5000})
-            r=requests.post(f"{self.BASE}/fapi/v1/order",params=p,
+            leverage,qty=self.order_qty(symbol,margin_usdt,leverage)
+            if qty<=0: return None
+            if self.lev.get(symbol)!=leverage and not self.set_leverage(symbol,leverage): return None
+            p=self._sign({'symbol':symbol,'side':side,'type':'MARKET','quantity':self.rules.fmt_qty(symbol,qty),
+                          'newOrderRespType':'RESULT','timestamp':int(time.time()*1000),'recvWindow':5000})
+            t1=time.perf_counter()
+            r=self._post("/fapi/v1/order",params=p,
                             headers={'X-MBX-APIKEY':self.api_key},timeout=10)
             d=r.json()
+            self._ack('open',symbol,t0,t1,'orderId' in d)
             if 'orderId' in d:
-                print(f"[ORDER OK] {symbol} {side} qty={qty} id={d['orderId']}"); return d
+                d['lev']=leverage        # effective, after the bracket clamp
+                print(f"[ORDER OK] {symbol} {side} qty={qty} id={d['orderId']} @ {d.get('avgPrice')}"); return d
             else:
                 print(f"[ORDER ERR] {symbol}: {d.get('msg','?')}")
         except Exception as e:
             print(f"[ORDER EX] {symbol}: {e}")
         return None
 
-    def close_position(self,symbol,side,qty):
+    def batch_orders(self,orders,t0=None,kind='batch'):
+        # up to 5 orders in one signed request -> one result per order, the order or {'code','msg'}
+        t0=t0 or time.perf_counter()
+        try:
+            p=self._sign({'batchOrders':json.dumps(orders,separators=(',',':')),
+                          'timestamp':int(time.time()*1000),'recvWindow':5000})
+            t1=time.perf_counter()
+            d=self._post("/fapi/v1/batchOrders",params=p,
+                         headers={'X-MBX-APIKEY':self.api_key},timeout=10).json()
+        except Exception as e:
+            t1=time.perf_counter(); d={'code':-1,'msg':str(e)}
+        if not isinstance(d,list): d=[d]*len(orders)
+        for o,x in zip(orders,d):
+            self._ack(kind,o['symbol'],t0,t1,'orderId' in x)
+            if 'orderId' not in x: print(f"[BATCH ERR] {o['symbol']} {o['side']}: {x.get('msg','?')}")
+        return d
+
+    def place_batch(self,entries,t0=None):
+        # entries: [(symbol, side, margin_usdt, leverage)] -> one result per entry ({} when not sent);
+        # a filled entry carries the leverage it went out at under 'lev', like place_order
+        if not getattr(self,'api_key',None): return [{} for _ in entries]
+        out=[{} for _ in entries]; send=[]
+        for i,(sym,side,margin,lev) in enumerate(entries):
+            lev,qty=self.order_qty(sym,margin,lev)
+            if qty<=0: continue
+            if self.lev.get(sym)!=lev and not self.set_leverage(sym,lev): continue
+            send.append((i,lev,{'symbol':sym,'side':side,'type':'MARKET','quantity':self.rules.fmt_qty(sym,qty),
+                                'newOrderRespType':'RESULT'}))
+        for k in range(0,len(send),5):
+            chunk=send[k:k+5]
+            for (i,lev,_),r in zip(chunk,self.batch_orders([o for _,_,o in chunk],t0)):
+                out[i]=dict(r,lev=lev) if 'orderId' in r else r
+        return out
+
+    def close_batch(self,legs,t0=None):
+        # legs: [(symbol, 'LONG'|'SHORT', qty)], at most 5, reduce-only market exits
+        return self.batch_orders([{'symbol':s,'side':'SELL' if typ=='LONG' else 'BUY','type':'MARKET',
+                                   'quantity':self.rules.fmt_qty(s,q),'reduceOnly':'true','newOrderRespType':'RESULT'}
+                                  for s,typ,q in legs],t0)
+
+    def protect(self,symbol,side,qty,tp,sl,t0=None):
+        # exchange-resident reduce-only exits on the mark price -> [tp result, sl result]
+        x='SELL' if side=='LONG' else 'BUY'
+        leg=lambda typ,px:{'symbol':symbol,'side':x,'type':typ,'quantity':self.rules.fmt_qty(symbol,qty),
+                           'reduceOnly':'true','stopPrice':self.rules.fmt_price(symbol,px),'workingType':'MARK_PRICE'}
+        return self.batch_orders([leg('TAKE_PROFIT_MARKET',tp),leg('STOP_MARKET',sl)],t0,'protect')
+
+    def cancel_all(self,symbol):
+        # drops every open order on the symbol, i.e. whatever is left of its TP/SL pair
+        try:
+            p=self._sign({'symbol':symbol,'timestamp':int(time.time()*1000),'recvWindow':5000})
+            d=self._req('DELETE',"/fapi/v1/allOpenOrders",'trade',params=p,
+                        headers={'X-MBX-APIKEY':self.api_key},timeout=10).json()
+            if d.get('code')==200: return True
+            print(f"[CANCEL ERR] {symbol}: {d.get('msg','?')}")
+        except Exception as e:
+            print(f"[CANCEL EX] {symbol}: {e}")
+        return False
+
+    def close_position(self,symbol,side,qty,t0=None):
         if not getattr(self,'api_key',None): return None
+        t0=t0 or time.perf_counter()
         try:
             close_side='SELL' if side=='LONG' else 'BUY'
             p=self._sign({'symbol':symbol,'side':close_side,'type':'MARKET',
-                          'quantity':qty,'reduceOnly':'true',
+                          'quantity':self.rules.fmt_qty(symbol,qty),'reduceOnly':'true','newOrderRespType':'RESULT',
                           'timestamp':int(time.time()*1000),'recvWindow':5000})
-            r=requests.post(f"{self.BASE}/fapi/v1/order",params=p,
+            t1=time.perf_counter()
+            r=self._post("/fapi/v1/order",params=p,
                             headers={'X-MBX-APIKEY':self.api_key},timeout=10)
             d=r.json()
+            self._ack('close',symbol,t0,t1,'orderId' in d)
             if 'orderId' in d: print(f"[CLOSE OK] {symbol} qty={qty}"); return d
             else: print(f"[CLOSE ERR] {symbol}: {d.get('msg','?')}")
         except Exception as e:
@@ -187,24 +714,29 @@ class BinanceClient:
         return None
 
     def get_pos_qty(self,symbol):
+        # -> size; 0 only when the exchange confirms flat, None when it could not be read
         if not getattr(self,'api_key',None): return 0
         try:
             p=self._sign({'symbol':symbol,'timestamp':int(time.time()*1000),'recvWindow':5000})
-            r=requests.get(f"{self.BASE}/fapi/v2/positionRisk",params=p,
+            r=self._get("/fapi/v2/positionRisk",lane='trade',params=p,
                            headers={'X-MBX-APIKEY':self.api_key},timeout=10)
-            for pos in r.json():
-                if pos['symbol']==symbol: return abs(float(pos.get('positionAmt',0)))
-        except: pass
-        return 0
+            d=r.json()
+            if isinstance(d,list):
+                return next((abs(float(x.get('positionAmt',0))) for x in d if x['symbol']==symbol),0.0)
+            print(f"[POS ERR] {symbol}: {d.get('msg','?')}")
+        except Exception as e:
+            print(f"[POS EX] {symbol}: {e}")
+        return None
 
     def fetch_live_pnl(self):
         if not getattr(self,'api_key',None): return {}
+        if self.streamed(): return self.book.pnl(self.prices)
         now=time.time()
         if getattr(self,'_pnl_ts',0) and now-self._pnl_ts<10:
             return getattr(self,'_pnl',{})
         try:
             p=self._sign({'timestamp':int(now*1000),'recvWindow':5000})
-            r=requests.get(f"{self.BASE}/fapi/v2/positionRisk",params=p,
+            r=self._get("/fapi/v2/positionRisk",lane='trade',params=p,
                            headers={'X-MBX-APIKEY':self.api_key},timeout=10)
             result={}
             for pos in r.json():
@@ -222,30 +754,506 @@ class BinanceClient:
             print(f"[PNL ERR] {e}")
         return getattr(self,'_pnl',{})
 
+# ── MARKET STREAM ─────────────────────────────────────────────
+# Combined mark-price / mini-ticker stream: marks into BinanceClient.prices, 24h stats into ticker.
+# Engine keeps the REST polling threads as fallback while the stream is not healthy.
+class MarketStream:
+    STREAMS='!markPrice@arr@1s/!miniTicker@arr'
+    def __init__(self,bc,stale=15):
+        self.bc=bc
+        self.stale=stale
+        self.running=False
+        self.last_msg=0
+        self.msgs=0
+        self.reconnects=0
+        self.ws=None
+
+    @property
+    def url(self): return f"{self.bc.WS_BASE}/stream?streams={self.STREAMS}"
+
+    @property
+    def healthy(self): return self.running and time.time()-self.last_msg<self.stale
+
+    def start(self):
+        if self.running: return
+        self.running=True
+        threading.Thread(target=self._run,daemon=True).start()
+
+    def stop(self):
+        self.running=False
+        if self.ws: self.ws.close()
+
+    def _run(self):
+        backoff=1
+        while self.running:
+            try:
+                self.ws=WSConn.connect(self.url)
+                self.ws.sock.settimeout(self.stale)
+                if self.reconnects:
+                    # resync anything missed while disconnected
+                    self.bc.refresh_prices(); self.bc.refresh_tickers()
+                print("[WS] market stream connected")
+                backoff=1
+                while self.running:
+                    self.apply(json.loads(self.ws.recv()))
+            except Exception as e:
+                if self.running: print(f"[WS] market stream down: {e}")
+            finally:
+                if self.ws: self.ws.close()
+            self.reconnects+=1
+            if self.running:
+                time.sleep(backoff); backoff=min(backoff*2,30)
+
+    def apply(self,msg):
+        data=msg.get('data',msg) if isinstance(msg,dict) else msg
+        if isinstance(data,dict): data=[data]
+        bc=self.bc; syms=set(bc.symbols); px={}; tk={}
+        for d in data:
+            s=d.get('s')
+            if s not in syms: continue
+            e=d.get('e')
+            # prices follow the mark only, the price the exchange TP/SL legs trigger on; the last
+            # trade price from the mini-ticker is display data and stays in ticker
+            if e=='markPriceUpdate':
+                px[s]=float(d['p'])
+            elif e=='24hrMiniTicker':
+                c,o=float(d['c']),float(d['o'])
+                tk[s]=dict(price=c,change=(c-o)/o*100 if o else 0,volume=float(d['v']),
+                           high=float(d['h']),low=float(d['l']),quoteVolume=float(d['q']))
+        moved=bc.mark(px,tk) if px or tk else []
+        if moved: bc.bus.publish(moved)
+        self.msgs+=1; self.last_msg=time.time()
+
+# ── USER STREAM ───────────────────────────────────────────────
+# listenKey user-data stream into an AccountBook, so balance and live PnL need no polling.
+# The stream carries no sequence numbers: every (re)connect takes a REST snapshot after
+# subscribing, and events older than what the snapshot already holds are dropped.
+class AccountBook:
+    def __init__(self,asset='USDT'):
+        self.asset=asset
+        self.wallet=0.0; self.available=0.0; self.ts=0
+        self.pos={}                      # sym -> [amt, entry, unrealized, exchange ms]
+        self.fills=deque(maxlen=200)     # recent trades from ORDER_TRADE_UPDATE
+        self.n=0                         # trades seen, consumers keep their own cursor
+        self.epoch=0                     # snapshots loaded; a change means a gap was papered over
+        self.synced=False
+        self.lk=threading.Lock()
+
+    def load(self,d):
+        # /fapi/v2/account snapshot
+        a=next((x for x in d.get('assets',()) if x.get('asset')==self.asset),{})
+        with self.lk:
+            self.wallet=float(d['totalWalletBalance'])
+            self.available=float(d.get('availableBalance',self.wallet))
+            self.ts=int(a.get('updateTime',0))
+            self.pos={p['symbol']:[float(p['positionAmt']),float(p['entryPrice']),
+                                   float(p.get('unrealizedProfit',0)),int(p.get('updateTime',0))]
+                      for p in d.get('positions',())}
+            self.epoch+=1; self.synced=True
+
+    def apply(self,m):
+        e=m.get('e')
+        with self.lk:
+            if e=='ACCOUNT_UPDATE':
+                t=int(m.get('T') or m.get('E',0)); a=m['a']
+                for b in a.get('B',()):
+                    if b['a']==self.asset and t>=self.ts:
+                        wb=float(b['wb'])
+                        self.available+=wb-self.wallet    # approximate until the next snapshot
+                        self.wallet=wb; self.ts=t
+                for p in a.get('P',()):
+                    old=self.pos.get(p['s'])
+                    if old and t<old[3]: continue
+                    self.pos[p['s']]=[float(p['pa']),float(p['ep']),float(p['up']),t]
+            elif e=='ORDER_TRADE_UPDATE':
+                o=m['o']
+                if o.get('x')=='TRADE':
+                    self.n+=1
+                    self.fills.append(dict(n=self.n,sym=o['s'],id=o['i'],side=o['S'],status=o['X'],
+                                           qty=float(o['l']),price=float(o['L']),avg=float(o['ap']),
+                                           filled=float(o['z']),reduce=bool(o.get('R')),
+                                           pnl=float(o.get('rp',0)),t=int(o.get('T',0))))
+        return e
+
+    def since(self,n):
+        with self.lk: return [f for f in self.fills if f['n']>n],self.n
+
+    def holds(self,sym):
+        with self.lk:
+            p=self.pos.get(sym)
+            return bool(p and p[0])
+
+    @staticmethod
+    def _up(s,p,prices):
+        m=prices.get(s)
+        return (m-p[1])*p[0] if m else p[2]
+
+    def account(self,prices):
+        with self.lk:
+            up=sum(self._up(s,p,prices) for s,p in self.pos.items() if p[0])
+            return {'wallet':self.wallet,'available':self.available,'unrealized':up}
+
+    def pnl(self,prices):
+        # same shape as the positionRisk poll it replaces
+        with self.lk:
+            return {s:{'qty':abs(p[0]),'entry':p[1],'mark':prices.get(s,0),'pnl':self._up(s,p,prices)}
+                    for s,p in self.pos.items() if p[0]}
+
+class UserStream:
+    def __init__(self,bc,keepalive=1800,stale=600):
+        self.bc=bc
+        self.book=bc.book=AccountBook()
+        self.keepalive=keepalive     # listenKeys lapse after 60 min without a PUT
+        self.stale=stale             # no frame (the server pings every 3 min) -> reconnect
+        self.running=False
+        self.key=None
+        self.ws=None
+        self.msgs=0; self.reconnects=0; self.resyncs=0
+
+    @property
+    def healthy(self): return self.running and self.book.synced
+
+    def start(self):
+        if self.running: return
+        self.running=True
+        threading.Thread(target=self._run,daemon=True).start()
+        threading.Thread(target=self._keepalive,daemon=True).start()
+
+    def stop(self):
+        self.running=False; self.book.synced=False
+        if self.ws: self.ws.close()
+        if self.key:
+            try: self.bc.listen_key('DELETE')
+            except Exception: pass
+
+    def restart(self):
+        # e.g. new API keys: drop the socket, the loop comes back with a fresh key and snapshot
+        self.book.synced=False
+        if self.ws: self.ws.close()
+
+    def resync(self):
+        d=self.bc.account_info()
+        if 'totalWalletBalance' not in d: raise ConnectionError(d.get('msg','account snapshot failed'))
+        self.book.load(d); self.resyncs+=1
+
+    def _run(self):
+        backoff=1
+        while self.running:
+            if not getattr(self.bc,'api_key',None):
+                time.sleep(1); continue
+            try:
+                self.key=self.bc.listen_key()
+                if not self.key: raise ConnectionError("no listenKey")
+                self.ws=WSConn.connect(f"{self.bc.WS_BASE}/ws/{self.key}")
+                self.ws.sock.settimeout(self.stale)
+                self.resync()
+                print("[WS] user stream connected")
+                backoff=1
+                while self.running:
+                    m=json.loads(self.ws.recv())
+                    self.msgs+=1
+                    e=self.book.apply(m)
+                    if e=='listenKeyExpired': raise WSClosed("listenKey expired")
+                    if e in ('ACCOUNT_UPDATE','ORDER_TRADE_UPDATE'): self.bc.bus.publish()
+            except Exception as e:
+                if self.running: print(f"[WS] user stream down: {e}")
+            finally:
+                self.book.synced=False
+                if self.ws: self.ws.close()
+            self.reconnects+=1
+            if self.running:
+                time.sleep(backoff); backoff=min(backoff*2,30)
+
+    def _keepalive(self):
+        while self.running:
+            time.sleep(self.keepalive)
+            if not (self.running and self.book.synced): continue
+            try: ok=self.bc.listen_key('PUT')
+            except Exception: ok=False
+            if not ok: self.restart()
+
+# ── KLINE STORE ───────────────────────────────────────────────
+INTERVAL_MS={'1m':60_000,'3m':180_000,'5m':300_000,'15m':900_000,'30m':1_800_000,
+             '1h':3_600_000,'2h':7_200_000,'4h':14_400_000,'1d':86_400_000}
+
+# Fixed-capacity ring per (symbol, interval); the last slot is the still-forming candle.
+class KlineRing:
+    COLS=('t','o','h','l','c','v')
+    def __init__(self,cap=60):
+        self.cap=cap
+        self.n=0
+        self.head=0
+        self.cols={k:[0.0]*cap for k in self.COLS}
+        self.fetched=0
+
+    def __len__(self): return self.n
+
+    def _idx(self,i): return (self.head+i)%self.cap
+
+    @property
+    def last_t(self): return self.cols['t'][self._idx(self.n-1)] if self.n else None
+
+    @property
+    def first_t(self): return self.cols['t'][self.head] if self.n else None
+
+    def _put(self,i,k):
+        c=self.cols
+        c['t'][i]=k['t']; c['o'][i]=k['o']; c['h'][i]=k['h']
+        c['l'][i]=k['l']; c['c'][i]=k['c']; c['v'][i]=k['v']
+
+    def merge(self,rows):
+        for k in rows:
+            last=self.last_t
+            if last is not None and k['t']==last:
+                self._put(self._idx(self.n-1),k)
+            elif last is None or k['t']>last:
+                if self.n<self.cap:
+                    self._put(self._idx(self.n),k); self.n+=1
+                else:
+                    self._put(self.head,k); self.head=(self.head+1)%self.cap
+
+    def tick(self,price):
+        # live price into the forming candle without a fetch
+        if not self.n or price<=0: return
+        i=self._idx(self.n-1); c=self.cols
+        c['c'][i]=price
+        if price>c['h'][i]: c['h'][i]=price
+        if price<c['l'][i]: c['l'][i]=price
+
+    def column(self,k,n=None):
+        n=min(n or self.n,self.n)
+        col=self.cols[k]; a=self._idx(self.n-n); b=a+n
+        return col[a:b] if b<=self.cap else col[a:]+col[:b-self.cap]
+
+    def view(self,n=None): return {k:self.column(k,n) for k in self.COLS}
+
+    def rows(self,n=None):
+        v=self.view(n)
+        return [{'t':t,'o':o,'h':h,'l':l,'c':c,'v':vv}
+                for t,o,h,l,c,vv in zip(v['t'],v['o'],v['h'],v['l'],v['c'],v['v'])]
+
+class KlineStore:
+    def __init__(self,bc,cap=60,min_refresh=30,archive=None):
+        self.bc=bc
+        self.archive=archive
+        self.cap=cap
+        self.min_refresh=min_refresh
+        self.rings={}
+        self.stats={'req':0,'rows':0,'full':0}
+        self._lk=threading.Lock()
+
+    def ring(self,sym,interval='5m'):
+        key=(sym,interval)
+        r=self.rings.get(key)
+        if r is None:
+            with self._lk: r=self.rings.setdefault(key,KlineRing(self.cap))
+        return r
+
+    def due(self,sym,interval='5m'):
+        r=self.ring(sym,interval)
+        if not r.n: return True
+        now=time.time()
+        return now*1000>=r.last_t+INTERVAL_MS.get(interval,300_000) or now-r.fetched>=self.min_refresh
+
+    @staticmethod
+    def weight(limit):
+        return 1 if limit<100 else 2 if limit<500 else 5 if limit<=1000 else 10
+
+    def refresh(self,sym,interval='5m'):
+        r=self.ring(sym,interval)
+        step=INTERVAL_MS.get(interval,300_000)
+        if not r.n and self.archive:
+            r.merge(self.archive.tail(sym,interval,self.cap))   # warm start
+        gap=int((time.time()*1000-r.last_t)//step)+1 if r.n else self.cap
+        if not r.n or gap>=self.cap:
+            rows=self.bc.klines(sym,interval,self.cap)
+            with self._lk: self.stats['full']+=1
+        else:
+            rows=self.bc.klines(sym,interval,min(gap+2,self.cap),start=r.last_t)
+        with self._lk:
+            self.stats['req']+=1; self.stats['rows']+=len(rows)
+        if rows:
+            r.merge(rows); r.fetched=time.time()
+            if self.archive and len(rows)>1:
+                try: self.archive.append(sym,interval,rows[:-1])
+                except Exception as e: print(f"archive error {sym}: {e}")
+        return r
+
+    def get(self,sym,interval='5m'):
+        if self.due(sym,interval): return self.refresh(sym,interval)
+        r=self.ring(sym,interval)
+        r.tick(self.bc.price(sym))
+        return r
+
+# ── KLINE ARCHIVE ─────────────────────────────────────────────
+# <root>/<SYMBOL>/<interval>/ holds one append-only raw file per column (the hot segment,
+# memory-mapped on read) plus sealed seg-<first_t>.npz files (compressed cold segments).
+class KlineArchive:
+    DTYPES={'t':'<i8','o':'<f8','h':'<f8','l':'<f8','c':'<f8','v':'<f8'}
+    def __init__(self,root,seg_rows=50_000):
+        self.root=root
+        self.seg_rows=seg_rows
+        self._locks={}
+        self._lk=threading.Lock()
+        os.makedirs(root,exist_ok=True)
+
+    def _dir(self,sym,interval): return os.path.join(self.root,sym,interval)
+
+    def _lock(self,key):
+        with self._lk: return self._locks.setdefault(key,threading.Lock())
+
+    def symbols(self,interval='5m'):
+        return sorted(s for s in os.listdir(self.root) if os.path.isdir(self._dir(s,interval)))
+
+    def _hot(self,d):
+        # zero-copy column views; torn appends are cut to the shortest column
+        cols={}
+        for k,dt in self.DTYPES.items():
+            f=os.path.join(d,k+'.bin')
+            n=os.path.getsize(f)//8 if os.path.exists(f) else 0
+            cols[k]=np.memmap(f,dtype=dt,mode='r',shape=(n,)) if n else np.empty(0,dtype=dt)
+        n=min(len(c) for c in cols.values())
+        return {k:c[:n] for k,c in cols.items()}
+
+    def _cold(self,d):
+        return sorted(f for f in os.listdir(d) if f.startswith('seg-') and f.endswith('.npz')) if os.path.isdir(d) else []
+
+    def last_t(self,sym,interval='5m'):
+        d=self._dir(sym,interval)
+        if not os.path.isdir(d): return None
+        t=self._hot(d)['t']
+        if len(t): return int(t[-1])
+        segs=self._cold(d)
+        if segs:
+            with np.load(os.path.join(d,segs[-1])) as z: return int(z['t'][-1])
+        return None
+
+    def append(self,sym,interval,rows):
+        # rows: kline dicts (closed candles only); anything at or before last_t is dropped
+        with self._lock((sym,interval)):
+            d=self._dir(sym,interval); os.makedirs(d,exist_ok=True)
+            last=self.last_t(sym,interval)
+            rows=[r for r in rows if last is None or r['t']>last]
+            if not rows: return 0
+            rows.sort(key=lambda r:r['t'])
+            # drop what a torn append left past the committed length, or every later row of
+            # that column would sit one slot off its timestamp
+            n=len(self._hot(d)['t'])
+            for k in self.DTYPES:
+                f=os.path.join(d,k+'.bin')
+                if os.path.exists(f) and os.path.getsize(f)>n*8: os.truncate(f,n*8)
+            for k in ('o','h','l','c','v','t'):     # t last: it defines the committed length
+                with open(os.path.join(d,k+'.bin'),'ab') as f:
+                    f.write(np.array([r[k] for r in rows],dtype=self.DTYPES[k]).tobytes())
+            if len(self._hot(d)['t'])>=self.seg_rows: self._seal(d)
+            return len(rows)
+
+    def _seal(self,d):
+        hot={k:np.array(v) for k,v in self._hot(d).items()}
+        np.savez_compressed(os.path.join(d,f"seg-{int(hot['t'][0])}.npz"),**hot)
+        for k in self.DTYPES: os.remove(os.path.join(d,k+'.bin'))
+
+    def read(self,sym,interval='5m',start=None,end=None):
+        d=self._dir(sym,interval)
+        parts=[]; segs=self._cold(d)
+        for i,f in enumerate(segs):
+            # a segment ends before the next one begins (its first t is in the name), so only
+            # the segments overlapping [start,end] get decompressed
+            if end is not None and int(f[4:-4])>end: break
+            if start is not None and i+1<len(segs) and int(segs[i+1][4:-4])<=start: continue
+            with np.load(os.path.join(d,f)) as z:
+                t=z['t']
+                if start is not None and t[-1]<start: continue
+                parts.append({k:z[k] for k in self.DTYPES})
+        if os.path.isdir(d): parts.append(self._hot(d))
+        parts=[p for p in parts if len(p['t'])]
+        if not parts: return {k:np.empty(0,dtype=dt) for k,dt in self.DTYPES.items()}
+        out=parts[0] if len(parts)==1 else {k:np.concatenate([p[k] for p in parts]) for k in self.DTYPES}
+        t=out['t']
+        a=0 if start is None else int(np.searchsorted(t,start,'left'))
+        b=len(t) if end is None else int(np.searchsorted(t,end,'right'))
+        return {k:v[a:b] for k,v in out.items()}
+
+    def tail(self,sym,interval='5m',n=60):
+        last=self.last_t(sym,interval)
+        if last is None: return []
+        v=self.read(sym,interval,start=last-(n-1)*INTERVAL_MS[interval])
+        return [{'t':int(t),'o':float(o),'h':float(h),'l':float(l),'c':float(c),'v':float(vv)}
+                for t,o,h,l,c,vv in zip(*(v[k][-n:] for k in KlineRing.COLS))]
+
+def backfill(bc,archive,syms,interval='5m',days=30,workers=4,page=1000,retries=3,log=print):
+    # resumable: each symbol continues from its last archived candle; only closed candles
+    step=INTERVAL_MS[interval]
+    def one(sym):
+        now=int(time.time()*1000)
+        last=archive.last_t(sym,interval)
+        t=last+step if last is not None else (now-int(days*86_400_000))//step*step
+        n=0; fails=0
+        while t+step<=now:
+            try:
+                r=bc._get("/fapi/v1/klines",timeout=10,
+                          params={'symbol':sym,'interval':interval,'startTime':t,'limit':page})
+                batch=r.json()
+            except RateLimited:
+                time.sleep(1); continue
+            except (requests.RequestException,ValueError) as e:
+                # timeout, dropped connection, non-JSON body: back off, then give the symbol up;
+                # the next run resumes it from its last archived candle
+                fails+=1
+                if fails>retries:
+                    log(f"[BACKFILL] {sym}: skipped after {fails} errors ({e})"); break
+                time.sleep(min(2**fails,30)); continue
+            fails=0
+            if not isinstance(batch,list):
+                log(f"[BACKFILL] {sym}: {batch}"); break
+            rows=[{'t':k[0],'o':float(k[1]),'h':float(k[2]),'l':float(k[3]),'c':float(k[4]),'v':float(k[5])}
+                  for k in batch if k[0]+step<=now]
+            if not rows: break
+            n+=archive.append(sym,interval,rows)
+            t=rows[-1]['t']+step
+        return sym,n
+    total=0
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for sym,n in ex.map(one,syms):
+            total+=n
+            if n: log(f"[BACKFILL] {sym} +{n}")
+    return total
+
 # ── TECHNICAL ANALYSIS ───────────────────────────────────────
 class TA:
     @staticmethod
     def rsi(p,n=14):
+        # Wilder smoothing, seeded with the simple mean of the first n moves
         if len(p)<n+1: return 50
         d=[p[i]-p[i-1] for i in range(1,len(p))]
-        g=[x if x>0 else 0 for x in d[-n:]]
-        l=[-x if x<0 else 0 for x in d[-n:]]
-        ag,al=sum(g)/n,sum(l)/n
+        ag=sum(x for x in d[:n] if x>0)/n
+        al=sum(-x for x in d[:n] if x<0)/n
+        for x in d[n:]:
+            ag=(ag*(n-1)+(x if x>0 else 0))/n
+            al=(al*(n-1)+(-x if x<0 else 0))/n
         if al==0: return 100
         return 100-(100/(1+ag/al))
 
+    @staticmethod
+    def ema_series(p,n):
+        out=[None]*len(p)
+        if len(p)<n: return out
+        m=2/(n+1); e=sum(p[:n])/n; out[n-1]=e
+        for i in range(n,len(p)):
+            e=(p[i]-e)*m+e; out[i]=e
+        return out
+
     @staticmethod
     def ema(p,n):
         if len(p)<n: return p[-1]
-        m=2/(n+1); e=p[-n]
-        for x in p[-n+1:]: e=(x-e)*m+e
-        return e
+        return TA.ema_series(p,n)[-1]
 
     @staticmethod
-    def macd(p):
-        if len(p)<26: return 0,0
-        m=TA.ema(p,12)-TA.ema(p,26)
-        return m, m*0.85
+    def macd(p,fast=12,slow=26,sig=9):
+        if len(p)<slow: return 0,0
+        f,s=TA.ema_series(p,fast),TA.ema_series(p,slow)
+        line=[a-b for a,b in zip(f[slow-1:],s[slow-1:])]
+        return line[-1],TA.ema(line,sig)
 
     @staticmethod
     def bb(p,n=20):
@@ -263,95 +1271,521 @@ class TA:
             trs.append(max(h-l,abs(h-pc),abs(l-pc)))
         return sum(trs[-n:])/n
 
+# ── STRATEGY PARAMS ───────────────────────────────────────────
+# Tunable thresholds shared by Agent and BatchTA.score; optimize.py sweeps these.
+STRATEGY=dict(
+    rsi_os=25,rsi_os_weak=32,rsi_ob_weak=68,rsi_ob=75,   # RSI cut-offs
+    min_score=3,min_conf=45,                             # entry gates
+    tp=0.018,sl=0.007,                                   # TP/SL distance at 3x, scales with lev
+    trail=0.0,                                           # trailing-stop distance at 3x, 0 = fixed SL
+    margin=0.08,levs=(2,3,5),max_pos=6)
+
+# ── BATCH TA ──────────────────────────────────────────────────
+# NumPy versions of TA over (symbols x candles) arrays. Every function returns the full
+# series; column t equals the scalar TA on the first t+1 candles of each row.
+class BatchTA:
+    @staticmethod
+    def ema(X,n):
+        out=X.astype(float).copy()
+        T=X.shape[1]
+        if T<n: return out
+        m=2/(n+1); e=X[:,:n].mean(axis=1); out[:,n-1]=e
+        for t in range(n,T):
+            e=(X[:,t]-e)*m+e; out[:,t]=e
+        return out
+
+    @staticmethod
+    def rsi(X,n=14):
+        S,T=X.shape
+        out=np.full((S,T),50.0)
+        if T<n+1: return out
+        d=np.diff(X,axis=1); g=np.where(d>0,d,0.0); l=np.where(d<0,-d,0.0)
+        ag=g[:,:n].mean(axis=1); al=l[:,:n].mean(axis=1)
+        def val(ag,al):
+            with np.errstate(divide='ignore',invalid='ignore'):
+                return np.where(al==0,100.0,100-(100/(1+ag/al)))
+        out[:,n]=val(ag,al)
+        for t in range(n,T-1):
+            ag=(ag*(n-1)+g[:,t])/n; al=(al*(n-1)+l[:,t])/n
+            out[:,t+1]=val(ag,al)
+        return out
+
+    @staticmethod
+    def macd(X,fast=12,slow=26,sig=9):
+        S,T=X.shape
+        m=np.zeros((S,T)); s=np.zeros((S,T))
+        if T<slow: return m,s
+        line=(BatchTA.ema(X,fast)-BatchTA.ema(X,slow))[:,slow-1:]
+        m[:,slow-1:]=line; s[:,slow-1:]=BatchTA.ema(line,sig)
+        return m,s
+
+    @staticmethod
+    def bb(X,n=20,k=2,chunk=2048):
+        S,T=X.shape
+        up=X.astype(float).copy(); mid=up.copy(); lo=up.copy()
+        if T<n: return up,mid,lo
+        W=np.lib.stride_tricks.sliding_window_view(X,n,axis=1)
+        for a in range(0,W.shape[1],chunk):
+            w=W[:,a:a+chunk]; mu=w.mean(axis=2); sd=np.sqrt(((w-mu[...,None])**2).mean(axis=2))
+            mid[:,n-1+a:n-1+a+w.shape[1]]=mu
+            up[:,n-1+a:n-1+a+w.shape[1]]=mu+k*sd
+            lo[:,n-1+a:n-1+a+w.shape[1]]=mu-k*sd
+        return up,mid,lo
+
+    @staticmethod
+    def _rolling_mean(X,n):
+        cs=np.cumsum(X,axis=1); out=cs.copy()
+        out[:,n:]=cs[:,n:]-cs[:,:-n]
+        return out/n
+
+    @staticmethod
+    def atr(H,L,C,n=14):
+        S,T=C.shape
+        out=np.zeros((S,T))
+        if T<n+1: return out
+        pc=C[:,:-1]; h=H[:,1:]; l=L[:,1:]
+        tr=np.maximum(h-l,np.maximum(np.abs(h-pc),np.abs(l-pc)))
+        out[:,n:]=BatchTA._rolling_mean(tr,n)[:,n-1:]
+        return out
+
+    @staticmethod
+    def vol_ratio(V,n=20):
+        avg=BatchTA._rolling_mean(V,n)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            return np.where(avg>0,V/avg,1.0)
+
+    @staticmethod
+    def indicators(C,H,L,V,last=True):
+        m,ms=BatchTA.macd(C)
+        bbu,bbm,bbl=BatchTA.bb(C)
+        out=dict(rsi=BatchTA.rsi(C),macd=m,msig=ms,e20=BatchTA.ema(C,20),e50=BatchTA.ema(C,50),
+                 bbu=bbu,bbm=bbm,bbl=bbl,atr=BatchTA.atr(H,L,C),vr=BatchTA.vol_ratio(V))
+        return {k:a[:,-1] for k,a in out.items()} if last else out
+
+    @staticmethod
+    def score(C,H,L,ind,prev=None,P=STRATEGY):
+        # vectorized mirror of Agent._evaluate scoring, same shapes as ind;
+        # prev: close before column 0 when C is a slice of a longer series
+        p=C; prev=np.concatenate([C[:,:1] if prev is None else prev.reshape(-1,1),C[:,:-1]],axis=1)
+        rsi,m,ms=ind['rsi'],ind['macd'],ind['msig']
+        sc=np.select([rsi<P['rsi_os'],rsi<P['rsi_os_weak'],rsi>P['rsi_ob'],rsi>P['rsi_ob_weak']],[3,2,-3,-2],0)
+        sc=sc+np.select([(m>ms)&(m>0),m>ms,(m<ms)&(m<0),m<ms],[2,1,-2,-1],0)
+        e20,e50=ind['e20'],ind['e50']
+        sc=sc+np.where((p>e20)&(e20>e50),1,np.where((p<e20)&(e20<e50),-1,0))
+        sc=sc+np.where(p<ind['bbl']*1.001,2,np.where(p>ind['bbu']*0.999,-2,0))
+        sc=sc+(ind['vr']>2.5)
+        wick=H-L; body=np.abs(p-prev)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            sc=sc+((wick>0)&(body/np.where(wick>0,wick,1)<0.3)&(p>prev))
+        return sc.astype(int),np.minimum(np.abs(sc)/9*100,96)
+
+# ── STREAMING INDICATORS ──────────────────────────────────────
+# O(1) incremental versions of TA. push() commits a closed candle, peek() evaluates
+# the still-forming one without committing; push(x1..xk)+peek(y) equals TA on [x1..xk,y].
+class EMA:
+    def __init__(self,n):
+        self.n=n; self.k=2/(n+1)
+        self.cnt=0; self.sum=0.0; self.e=None
+
+    def push(self,x):
+        self.cnt+=1
+        if self.e is not None: self.e+=(x-self.e)*self.k
+        else:
+            self.sum+=x
+            if self.cnt==self.n: self.e=self.sum/self.n
+
+    def ready(self,extra=1): return self.e is not None or self.cnt+extra>=self.n
+
+    def peek(self,x):
+        if self.e is not None: return self.e+(x-self.e)*self.k
+        if self.cnt+1==self.n: return (self.sum+x)/self.n
+        return x
+
+class RSI:
+    def __init__(self,n=14):
+        self.n=n; self.prev=None; self.cnt=0
+        self.ag=0.0; self.al=0.0
+
+    def _step(self,x):
+        n=self.n; ag,al,cnt=self.ag,self.al,self.cnt
+        if self.prev is None: return ag,al,cnt
+        d=x-self.prev; g=d if d>0 else 0; l=-d if d<0 else 0
+        cnt+=1
+        if cnt<=n: ag+=g/n; al+=l/n
+        else: ag=(ag*(n-1)+g)/n; al=(al*(n-1)+l)/n
+        return ag,al,cnt
+
+    def push(self,x):
+        self.ag,self.al,self.cnt=self._step(x); self.prev=x
+
+    def peek(self,x):
+        ag,al,cnt=self._step(x)
+        if cnt<self.n: return 50
+        if al==0: return 100
+        return 100-(100/(1+ag/al))
+
+class MACD:
+    def __init__(self,fast=12,slow=26,sig=9):
+        self.f=EMA(fast); self.s=EMA(slow); self.sig=EMA(sig)
+
+    def push(self,x):
+        self.f.push(x); self.s.push(x)
+        if self.s.e is not None: self.sig.push(self.f.e-self.s.e)
+
+    def peek(self,x):
+        if not self.s.ready(): return 0,0
+        m=self.f.peek(x)-self.s.peek(x)
+        return m,self.sig.peek(m)
+
+class BB:
+    def __init__(self,n=20,k=2):
+        self.n=n; self.k=k
+        self.w=deque(); self.s=0.0; self.sq=0.0; self.pushes=0
+
+    def push(self,x):
+        self.w.append(x); self.s+=x; self.sq+=x*x
+        if len(self.w)>self.n:
+            y=self.w.popleft(); self.s-=y; self.sq-=y*y
+        self.pushes+=1
+        if self.pushes%1000==0:   # shed accumulated float drift
+            self.s=sum(self.w); self.sq=sum(y*y for y in self.w)
+
+    def peek(self,x):
+        n=self.n
+        if len(self.w)+1<n: return x,x,x
+        s=self.s+x; sq=self.sq+x*x
+        if len(self.w)==n: y=self.w[0]; s-=y; sq-=y*y
+        mid=s/n; std=max(sq/n-mid*mid,0)**0.5
+        return mid+self.k*std,mid,mid-self.k*std
+
+class ATR:
+    def __init__(self,n=14):
+        self.n=n; self.pc=None; self.trs=deque(); self.s=0.0
+
+    def _tr(self,h,l): return max(h-l,abs(h-self.pc),abs(l-self.pc))
+
+    def push(self,h,l,c):
+        if self.pc is not None:
+            tr=self._tr(h,l); self.trs.append(tr); self.s+=tr
+            if len(self.trs)>self.n: self.s-=self.trs.popleft()
+        self.pc=c
+
+    def peek(self,h,l):
+        n=self.n
+        if self.pc is None or len(self.trs)+1<n: return 0
+        s=self.s+self._tr(h,l)
+        if len(self.trs)==n: s-=self.trs[0]
+        return s/n
+
+class Indicators:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.rsi=RSI(14); self.macd=MACD(); self.e20=EMA(20); self.e50=EMA(50)
+        self.bb=BB(20); self.atr=ATR(14); self.t=None
+
+    def push(self,t,h,l,c):
+        self.rsi.push(c); self.macd.push(c); self.e20.push(c); self.e50.push(c)
+        self.bb.push(c); self.atr.push(h,l,c); self.t=t
+
+    def sync(self,ring,step):
+        # commit every closed candle (all but the last ring slot) not seen yet
+        v=ring.view(); t=v['t']; last=len(t)-1
+        i=0
+        if self.t is not None:
+            while i<last and t[i]<=self.t: i+=1
+            if i<last and t[i]!=self.t+step: self.reset(); i=0
+        for j in range(i,last): self.push(t[j],v['h'][j],v['l'][j],v['c'][j])
+        return v
+
+    def peek(self,h,l,c):
+        m,ms=self.macd.peek(c)
+        bbu,bbm,bbl=self.bb.peek(c)
+        return dict(rsi=self.rsi.peek(c),macd=m,msig=ms,
+                    e20=self.e20.peek(c),e50=self.e50.peek(c),
+                    bbu=bbu,bbm=bbm,bbl=bbl,atr=self.atr.peek(h,l))
+
+# ── TRIGGER INDEX ─────────────────────────────────────────────
+# Resting TP/SL levels per symbol in two sorted arrays: 'up' levels fire at or above the price
+# (long TP, short SL), 'down' levels at or below it (long SL, short TP). A price lookup bisects
+# each side and returns only the crossed run, O(log n + k); a trailing stop is one delete and
+# one insert in its array.
+class TriggerIndex:
+    def __init__(self):
+        self.books={}     # sym -> (up levels, up ids, down levels, down ids); ids are (key, kind)
+        self.at={}        # (key, kind) -> (sym, up, level)
+
+    def __len__(self): return len(self.at)
+
+    def add(self,sym,key,kind,level,up):
+        if (key,kind) in self.at: self.remove(key,kind)
+        b=self.books.get(sym)
+        if b is None: b=self.books[sym]=([],[],[],[])
+        lv,ids=(b[0],b[1]) if up else (b[2],b[3])
+        i=bisect.bisect_right(lv,level)
+        lv.insert(i,level); ids.insert(i,(key,kind))
+        self.at[(key,kind)]=(sym,up,level)
+
+    def place(self,sym,key,side,tp,sl):
+        long=side=='LONG'
+        self.add(sym,key,'TP',tp,long); self.add(sym,key,'SL',sl,not long)
+
+    def remove(self,key,kind=None):
+        for k in (kind,) if kind else ('TP','SL'):
+            ent=self.at.pop((key,k),None)
+            if not ent: continue
+            sym,up,level=ent; b=self.books[sym]
+            lv,ids=(b[0],b[1]) if up else (b[2],b[3])
+            i=bisect.bisect_left(lv,level)
+            while ids[i]!=(key,k): i+=1          # walk the run of equal levels
+            del lv[i]; del ids[i]
+            if not (b[0] or b[2]): del self.books[sym]
+
+    def move(self,key,kind,level):
+        sym,up,_=self.at[(key,kind)]
+        self.remove(key,kind); self.add(sym,key,kind,level,up)
+
+    def hits(self,sym,price):
+        # -> [(key, kind)] crossed at this price; they stay indexed until removed
+        b=self.books.get(sym)
+        if not b: return ()
+        up,ui,dn,di=b
+        i=bisect.bisect_right(up,price); j=bisect.bisect_left(dn,price)
+        if not i and j==len(dn): return ()
+        return ui[:i]+di[j:]
+
+# ── EXECUTION ─────────────────────────────────────────────────
+# Order side effects run on a small pool so several exits go out at once and the engine
+# never sits on a round trip; results come back through a queue that the engine thread
+# drains (Agent.settle), so Agent state is still only mutated by the engine thread.
+class Executor:
+    def __init__(self,bc,workers=4):
+        self.bc=bc
+        self.pool=ThreadPoolExecutor(max_workers=workers,thread_name_prefix='exec')
+        self.done=queue.SimpleQueue()
+        self.bus=getattr(bc,'bus',None)   # wakes the engine when a result lands
+        self.inflight=0
+        self._acc=False; self._again=False
+
+    def _run(self,kind,sym,fn):
+        def job():
+            try: res=fn()
+            except Exception as e:
+                print(f"[EXEC] {kind} {sym}: {e}"); res=None
+            self._put((kind,sym,res))
+        self.inflight+=1
+        self.pool.submit(job)
+
+    def close(self,sym,side,qty,t0=None,cancel=False):
+        # qty: the locally booked size; only positions opened before it was tracked ask the exchange.
+        # cancel: the position has exchange TP/SL legs, dropped once it is flat
+        def job():
+            q=qty or self.bc.get_pos_qty(sym)
+            res=self.bc.close_position(sym,side,q,t0) if q else None
+            if res is None and self.bc.get_pos_qty(sym)==0: res={'orderId':None}   # confirmed flat
+            if res and cancel: self.bc.cancel_all(sym)
+            return res
+        self._run('close',sym,job)
+
+    def close_many(self,legs,t0=None,cancel=()):
+        # legs: [(sym, 'LONG'|'SHORT', qty)] -> futures of [(sym, result)], one batch request per 5
+        futs=[]
+        for k in range(0,len(legs),5):
+            chunk=legs[k:k+5]
+            def job(chunk=chunk):
+                # every leg counted in inflight gets exactly one result, whatever raises below
+                out=[(s,{'code':-1,'msg':'not sent'}) for s,_,_ in chunk]
+                try:
+                    qs=[]
+                    for i,(s,typ,q) in enumerate(chunk):
+                        try: q=q or self.bc.get_pos_qty(s)
+                        except Exception as e: out[i]=(s,{'code':-1,'msg':str(e)}); continue
+                        qs.append((i,s,typ,q))
+                    send=[(s,typ,q) for _,s,typ,q in qs if q]
+                    try: res=iter(self.bc.close_batch(send,t0) if send else ())
+                    except Exception as e: res=iter([{'code':-1,'msg':str(e)}]*len(send))
+                    # unsent legs: a confirmed 0 is already flat, an unreadable size is retried
+                    for i,s,_,q in qs:
+                        out[i]=(s,next(res,{'code':-1,'msg':'no result'}) if q else
+                                  {'orderId':None} if q==0 else {'code':-1,'msg':'size unknown'})
+                    for s,r in out:
+                        if s in cancel and 'orderId' in r:
+                            try: self.bc.cancel_all(s)
+                            except Exception as e: print(f"[EXEC] cancel {s}: {e}")
+                except Exception as e:
+                    print(f"[EXEC] close batch: {e}")
+                finally:
+                    for s,r in out: self._put(('close',s,r if 'orderId' in r else None))
+                return out
+            self.inflight+=len(chunk)
+            futs.append(self.pool.submit(job))
+        return futs
+
+    def _put(self,r):
+        self.done.put(r)
+        if self.bus: self.bus.publish()
+
+    def protect(self,sym,side,qty,tp,sl,t0=None,replace=False):
+        # -> ('protect', sym, (tp, sl, qty, [tp result, sl result])); replace drops the old pair first
+        def job():
+            if replace: self.bc.cancel_all(sym)
+            return tp,sl,qty,self.bc.protect(sym,side,qty,tp,sl,t0)
+        self._run('protect',sym,job)
+
+    def cancel(self,sym): self._run('cancel',sym,lambda:self.bc.cancel_all(sym))
+
+    def account(self):
+        # one balance refresh in flight at a time; a burst of closes shares it, and a close
+        # landing while one is in flight queues exactly one more
+        if self._acc: self._again=True; return
+        self._acc=True
+        self._run('account',None,lambda:self.bc.fetch_account(force=True))
+
+    def drain(self):
+        out=[]
+        while True:
+            try: r=self.done.get_nowait()
+            except queue.Empty: return out
+            self.inflight-=1
+            out.append(r)
+            if r[0]=='account':
+                self._acc=False
+                if self._again: self._again=False; self.account()
+
 # ── AI AGENT ─────────────────────────────────────────────────
 class Agent:
-    def __init__(self,bc):
+    def __init__(self,bc,params=None):
         self.bc=bc
+        self.p=dict(STRATEGY,**(params or {}))
         self.balance=0
         self.start_balance=0
+        # positions, history, pnl_curve and strategies are copy-on-write: the engine thread swaps
+        # in a new container instead of resizing the one a reader may be iterating, and a
+        # position's per-tick fields change in one dict.update() so a dict() copy is never torn
         self.positions={}
         self.history=[]
         self.trades=0
         self.wins=0
         self.pnl_curve=[]
         self.strategies={'Trend Following':1.0,'Mean Reversion':1.0,'Breakout':1.0,'Scalping':1.0}
-        self._klines_cache={}
+        self.klines=KlineStore(bc)
+        self.ex=Executor(bc)
+        self.trig=TriggerIndex()
+        self._fill_n=0; self._epoch=0  # user-stream cursors, see _reconcile
+        self._fills_wait=[]            # fills that may belong to a TP/SL pair not acknowledged yet
+        self.ind={}
+        self.clock=datetime.now      # the backtester swaps in a simulated clock
+        self.fee=0.0                 # paper fills: taker fee rate per side
+        self.slip=0.0                # paper fills: adverse slippage fraction
+        self.verbose=True
 
     def _get_klines(self,sym):
-        k=self.bc.klines(sym,'5m',60)
-        if k: self._klines_cache[sym]=k
-        return self._klines_cache.get(sym,[])
+        return self.klines.get(sym,'5m')
 
     def analyze(self,sym):
         try:
-            kl=self._get_klines(sym)
-            if len(kl)<30: return None
-            c=[k['c'] for k in kl]
-            v=[k['v'] for k in kl]
-            price=c[-1]
-            rsi=TA.rsi(c)
-            macd,msig=TA.macd(c)
-            e20,e50=TA.ema(c,20),TA.ema(c,50)
-            bbu,bbm,bbl=TA.bb(c)
-            atr=TA.atr(kl)
-            avg_v=sum(v[-20:])/20
-            vr=v[-1]/avg_v if avg_v>0 else 1
-
-            score=0; reasons=[]
-
-            # RSI
-            if rsi<25: score+=3; reasons.append(f"RSI asiri satim {rsi:.0f}")
-            elif rsi<32: score+=2; reasons.append(f"RSI satim bolgesi {rsi:.0f}")
-            elif rsi>75: score-=3; reasons.append(f"RSI asiri alim {rsi:.0f}")
-            elif rsi>68: score-=2; reasons.append(f"RSI alim bolgesi {rsi:.0f}")
-
-            # MACD
-            if macd>msig and macd>0: score+=2; reasons.append("MACD guclu yukari")
-            elif macd>msig: score+=1; reasons.append("MACD yukari donuyor")
-            elif macd<msig and macd<0: score-=2; reasons.append("MACD guclu asagi")
-            elif macd<msig: score-=1; reasons.append("MACD asagi donuyor")
-
-            # EMA
-            if price>e20>e50: score+=1; reasons.append("EMA yukari trend")
-            elif price<e20<e50: score-=1; reasons.append("EMA asagi trend")
-
-            # Bollinger
-            if price<bbl*1.001: score+=2; reasons.append("Alt Bollinger kirilmasi")
-            elif price>bbu*0.999: score-=2; reasons.append("Ust Bollinger kirilmasi")
-
-            # Volume
-            if vr>2.5: score+=1; reasons.append(f"Hacim patlamasi x{vr:.1f}")
-
-            # Pattern: hammer-like
-            body=abs(c[-1]-c[-2])
-            wick=kl[-1]['h']-kl[-1]['l']
-            if wick>0 and body/wick<0.3 and c[-1]>c[-2]: score+=1; reasons.append("Hammer formasyonu")
-
-            conf=min(abs(score)/9*100,96)
-            return dict(sym=sym,price=price,score=score,conf=conf,
-                        rsi=round(rsi,1),macd=round(macd,6),
-                        e20=round(e20,6),e50=round(e50,6),
-                        bbu=round(bbu,6),bbl=round(bbl,6),
-                        atr=round(atr,6),vr=round(vr,2),
-                        reasons=reasons,klines=kl[-40:])
+            ring=self._get_klines(sym)
+            if len(ring)<30: return None
+            return self._score(sym,ring,ring)
         except: return None
 
+    def _score(self,sym,ring,rows=None):
+        # per-symbol streaming state: each closed candle is folded in once, so the values are
+        # converged over all history seen (plus the archive), like the backtester's
+        step=INTERVAL_MS['5m']; ind=self.ind.get(sym)
+        if ind is None or (ind.t is not None and ring.first_t>ind.t+step):   # new, or the ring jumped a gap
+            ind=self.ind[sym]=self._warm(sym,ring)
+        kv=ind.sync(ring,step)
+        c=kv['c']
+        v=kv['v']
+        x=ind.peek(kv['h'][-1],kv['l'][-1],c[-1])
+        avg_v=sum(v[-20:])/20
+        x.update(price=c[-1],prev=c[-2],hi=kv['h'][-1],lo=kv['l'][-1],
+                 vr=v[-1]/avg_v if avg_v>0 else 1)
+        return self._evaluate(sym,x,rows)
+
+    def _warm(self,sym,ring,n=500):
+        # seed new indicator state with archived candles that precede the ring
+        ind=Indicators(); arc=self.klines.archive
+        if arc and len(ring):
+            step=INTERVAL_MS['5m']; first=ring.column('t')[0]
+            v=arc.read(sym,'5m',start=first-n*step,end=first-step)
+            for t,h,l,c in zip(v['t'],v['h'],v['l'],v['c']): ind.push(int(t),float(h),float(l),float(c))
+        return ind
+
+    def analyze_all(self,syms,n=60):
+        # every symbol holding a full window, read off the rings as the scanner left them (no
+        # fetch); the chart rows are only built for the picks, in decide_from
+        out=[]
+        for sym in syms:
+            r=self.klines.rings.get((sym,'5m'))
+            if r is None or len(r)<n: continue
+            try: out.append(self._score(sym,r))
+            except Exception as e: print(f"[SCAN] {sym} analyze error: {e}")
+        return out
+
+    def _evaluate(self,sym,x,ring):
+        price,rsi,macd,msig=x['price'],x['rsi'],x['macd'],x['msig']
+        e20,e50,bbu,bbl,atr,vr=x['e20'],x['e50'],x['bbu'],x['bbl'],x['atr'],x['vr']
+
+        score=0; reasons=[]; P=self.p
+
+        # RSI
+        if rsi<P['rsi_os']: score+=3; reasons.append(f"RSI asiri satim {rsi:.0f}")
+        elif rsi<P['rsi_os_weak']: score+=2; reasons.append(f"RSI satim bolgesi {rsi:.0f}")
+        elif rsi>P['rsi_ob']: score-=3; reasons.append(f"RSI asiri alim {rsi:.0f}")
+        elif rsi>P['rsi_ob_weak']: score-=2; reasons.append(f"RSI alim bolgesi {rsi:.0f}")
+
+        # MACD
+        if macd>msig and macd>0: score+=2; reasons.append("MACD guclu yukari")
+        elif macd>msig: score+=1; reasons.append("MACD yukari donuyor")
+        elif macd<msig and macd<0: score-=2; reasons.append("MACD guclu asagi")
+        elif macd<msig: score-=1; reasons.append("MACD asagi donuyor")
+
+        # EMA
+        if price>e20>e50: score+=1; reasons.append("EMA yukari trend")
+        elif price<e20<e50: score-=1; reasons.append("EMA asagi trend")
+
+        # Bollinger
+        if price<bbl*1.001: score+=2; reasons.append("Alt Bollinger kirilmasi")
+        elif price>bbu*0.999: score-=2; reasons.append("Ust Bollinger kirilmasi")
+
+        # Volume
+        if vr>2.5: score+=1; reasons.append(f"Hacim patlamasi x{vr:.1f}")
+
+        # Pattern: hammer-like
+        body=abs(price-x['prev'])
+        wick=x['hi']-x['lo']
+        if wick>0 and body/wick<0.3 and price>x['prev']: score+=1; reasons.append("Hammer formasyonu")
+
+        conf=min(abs(score)/9*100,96)
+        return dict(sym=sym,price=price,score=score,conf=conf,
+                    rsi=round(rsi,1),macd=round(macd,6),
+                    e20=round(e20,6),e50=round(e50,6),
+                    bbu=round(bbu,6),bbl=round(bbl,6),
+                    atr=round(atr,6),vr=round(vr,2),
+                    reasons=reasons,klines=ring.rows(40) if ring else None)
+
     def decide(self,sym):
         if sym in self.positions: return None
-        a=self.analyze(sym)
-        if not a: return None
-        if a['score']>=3: action='LONG'
-        elif a['score']<=-3: action='SHORT'
+        return self.decide_from(self.analyze(sym))
+
+    def decide_from(self,a):
+        if not a or a['sym'] in self.positions: return None
+        sym=a['sym']; P=self.p
+        if a['score']>=P['min_score']: action='LONG'
+        elif a['score']<=-P['min_score']: action='SHORT'
         else: return None
-        if a['conf']<45: return None
+        if a['conf']<P['min_conf']: return None
         strat=self._pick_strat()
-        lev=random.choice([2,3,5])
+        lev=random.choice(P['levs'])
         return dict(action=action,sym=sym,price=a['price'],
                     conf=a['conf'],reasons=a['reasons'],strat=strat,
                     lev=lev,atr=a['atr'],ind=dict(
                         rsi=a['rsi'],macd=a['macd'],e20=a['e20'],
                         e50=a['e50'],bbu=a['bbu'],bbl=a['bbl'],vr=a['vr']),
-                    klines=a['klines'])
+                    klines=a['klines'] if a['klines'] is not None else self.klines.ring(sym,'5m').rows(40))
 
     def _pick_strat(self):
         t=sum(self.strategies.values()); r=random.uniform(0,t); c=0
@@ -360,185 +1794,557 @@ class Agent:
             if r<=c: return s
         return 'Trend Following'
 
-    def open(self,d):
+    def open(self,d,res=None):
+        # res: the entry's exchange result when it already went out in a batch
         if self.balance<=0: return   # bakiye yoksa açma
         p,lev=d['price'],d['lev']
-        margin=self.balance*0.08
-        sz=margin*lev
-        if d['action']=='LONG':
-            tp=p*(1+0.018*lev/3); sl=p*(1-0.007*lev/3)
-        else:
-            tp=p*(1-0.018*lev/3); sl=p*(1+0.007*lev/3)
-        live=False
+        margin=self.balance*self.p['margin']
+        live=False; qty=0.0
         if getattr(self.bc,'api_key',None):
             side='BUY' if d['action']=='LONG' else 'SELL'
-            res=self.bc.place_order(d['sym'],side,margin,lev)
-            if res:
+            if res is None: res=self.bc.place_order(d['sym'],side,margin,lev,d.get('tick'))
+            if res and 'orderId' in res:
                 live=True
+                lev=res.get('lev',lev)   # the exchange clamps to the symbol's leverage bracket
                 ap=float(res.get('avgPrice',0) or 0)
                 if ap>0: p=ap
-        self.positions[d['sym']]=dict(
+                qty=float(res.get('executedQty',0) or 0) or float(res.get('origQty',0) or 0)
+        elif self.slip:
+            p*=1+self.slip if d['action']=='LONG' else 1-self.slip
+        sz=margin*lev
+        # live levels hang off the fill, so the exchange legs cannot be through the market already
+        e=p if live else d['price']
+        ft=self.p['tp']*lev/3; fs=self.p['sl']*lev/3
+        if d['action']=='LONG':
+            tp=e*(1+ft); sl=e*(1-fs)
+        else:
+            tp=e*(1-ft); sl=e*(1+fs)
+        self.positions={**self.positions,d['sym']:dict(
             type=d['action'],entry=p,cur=p,tp=tp,sl=sl,sz=sz,margin=margin,
             lev=lev,pnl=0,pnl_pct=0,strat=d['strat'],
             reasons=d['reasons'],ind=d['ind'],
             klines=d.get('klines',[]),
-            t0=datetime.now().isoformat(),
-            conf=d['conf'],max_pnl=0,min_pnl=0,live=live)
+            t0=self.clock().isoformat(),
+            conf=d['conf'],max_pnl=0,min_pnl=0,live=live,qty=qty,trail=self.p['trail']*lev/3)}
+        self.trig.place(d['sym'],d['sym'],d['action'],tp,sl)
+        if live and qty: self._protect(d['sym'],d.get('tick'))
+
+    def _protect(self,sym,t0=None,replace=False):
+        # TP/SL as reduce-only orders on the exchange; until they are acknowledged the local
+        # checks in update() still cover the position
+        pos=self.positions[sym]
+        pos['prot']=None; pos['prot_wait']=True
+        self.ex.protect(sym,pos['type'],pos['qty'],pos['tp'],pos['sl'],t0,replace)
+
+    def _protected(self,sym,pos,res):
+        tp,sl,qty,legs=res or (0,0,0,[])
+        ok=len(legs)==2 and all('orderId' in x for x in legs)
+        if pos: pos.pop('prot_wait',None)
+        if not ok or not pos or pos.get('closing'):
+            if any('orderId' in x for x in legs): self.ex.cancel(sym)    # orphaned or half-placed pair
+            if pos and not ok and self.verbose: print(f"[TP/SL ERR] {sym}: yerel takip")
+            return
+        pos['prot']=dict(tp=legs[0]['orderId'],sl=legs[1]['orderId'],tp_px=tp,sl_px=sl,qty=qty)
+
+    def _reconcile(self):
+        # exchange-side exits: TP/SL fills off the user stream, and after a resync, protected
+        # positions the snapshot shows flat (closed by a trade the stream never delivered)
+        book=getattr(self.bc,'book',None)
+        if not (book and book.synced): return
+        fills,self._fill_n=book.since(self._fill_n)
+        wait=[]
+        for f in self._fills_wait+fills:
+            pos=self.positions.get(f['sym'])
+            if not pos or f['status']!='FILLED': continue
+            pr=pos.get('prot')
+            if pr:
+                if f['id'] in (pr['tp'],pr['sl']):
+                    self._exch_close(f['sym'],'TP' if f['id']==pr['tp'] else 'SL',f['avg'])
+            elif pos.get('prot_wait'): wait.append(f)   # the pair's ack comes through settle(); retry then
+        self._fills_wait=wait
+        if book.epoch!=self._epoch:
+            self._epoch=book.epoch
+            for sym,pos in list(self.positions.items()):
+                if pos.get('prot') and not book.holds(sym):
+                    p=self.bc.price(sym) or pos['cur']
+                    why='TP' if abs(p-pos['tp'])<abs(p-pos['sl']) else 'SL'
+                    self._exch_close(sym,why,pos[why.lower()])
+
+    def _exch_close(self,sym,why,px):
+        pos=self.positions[sym]
+        pct,pnl=self._pnl(pos,px); pos.update(cur=px,pnl_pct=pct,pnl=pnl)
+        self.balance+=pos['pnl']          # estimate until the wallet comes back
+        self._book(sym,why)
+        self.ex.cancel(sym)               # the other leg
+        self.ex.account()
+
+    def open_many(self,ds):
+        # several entries from one scan: live ones go out as batchOrders, 5 per request
+        if len(ds)<2 or not getattr(self.bc,'api_key',None) or self.balance<=0:
+            for d in ds: self.open(d)
+            return
+        m=self.balance*self.p['margin']
+        res=self.bc.place_batch([(d['sym'],'BUY' if d['action']=='LONG' else 'SELL',m,d['lev']) for d in ds],
+                                ds[0].get('tick'))
+        for d,r in zip(ds,res): self.open(d,r)
+
+    def flatten(self,t0=None):
+        # close everything in as few round trips as possible -> (paper legs, futures of live legs)
+        t0=t0 or time.perf_counter()
+        live=bool(getattr(self.bc,'api_key',None))
+        paper=[s for s,p in self.positions.items() if not (live and p.get('live'))]
+        for s in paper: self.close(s,'Flatten')
+        legs=[(s,p['type'],p.get('qty')) for s,p in self.positions.items() if not p.get('closing')]
+        for s,_,_ in legs: self.positions[s]['closing']='Flatten'
+        prot={s for s,_,_ in legs if self.positions[s].get('prot')}
+        return [(s,{'paper':True}) for s in paper],self.ex.close_many(legs,t0,prot)
 
-    def update(self):
+    @staticmethod
+    def _pnl(pos,p):
+        m=pos['lev']
+        pct=((p-pos['entry'])/pos['entry']*100*m) if pos['type']=='LONG' else ((pos['entry']-p)/pos['entry']*100*m)
+        return pct,pos['sz']*pct/100
+
+    def settle(self):
+        # apply finished executor work; runs on the engine thread
+        for kind,sym,res in self.ex.drain():
+            if kind=='account':
+                if res and res['wallet']>0 and not self.ex.inflight: self.balance=res['wallet']
+                continue
+            pos=self.positions.get(sym)
+            if kind=='protect': self._protected(sym,pos,res)
+            if kind!='close' or not pos: continue
+            if res and 'orderId' in res:
+                ap=float(res.get('avgPrice',0) or 0)
+                if ap>0:
+                    pct,pnl=self._pnl(pos,ap); pos.update(cur=ap,pnl_pct=pct,pnl=pnl)
+                self.balance+=pos['pnl']          # estimate until the wallet comes back
+                self._book(sym,pos.pop('closing'))
+                self.ex.account()
+            else:
+                why=pos.pop('closing',None)       # next update retries the exit
+                if self.verbose: print(f"[CLOSE RETRY] {sym} {why}")
+        self._reconcile()
+
+    def update(self,syms=None,t0=None):
+        # syms: only these prices moved (the event loop); None checks every position.
+        # t0: when the triggering price arrived
+        self.settle()
+        t0=t0 or time.perf_counter()
         close=[]
-        live_pnl=self.bc.fetch_live_pnl() if any(p.get('live') for p in self.positions.values()) else {}
-        for sym,pos in self.positions.items():
+        P=self.positions
+        todo=P.items() if syms is None else [(s,P[s]) for s in syms if s in P]   # O(moved), not O(open)
+        live_pnl=self.bc.fetch_live_pnl() if any(p.get('live') for _,p in todo) else {}
+        book=getattr(self.bc,'book',None); exch=bool(book and book.synced)
+        for sym,pos in todo:
+            if pos.get('closing'): continue
             try:
                 p=self.bc.price(sym)
                 if p==0: continue
                 if pos.get('live') and sym in live_pnl:
                     ld=live_pnl[sym]
+                    if exch and ld['qty']: pos['qty']=ld['qty']   # the book is current; a REST poll may not be
                     pnl=ld['pnl']
                     if ld['entry']>0: pos['entry']=ld['entry']
                     p=ld['mark'] if ld['mark']>0 else p
                     pct=(pnl/pos['sz']*100) if pos['sz']>0 else 0
                 else:
-                    m=pos['lev']
-                    pct=((p-pos['entry'])/pos['entry']*100*m) if pos['type']=='LONG' else ((pos['entry']-p)/pos['entry']*100*m)
-                    pnl=pos['sz']*pct/100
-                pos['cur']=p; pos['pnl']=pnl; pos['pnl_pct']=pct
-                pos['max_pnl']=max(pos['max_pnl'],pnl)
-                pos['min_pnl']=min(pos['min_pnl'],pnl)
-                if pos['type']=='LONG':
-                    if p>=pos['tp']: close.append((sym,'TP'))
-                    elif p<=pos['sl']: close.append((sym,'SL'))
-                else:
-                    if p<=pos['tp']: close.append((sym,'TP'))
-                    elif p>=pos['sl']: close.append((sym,'SL'))
+                    pct,pnl=self._pnl(pos,p)
+                pos.update(cur=p,pnl=pnl,pnl_pct=pct,max_pnl=max(pos['max_pnl'],pnl),
+                           min_pnl=min(pos['min_pnl'],pnl))
+                if pos['trail']: self._trail(sym,pos,p)
+                pr=pos.get('prot')
+                if pr:
+                    if (pr['tp_px'],pr['sl_px'],pr['qty'])!=(pos['tp'],pos['sl'],pos['qty']):
+                        self._protect(sym,t0,replace=True)
+                    elif exch: continue      # the exchange owns the exit, _reconcile books the fill
+                hit=self.trig.hits(sym,p)
+                if hit: close.append((sym,hit[0][1]))
             except: pass
-        for sym,why in close: self.close(sym,why)
-
-    def close(self,sym,why='Manual'):
+        for sym,why in close: self.close(sym,why,t0)
+
+    def _trail(self,sym,pos,p):
+        # ratchet the stop behind the best price in steps of a quarter of the distance, so a
+        # protected position replaces its exchange SL a handful of times rather than per tick
+        tr=pos['trail']; long=pos['type']=='LONG'
+        s=p*(1-tr) if long else p*(1+tr)
+        if (s-pos['sl'] if long else pos['sl']-s)>=p*tr/4:
+            pos['sl']=s; self.trig.move(sym,'SL',s)
+
+    def close(self,sym,why='Manual',t0=None):
+        # live exits are submitted and booked later by settle(); paper exits book now
         if sym not in self.positions: return
         pos=self.positions[sym]
         if pos.get('live') and getattr(self.bc,'api_key',None):
-            qty=self.bc.get_pos_qty(sym)
-            if qty>0: self.bc.close_position(sym,pos['type'],qty)
-            time.sleep(1)
-            acc=self.bc.fetch_account(force=True)
-            self.balance=acc['wallet'] if acc and acc['wallet']>0 else self.balance+pos['pnl']
-        else:
-            self.balance+=pos['pnl']
+            if pos.get('closing'): return
+            pos['closing']=why
+            self.ex.close(sym,pos['type'],pos.get('qty'),t0,cancel=bool(pos.get('prot')))
+            return
+        if self.fee or self.slip: self._paper_fill(pos)
+        self.balance+=pos['pnl']
+        self._book(sym,why)
+
+    def _book(self,sym,why):
+        pos=self.positions[sym]
         self.trades+=1
         won=pos['pnl']>0
         if won: self.wins+=1
         s=pos['strat']
-        self.strategies[s]=min(3.0,self.strategies[s]+(0.15 if won else -0.05))
-        self.strategies[s]=max(0.1,self.strategies[s])
-        delta=datetime.now()-datetime.fromisoformat(pos['t0'])
+        self.strategies={**self.strategies,s:max(0.1,min(3.0,self.strategies[s]+(0.15 if won else -0.05)))}
+        now=self.clock()
+        delta=now-datetime.fromisoformat(pos['t0'])
         secs=delta.total_seconds()
         ht=f"{int(secs)}s" if secs<60 else f"{int(secs/60)}m" if secs<3600 else f"{int(secs/3600)}h"
         rec=dict(id=self.trades,sym=sym,type=pos['type'],
                  entry=pos['entry'],exit=pos['cur'],tp=pos['tp'],sl=pos['sl'],
                  pnl=round(pos['pnl'],2),pnl_pct=round(pos['pnl_pct'],2),
                  lev=pos['lev'],strat=pos['strat'],reasons=pos['reasons'],
-                 why=why,time=datetime.now().strftime('%H:%M:%S'),
+                 why=why,time=now.strftime('%H:%M:%S'),
                  ht=ht,won=won)
-        self.history.insert(0,rec)
-        if len(self.history)>100: self.history.pop()
-        self.pnl_curve.append(round(self.balance,2))
-        if len(self.pnl_curve)>80: self.pnl_curve.pop(0)
-        del self.positions[sym]
+        self.history=[rec]+self.history[:99]
+        self.pnl_curve=self.pnl_curve[-79:]+[round(self.balance,2)]
+        self.positions={k:p for k,p in self.positions.items() if k!=sym}
+        self.trig.remove(sym)
         tag="WIN" if won else "LOSS"
-        print(f"[{tag}] {sym} {pos['type']} | ${pos['pnl']:.2f} ({pos['pnl_pct']:.2f}%) | {why}")
+        if self.verbose: print(f"[{tag}] {sym} {pos['type']} | ${pos['pnl']:.2f} ({pos['pnl_pct']:.2f}%) | {why}")
+
+    def _paper_fill(self,pos):
+        # exit at the last price less slippage, both sides pay the taker fee
+        long=pos['type']=='LONG'
+        x=pos['cur']*(1-self.slip if long else 1+self.slip)
+        m=pos['lev']; e=pos['entry']
+        pct=((x-e)/e*100*m) if long else ((e-x)/e*100*m)
+        pos.update(cur=x,pnl_pct=pct,pnl=pos['sz']*pct/100-self.fee*pos['sz']*(1+x/e))
 
     def wr(self): return (self.wins/self.trades*100) if self.trades>0 else 50.0
     def total_pnl(self): return round(self.balance-self.start_balance,2)
 
+# ── SCANNER ───────────────────────────────────────────────────
+# Every cycle: refresh the stalest rings within a request-weight budget on a bounded
+# pool, analyze the whole universe in one batch pass, return the ranked top-N entries.
+class Scanner:
+    def __init__(self,agent,workers=8,budget=200,top_n=4):
+        self.agent=agent
+        self.budget=budget
+        self.top_n=top_n
+        self.pool=ThreadPoolExecutor(max_workers=workers,thread_name_prefix='scan')
+        self.last={}
+        self.cycles=0
+
+    def _refresh(self,sym):
+        try: self.agent.klines.refresh(sym,'5m')
+        except Exception as e: print(f"[SCAN] {sym} refresh error: {e}")
+
+    def cycle(self):
+        t0=time.perf_counter()
+        ag=self.agent; store=ag.klines; syms=list(ag.bc.symbols)
+        due=sorted((s for s in syms if store.due(s,'5m')),key=lambda s:store.ring(s,'5m').fetched)
+        w=store.weight(store.cap)
+        budget=min(self.budget,ag.bc.limiter.headroom('scan')) if hasattr(ag.bc,'limiter') else self.budget
+        batch=due[:max(0,budget//w)]
+        list(self.pool.map(self._refresh,batch))
+        fresh=set(batch)
+        for s in syms:
+            if s not in fresh: store.ring(s,'5m').tick(ag.bc.price(s))
+        t1=time.perf_counter()
+        res=ag.analyze_all(syms,store.cap)
+        t2=time.perf_counter()
+        ranked=sorted((a for a in res if a),key=lambda a:(abs(a['score']),a['conf']),reverse=True)
+        picks=[]
+        for a in ranked:
+            d=ag.decide_from(a)
+            if d: d['tick']=t0; picks.append(d)
+            if len(picks)>=self.top_n: break
+        self.cycles+=1
+        self.last=dict(cycle=self.cycles,syms=len(syms),due=len(due),fetched=len(batch),
+                       weight=len(batch)*w,analyzed=len(res),signals=len(picks),
+                       fetch_ms=round((t1-t0)*1000,1),analyze_ms=round((t2-t1)*1000,1),
+                       total_ms=round((time.perf_counter()-t0)*1000,1),
+                       top=[(a['sym'],a['score']) for a in ranked[:5]])
+        l=self.last
+        print(f"[SCAN] {l['analyzed']}/{l['syms']} syms | fetch {l['fetched']} in {l['fetch_ms']}ms "
+              f"| analyze {l['analyze_ms']}ms | {l['signals']} signals")
+        return picks
+
+# ── SNAPSHOT ──────────────────────────────────────────────────
+# Immutable, pre-serialized /api/status payload; the engine swaps in a new one per tick.
+Snapshot=namedtuple('Snapshot','version etag body gz ts')
+
+# ── STREAM HUB ────────────────────────────────────────────────
+# Server-Sent Events fan-out: one delta per published snapshot version, kept in a short
+# window so reconnecting clients (Last-Event-ID) replay deltas instead of a full snapshot.
+class StreamHub:
+    def __init__(self,keep=300):
+        self.deltas=deque(maxlen=keep)
+        self.version=0
+        self._cv=threading.Condition()
+
+    def push(self,version,delta=None):
+        # delta None: a snapshot with nothing to diff against (the first one) -- clients that
+        # hold it are current, so the hub's version must still follow it
+        msg=delta is not None and b'id: %d\nevent: delta\ndata: %s\n\n'%(version,json.dumps(delta,separators=(',',':')).encode())
+        with self._cv:
+            if msg: self.deltas.append((version,msg))
+            else: self.deltas.clear()
+            self.version=version
+            self._cv.notify_all()
+
+    @staticmethod
+    def full(snap): return b'id: %d\nevent: snap\ndata: %s\n\n'%(snap.version,snap.body)
+
+    def since(self,last,snapshot,timeout=15):
+        # -> (messages, new_last); empty messages means keepalive
+        with self._cv:
+            if last is not None and last>self.version: last=None   # server restarted
+            if last is not None and last>=self.version: self._cv.wait(timeout)
+            if last is not None and last>=self.version: return [],last
+            if last is not None and self.deltas and self.deltas[0][0]<=last+1:
+                msgs=[m for v,m in self.deltas if v>last]
+                return msgs,self.version
+        snap=snapshot()
+        return [self.full(snap)],snap.version
+
 # ── ENGINE ────────────────────────────────────────────────────
 class Engine:
     def __init__(self):
         print("Connecting to Binance...")
-        self.bc=BinanceClient()
-        self.agent=Agent(self.bc)
+        self.bc=BinanceClient(market_pool=int(os.environ.get('BOT_POOL_MARKET',16)),
+                              trade_pool=int(os.environ.get('BOT_POOL_TRADE',4)),
+                              rules_path=os.environ.get('BOT_RULES_CACHE'))
+        self.bc.start_rules_refresh(int(os.environ.get('BOT_RULES_EVERY',3600)))
+        if os.environ.get('BOT_WS_BASE'): self.bc.WS_BASE=os.environ['BOT_WS_BASE']
+        self.archive=KlineArchive(os.environ['BOT_ARCHIVE']) if os.environ.get('BOT_ARCHIVE') else None
+        self.stream=MarketStream(self.bc) if os.environ.get('BOT_STREAM','1')!='0' else None
+        self.user=UserStream(self.bc) if os.environ.get('BOT_STREAM','1')!='0' else None
+        params=None
+        if os.environ.get('BOT_PARAMS'):          # e.g. the best set written by optimize.py --out
+            with open(os.environ['BOT_PARAMS']) as f: params=json.load(f)
+        self.agent=Agent(self.bc,params)
+        self.agent.klines.archive=self.archive
+        self.scanner=Scanner(self.agent,workers=int(os.environ.get('BOT_SCAN_WORKERS',8)),
+                             budget=int(os.environ.get('BOT_SCAN_BUDGET',200)),
+                             top_n=int(os.environ.get('BOT_SCAN_TOP',4)))
+        self.scan_every=float(os.environ.get('BOT_SCAN_EVERY',15))
         self.running=False
         self.tick=0
-        self.events=[]
+        self.events=()                # newest first; log() swaps in a new tuple
+        self._ev_lk=threading.Lock()  # log() runs on the engine, scan and HTTP threads
+        self.snap=None
+        self.hub=StreamHub()
+        self._ev_id=0
+        self._last_state=None
+        self._pub_lk=threading.Lock()
+        self.lk=threading.RLock()     # held for trading work, never across a wait or a scan fetch
+        self._dirty=threading.Event() # state changed since the last publish
 
     def log(self,msg,lvl='info'):
-        self.events.insert(0,{'t':datetime.now().strftime('%H:%M:%S'),'msg':msg,'lvl':lvl})
-        if len(self.events)>300: self.events.pop()
+        with self._ev_lk:
+            self._ev_id+=1
+            ev={'id':self._ev_id,'t':datetime.now().strftime('%H:%M:%S'),'msg':msg,'lvl':lvl}
+            self.events=(ev,)+self.events[:299]
+        self._dirty.set()
 
     def start(self):
         self.running=True
         self.log("Bot baslatildi","success")
+        if self.stream: self.stream.start()
+        if self.user: self.user.start()
         threading.Thread(target=self._bg_prices,daemon=True).start()
         threading.Thread(target=self._bg_tickers,daemon=True).start()
+        threading.Thread(target=self._bg_publish,daemon=True).start()
+        threading.Thread(target=self._bg_scan,daemon=True).start()
         print(f"\n{'─'*50}\nBot Started | ${self.agent.balance:.0f} | {len(self.bc.symbols)} pairs\n{'─'*50}\n")
+        self.publish(network=False)
+        # exits run off price events for the symbols that moved; the 1 s timeout only keeps
+        # settle() going while nothing ticks
         while self.running:
             try:
-                self.agent.update()
-                if self.tick%5==0:
-                    syms=random.sample(self.bc.symbols,min(4,len(self.bc.symbols)))
-                    for s in syms:
-                        d=self.agent.decide(s)
-                        if d and len(self.agent.positions)<6:
-                            self.agent.open(d)
-                            self.log(f"{s} {d['action']} @ ${d['price']:.4f} | Guven {d['conf']:.0f}% | {', '.join(d['reasons'][:2])}","trade")
+                moved,t0=self.bc.bus.take(1.0)
+                with self.lk: self.agent.update(moved,t0)
                 self.tick+=1
-                time.sleep(3)
+                if t0 is not None: self._dirty.set()
             except Exception as e:
                 print(f"tick error: {e}")
-                time.sleep(3)
+                time.sleep(1)
+
+    def _bg_scan(self):
+        # entries on their own cadence; the fetch/analyze half runs outside the trading lock
+        while self.running:
+            t=time.time()
+            try:
+                picks=self.scanner.cycle()
+                with self.lk:
+                    ag=self.agent
+                    picks=[d for d in picks if d['sym'] not in ag.positions][:max(0,ag.p['max_pos']-len(ag.positions))]
+                    ag.open_many(picks)
+                    for d in picks:
+                        if d['sym'] in ag.positions:
+                            self.log(f"{d['sym']} {d['action']} @ ${d['price']:.4f} | Guven {d['conf']:.0f}% | {', '.join(d['reasons'][:2])}","trade")
+                self._dirty.set()
+            except Exception as e:
+                print(f"scan error: {e}")
+            time.sleep(max(1,self.scan_every-(time.time()-t)))
 
     def stop(self):
         self.running=False
+        if self.stream: self.stream.stop()
+        if self.user: self.user.stop()
+        self.bc.bus.publish()
         self.log("Bot durduruldu","warn")
+        self.publish(network=False)
+
+    def flatten(self,timeout=15):
+        # close every position; -> per-leg results once the exchange has answered
+        t0=time.perf_counter()
+        with self.lk: paper,futs=self.agent.flatten(t0)
+        legs=[]
+        for f in futs:
+            try: legs+=f.result(timeout)
+            except Exception as e: legs.append(('?',{'code':-1,'msg':str(e)}))
+        if not self.running:
+            with self.lk: self.agent.settle()
+        out=[dict(sym=s,ok=True,paper=True) for s,_ in paper]
+        for s,r in legs:
+            ok='orderId' in r
+            out.append(dict(sym=s,ok=ok,price=float(r.get('avgPrice',0) or 0) if ok else None,
+                            msg=None if ok else r.get('msg','?')))
+        n=sum(1 for x in out if x['ok'])
+        self.log(f"Flatten: {n}/{len(out)} pozisyon kapatildi | {len(futs)} istek | {(time.perf_counter()-t0)*1000:.0f}ms",
+                 "warn" if n<len(out) else "success")
+        for x in out:
+            if not x['ok']: self.log(f"Flatten {x['sym']}: {x['msg']}","error")
+        self.publish(network=False)
+        return dict(ok=n==len(out),legs=out,requests=len(futs),ms=round((time.perf_counter()-t0)*1000,1))
+
+    def _streaming(self): return bool(self.stream and self.stream.healthy)
 
     def _bg_prices(self):
         while self.running:
-            self.bc.refresh_prices(); time.sleep(6)
+            if not self._streaming(): self.bc.refresh_prices()
+            time.sleep(6)
 
     def _bg_tickers(self):
         while self.running:
-            self.bc.refresh_tickers(); time.sleep(25)
+            if not self._streaming(): self.bc.refresh_tickers()
+            time.sleep(25)
+
+    def _bg_publish(self):
+        # pushes for SSE clients when something changed, at most every 0.5 s; the account
+        # refresh (network) rides along every 3 s
+        net=0
+        while self.running:
+            self._dirty.wait(); self._dirty.clear()
+            if not self.running: break
+            try:
+                now=time.time()
+                self.publish(network=now-net>=3)
+                if now-net>=3: net=now
+            except Exception as e: print(f"publish error: {e}")
+            time.sleep(0.5)
+
+    def publish(self,network=True):
+        st=self.state(network)
+        body=json.dumps(st,separators=(',',':')).encode()
+        etag='"%s"'%hashlib.blake2b(body,digest_size=10).hexdigest()
+        with self._pub_lk:
+            cur=self.snap
+            if cur and cur.etag==etag: return cur
+            snap=Snapshot(cur.version+1 if cur else 1,etag,body,gzip.compress(body,5),time.time())
+            prev=self._last_state
+            self.snap=snap; self._last_state=st
+            self.hub.push(snap.version,None if prev is None else self._delta(prev,st))
+        return snap
 
-    def state(self):
+    @staticmethod
+    def _delta(prev,cur):
+        d={}
+        scal={k:v for k,v in cur.items()
+              if k not in ('coins','positions','history','events') and prev.get(k)!=v}
+        if scal: d['set']=scal
+        pc,cc=prev.get('coins',{}),cur.get('coins',{})
+        ch={s:c for s,c in cc.items() if pc.get(s)!=c}
+        if ch: d['coins']=ch
+        gone=[s for s in pc if s not in cc]
+        if gone: d['coins_del']=gone
+        pp,cp=prev.get('positions',{}),cur.get('positions',{})
+        pos={}
+        for s,p in cp.items():
+            o=pp.get(s)
+            if o is None: pos[s]=p
+            else:
+                f={k:v for k,v in p.items() if o.get(k)!=v}
+                if f: pos[s]=f
+        if pos: d['pos']=pos
+        gone=[s for s in pp if s not in cp]
+        if gone: d['pos_del']=gone
+        for key in ('history','events'):
+            old=prev.get(key) or []
+            top=old[0]['id'] if old else 0
+            new=[r for r in cur.get(key) or [] if r['id']>top]
+            if new: d[key]=new
+        return d
+
+    def snapshot(self):
+        # readers only take the published reference; rebuild (without network) when idle
+        s=self.snap
+        if s is None or (not self.running and time.time()-s.ts>3): s=self.publish(network=False)
+        return s
+
+    def metrics(self):
+        return dict(http=self.bc.http.stats(),limiter=self.bc.limiter.stats(),orders=self.bc.order_stats(),
+                    scan=self.scanner.last,klines=self.agent.klines.stats,
+                    loop=dict(ticks=self.tick,price_events=self.bc.bus.events),
+                    stream=dict(healthy=self._streaming(),msgs=self.stream.msgs,
+                                reconnects=self.stream.reconnects) if self.stream else None,
+                    user=dict(healthy=self.user.healthy,msgs=self.user.msgs,reconnects=self.user.reconnects,
+                              resyncs=self.user.resyncs) if self.user else None)
+
+    def state(self,network=True):
+        # lock-free: every shared container is copy-on-write, so taking each reference once
+        # gives a map that no writer will resize or edit while this runs
+        ag=self.agent; tk=self.bc.ticker; P=ag.positions
         coins={}
         for s in self.bc.symbols:
-            t=self.bc.info(s)
+            t=tk.get(s,{})
             if t.get('price',0)>0:
                 coins[s]=dict(price=t.get('price',0),change=round(t.get('change',0),2),
                               volume=t.get('volume',0),high=t.get('high',0),low=t.get('low',0))
         pos_out={}
-        for s,p in self.agent.positions.items():
+        for s,p in P.items():
+            p=dict(p)    # one atomic copy: this tick's cur/pnl/pnl_pct together
             pos_out[s]=dict(type=p['type'],entry=p['entry'],cur=p['cur'],
                             tp=p['tp'],sl=p['sl'],sz=p['sz'],lev=p['lev'],
                             margin=round(p.get('margin',p['sz']/max(p['lev'],1)),2),
                             pnl=round(p['pnl'],2),pnl_pct=round(p['pnl_pct'],2),
                             strat=p['strat'],reasons=p['reasons'],ind=p['ind'],
-                            t0=p['t0'],conf=p['conf'],live=p.get('live',False),
+                            t0=p['t0'],conf=p['conf'],live=p.get('live',False),closing=bool(p.get('closing')),prot=bool(p.get('prot')),
                             klines=p['klines'][-30:])
-        acc=self.bc.fetch_account()
-        unrealized=round(sum(p['pnl'] for p in self.agent.positions.values()),2)
+        # the user-stream book is local, so read it even when the caller must not block
+        acc=self.bc.fetch_account() if network or (self.user and self.user.healthy) else getattr(self.bc,'_acc',None)
+        unrealized=round(sum(p['pnl'] for p in P.values()),2)
         if acc and acc.get('unrealized') is not None:
             unrealized=round(acc['unrealized'],2)
-        bal=round(self.agent.balance,2)
-        sb=round(self.agent.start_balance,2)
+        bal=round(ag.balance,2)
+        sb=round(ag.start_balance,2)
         pct=round((bal-sb)/sb*100,2) if sb>0 else 0
         return dict(
             balance=bal,
             start_balance=sb,
             unrealized_pnl=unrealized,
             equity=round(bal+unrealized,2),
-            total_pnl=self.agent.total_pnl(),
+            total_pnl=round(bal-sb,2),
             total_pnl_pct=pct,
-            trades=self.agent.trades,wins=self.agent.wins,
-            wr=round(self.agent.wr(),1),
-            active=len(self.agent.positions),
+            trades=ag.trades,wins=ag.wins,
+            wr=round(ag.wr(),1),
+            active=len(P),
             positions=pos_out,
-            history=self.agent.history[:40],
-            strategies=self.agent.strategies,
+            history=ag.history[:40],
+            strategies=ag.strategies,
             coins=coins,
             running=self.running,
-            curve=self.agent.pnl_curve,
-            events=self.events[:60],
+            curve=ag.pnl_curve,
+            events=list(self.events[:60]),
+            scan=self.scanner.last,
             conn=dict(
                 has_key=bool(getattr(self.bc,'api_key',None)),
                 wallet=acc['wallet'] if acc else None,
@@ -547,15 +2353,8 @@ class Engine:
             ),
         )
 
-# ── HTML ─────────────────────────────────────────────────────
-HTML = r"""<!DOCTYPE html>
-<html lang="tr">
-<head>
-<meta charset="UTF-8">
-<title>AI Trading Bot v4</title>
-<link href="https://fonts.googleapis.com/css2?family=IBM+Plex+Mono:wght@300;400;500;600;700&family=Bebas+Neue&display=swap" rel="stylesheet">
-<style>
-*{margin:0;padding:0;box-sizing:border-box}
+# ── DASHBOARD ASSETS ──────────────────────────────────────────
+CSS = r"""*{margin:0;padding:0;box-sizing:border-box}
 :root{
   --bg:#040810;--s1:#080f1e;--s2:#0c1628;--s3:#101d33;
   --b:#162035;--b2:#1e2d47;
@@ -777,204 +2576,18 @@ header{background:var(--s1);border-bottom:1px solid var(--b);
 .ms{background:var(--s2);border:1px solid var(--b);border-radius:3px;padding:10px}
 .ms-l{font-size:9px;color:var(--dim);letter-spacing:1px;margin-bottom:4px;text-transform:uppercase}
 .ms-v{font-size:14px;font-weight:700}
-#modal-cv{width:100%;border-radius:3px;display:block}
-
-/* EMPTY */
-.empty{padding:32px;text-align:center;color:var(--dim);font-size:11px;letter-spacing:1px}
-
-/* TOOLTIP */
-.tooltip{position:fixed;background:var(--s2);border:1px solid var(--b2);
-  border-radius:3px;padding:6px 10px;font-size:10px;pointer-events:none;
-  z-index:200;display:none;line-height:1.6}
-</style>
-</head>
-<body>
-
-<!-- CONN BAR -->
-<div style="background:#0a0f1a;border-bottom:1px solid #1a2744;padding:5px 20px;display:flex;align-items:center;gap:14px;font-size:10px;letter-spacing:.5px;flex-wrap:wrap">
-  <div style="display:flex;align-items:center;gap:6px">
-    <div id="c-dot" style="width:7px;height:7px;border-radius:50%;background:#ff3366"></div>
-    <span id="c-status" style="color:#4a6a8a">Bağlanıyor...</span>
-  </div>
-  <span style="color:#1a2744">|</span>
-  <span style="color:#4a6a8a">Bakiye: <b id="c-bal" style="color:#e0e8f0">--</b></span>
-  <span style="color:#1a2744">|</span>
-  <span style="color:#4a6a8a">Unrealized: <b id="c-unr" style="color:#e0e8f0">--</b></span>
-  <span style="color:#1a2744">|</span>
-  <span id="c-api" style="color:#f0b429">● API KEY GİRİLMEDİ</span>
-  <button onclick="document.getElementById('api-modal').style.display='flex'"
-    style="margin-left:auto;padding:3px 12px;border:1px solid #00d4ff;border-radius:2px;
-    background:none;color:#00d4ff;font-family:monospace;font-size:9px;font-weight:700;
-    letter-spacing:1.5px;cursor:pointer">⚙ API AYARLA</button>
-</div>
-
-<!-- TICKER -->
-<div class="ticker-wrap">
-  <div class="ticker-inner" id="ticker"></div>
-</div>
-
-<!-- API MODAL -->
-<div id="api-modal" style="display:none;position:fixed;inset:0;background:rgba(0,0,0,.85);
-  z-index:2000;align-items:center;justify-content:center">
-  <div style="background:#0d1421;border:1px solid #1a2744;border-radius:4px;width:420px;max-width:95vw;padding:24px">
-    <div style="font-family:'Orbitron',monospace;font-size:18px;letter-spacing:3px;color:#00d4ff;margin-bottom:16px">API BAĞLANTISI</div>
-    <div style="font-size:10px;color:#4a6a8a;line-height:1.7;margin-bottom:14px;
-      background:rgba(0,212,255,.04);border:1px solid rgba(0,212,255,.1);border-radius:3px;padding:10px">
-      <b>Binance Futures Testnet</b> API anahtarlarını gir.<br>
-      Anahtar: <b>testnet.binancefuture.com</b> → API Management
-    </div>
-    <div style="font-size:9px;letter-spacing:2px;color:#4a6a8a;margin-bottom:5px">API KEY</div>
-    <input id="am-key" type="text" placeholder="Testnet API Key..."
-      style="width:100%;background:#0a0f1a;border:1px solid #1a2744;border-radius:2px;
-      padding:9px 12px;color:#e0e8f0;font-family:monospace;font-size:11px;outline:none;
-      margin-bottom:12px;box-sizing:border-box">
-    <div style="font-size:9px;letter-spacing:2px;color:#4a6a8a;margin-bottom:5px">API SECRET</div>
-    <input id="am-sec" type="password" placeholder="Testnet API Secret..."
-      style="width:100%;background:#0a0f1a;border:1px solid #1a2744;border-radius:2px;
-      padding:9px 12px;color:#e0e8f0;font-family:monospace;font-size:11px;outline:none;
-      margin-bottom:16px;box-sizing:border-box">
-    <div style="display:flex;gap:10px">
-      <button onclick="saveApiKeys()"
-        style="flex:1;padding:10px;border:1px solid #00ff88;border-radius:2px;background:none;
-        color:#00ff88;font-family:monospace;font-size:10px;font-weight:700;letter-spacing:2px;cursor:pointer">✓ BAĞLAN</button>
-      <button onclick="document.getElementById('api-modal').style.display='none'"
-        style="flex:1;padding:10px;border:1px solid #ff3366;border-radius:2px;background:none;
-        color:#ff3366;font-family:monospace;font-size:10px;font-weight:700;letter-spacing:2px;cursor:pointer">✕ İPTAL</button>
-    </div>
-    <div id="am-st" style="font-size:11px;text-align:center;margin-top:10px;min-height:16px"></div>
-  </div>
-</div>
-
-<!-- HEADER -->
-<header>
-  <div>
-    <div class="logo">AI TRADING BOT <span style="display:inline;font-size:12px;-webkit-text-fill-color:var(--cyan)">V4.0</span></div>
-    <div style="font-size:10px;color:var(--dim);letter-spacing:1px;margin-top:2px">BINANCE FUTURES ● SIMULATED TRADING ● REAL DATA</div>
-  </div>
-  <div class="hdr-center">
-    <div class="stat-mini">
-      <div class="stat-mini-l">Bakiye</div>
-      <div class="stat-mini-v c-cyan" id="hdr-balance">$10,000</div>
-    </div>
-    <div style="width:1px;height:36px;background:var(--b)"></div>
-    <div class="stat-mini">
-      <div class="stat-mini-l">PnL</div>
-      <div class="stat-mini-v" id="hdr-pnl">$0</div>
-    </div>
-    <div style="width:1px;height:36px;background:var(--b)"></div>
-    <div class="stat-mini">
-      <div class="stat-mini-l">Win Rate</div>
-      <div class="stat-mini-v" id="hdr-wr">50%</div>
-    </div>
-  </div>
-  <div class="hdr-right">
-    <div class="pill pill-off" id="status-pill">DURDURULDU</div>
-    <button class="btn btn-go" id="btn-s" onclick="startBot()">▶ BASLAT</button>
-    <button class="btn btn-stop" id="btn-x" onclick="stopBot()" disabled>■ DURDUR</button>
-  </div>
-</header>
-
-<!-- TOOLTIP -->
-<div class="tooltip" id="tt"></div>
-
-<div class="grid">
-
-  <!-- STATS -->
-  <div class="stats-area">
-    <div class="sc"><div class="sc-l">Portfoy</div><div class="sc-v c-cyan" id="s-bal">$10,000</div><div class="sc-s">Baslangic: $10,000</div></div>
-    <div class="sc"><div class="sc-l">Toplam PnL</div><div class="sc-v" id="s-pnl">$0</div><div class="sc-s" id="s-pnl-pct">0.00%</div></div>
-    <div class="sc"><div class="sc-l">Toplam Trade</div><div class="sc-v c-purple" id="s-tr">0</div><div class="sc-s" id="s-wl">W:0 / L:0</div></div>
-    <div class="sc"><div class="sc-l">Win Rate</div><div class="sc-v" id="s-wr">50%</div><div class="sc-s">Ogreniyor...</div></div>
-    <div class="sc"><div class="sc-l">Acik Poz.</div><div class="sc-v c-cyan" id="s-act">0/6</div><div class="sc-s">Maks 6 pozisyon</div></div>
-    <div class="sc"><div class="sc-l">Coins</div><div class="sc-v c-yellow" id="s-coins">0</div><div class="sc-s">Futures Ciftleri</div></div>
-    <div class="sc"><div class="sc-l">En Iyi Strat.</div><div class="sc-v c-green" style="font-size:14px" id="s-best">--</div><div class="sc-s">Ogreniyor</div></div>
-  </div>
-
-  <!-- COINS -->
-  <div class="coins-area panel">
-    <div class="coins-top">
-      <div class="ph-title" style="font-size:14px">PIYASA</div>
-      <input class="srch" id="srch" placeholder="Coin ara..." oninput="filterCoins()">
-      <div style="margin-left:auto;font-size:10px;color:var(--dim)" id="coin-count-lbl">0 coin</div>
-    </div>
-    <div class="coins-grid" id="cg"><div class="empty">Yukleniyor...</div></div>
-  </div>
-
-  <!-- CHART -->
-  <div class="chart-area panel">
-    <div class="ph">
-      <div class="ph-title" id="chart-sym">PNL GRAFiGi</div>
-      <div class="ph-badge" id="chart-badge">PORTFOY</div>
-    </div>
-    <div class="chart-toolbar" id="chart-tb" style="display:none">
-      <span style="font-size:10px;color:var(--dim);margin-right:4px">ZAMAN:</span>
-      <button class="tf-btn active" onclick="setTf('1m',this)">1m</button>
-      <button class="tf-btn" onclick="setTf('5m',this)">5m</button>
-      <button class="tf-btn" onclick="setTf('15m',this)">15m</button>
-      <button class="tf-btn" onclick="setTf('1h',this)">1h</button>
-      <button class="tf-btn" onclick="setTf('4h',this)">4h</button>
-      <span style="margin-left:auto;font-size:10px;color:var(--dim)" id="chart-ohlc"></span>
-    </div>
-    <canvas id="cv" height="200"></canvas>
-    <div class="chart-info" id="chart-info"></div>
-  </div>
-
-  <!-- STRATEGIES -->
-  <div class="strat-area panel">
-    <div class="ph"><div class="ph-title">STRATEJI OGRENIMI</div><div class="ph-badge">CANLI</div></div>
-    <div class="pb" id="strats"></div>
-  </div>
-
-  <!-- POSITIONS -->
-  <div class="pos-area panel">
-    <div class="ph">
-      <div class="ph-title">ACIK POZISYONLAR</div>
-      <div class="ph-badge" id="pos-badge">0 AKTIF</div>
-    </div>
-    <div class="pb" id="positions"><div class="empty">Pozisyon bekleniyor...</div></div>
-  </div>
-
-  <!-- HISTORY -->
-  <div class="hist-area panel">
-    <div class="ph">
-      <div class="ph-title">TRADE GECMiSi</div>
-      <div class="ph-badge" id="hist-badge">0 TRADE</div>
-    </div>
-    <div class="pb" id="history"><div class="empty">Trade bekleniyor...</div></div>
-  </div>
-
-  <!-- LOG -->
-  <div class="log-area panel">
-    <div class="ph"><div class="ph-title">SiSTEM LOGU</div><div class="ph-badge green">CANLI</div></div>
-    <div class="pb" id="log"><div class="empty">Log bekleniyor...</div></div>
-  </div>
+#modal-cv{width:100%;border-radius:3px;display:block}
 
-</div>
+/* EMPTY */
+.empty{padding:32px;text-align:center;color:var(--dim);font-size:11px;letter-spacing:1px}
 
-<!-- COIN MODAL -->
-<div class="modal-overlay" id="modal" onclick="if(event.target===this)closeModal()">
-  <div class="modal">
-    <div class="modal-head">
-      <div>
-        <div class="modal-sym" id="m-sym">--</div>
-        <div style="font-size:10px;color:var(--dim);margin-top:2px" id="m-sub">--</div>
-      </div>
-      <button class="modal-close" onclick="closeModal()">✕</button>
-    </div>
-    <div class="modal-body">
-      <div class="modal-stats">
-        <div class="ms"><div class="ms-l">Fiyat</div><div class="ms-v c-cyan" id="m-price">--</div></div>
-        <div class="ms"><div class="ms-l">24s Degisim</div><div class="ms-v" id="m-change">--</div></div>
-        <div class="ms"><div class="ms-l">24s Yuksek</div><div class="ms-v c-green" id="m-high">--</div></div>
-        <div class="ms"><div class="ms-l">24s Dusuk</div><div class="ms-v c-red" id="m-low">--</div></div>
-      </div>
-      <canvas id="modal-cv" height="180"></canvas>
-    </div>
-  </div>
-</div>
+/* TOOLTIP */
+.tooltip{position:fixed;background:var(--s2);border:1px solid var(--b2);
+  border-radius:3px;padding:6px 10px;font-size:10px;pointer-events:none;
+  z-index:200;display:none;line-height:1.6}
+"""
 
-<script>
-// ── STATE ──────────────────────────────────────────────────
+JS = r"""// ── STATE ──────────────────────────────────────────────────
 let running=false, data={}, curSym=null, curTf='5m', chartMode='pnl';
 let tickerCoins=[], rafId=null;
 
@@ -985,6 +2598,17 @@ function startBot(){
 function stopBot(){
   fetch('/api/stop').then(()=>{running=false;syncUI()});
 }
+async function flattenAll(){
+  if(!confirm('Tum pozisyonlar kapatilsin mi?'))return;
+  const b=document.getElementById('btn-f'); b.disabled=true;
+  try{
+    const r=await(await fetch('/api/flatten',{method:'POST'})).json();
+    const bad=(r.legs||[]).filter(l=>!l.ok);
+    alert('Flatten: '+((r.legs||[]).length-bad.length)+'/'+(r.legs||[]).length+' kapatildi'+
+      (bad.length?'\n'+bad.map(l=>l.sym+': '+l.msg).join('\n'):''));
+  }catch(e){alert('Flatten hatasi');}
+  b.disabled=false;
+}
 async function saveApiKeys(){
   const ak=document.getElementById('am-key').value.trim();
   const sk=document.getElementById('am-sec').value.trim();
@@ -1538,7 +3162,12 @@ async function tick(){
     const r=await fetch('/api/status');
     data=await r.json();
     if(data.error)return;
+    render();
+  }catch(e){console.error(e)}
+}
 
+function render(){
+  try{
     running=data.running||false;
     syncUI();
     updateConn(data);
@@ -1555,30 +3184,321 @@ async function tick(){
   }catch(e){console.error(e)}
 }
 
+// ── LIVE STREAM (SSE) ─────────────────────────────────────
+let es=null, pollId=null, dirty=false;
+function schedule(){
+  if(dirty) return;
+  dirty=true;
+  requestAnimationFrame(()=>{dirty=false;render();});
+}
+function applyDelta(d){
+  Object.assign(data,d.set||{});
+  if(d.coins){data.coins=data.coins||{};Object.assign(data.coins,d.coins);}
+  (d.coins_del||[]).forEach(s=>{delete data.coins[s]});
+  if(d.pos){
+    data.positions=data.positions||{};
+    for(const [s,p] of Object.entries(d.pos)) data.positions[s]=Object.assign(data.positions[s]||{},p);
+  }
+  (d.pos_del||[]).forEach(s=>{delete data.positions[s]});
+  if(d.history) data.history=d.history.concat(data.history||[]).slice(0,40);
+  if(d.events) data.events=d.events.concat(data.events||[]).slice(0,60);
+}
+function startPolling(){
+  if(!pollId){tick();pollId=setInterval(tick,3000);}
+  setTimeout(connect,15000);
+}
+function connect(){
+  if(!window.EventSource){startPolling();return;}
+  es=new EventSource('/api/stream');
+  es.addEventListener('snap',e=>{data=JSON.parse(e.data);schedule();});
+  es.addEventListener('delta',e=>{applyDelta(JSON.parse(e.data));schedule();});
+  es.onopen=()=>{if(pollId){clearInterval(pollId);pollId=null;}};
+  es.onerror=()=>{if(es.readyState===EventSource.CLOSED){es=null;startPolling();}};
+}
+
 // Init
-tick();
-setInterval(tick,3000);
+connect();
 window.addEventListener('resize',()=>{
   if(chartMode==='pnl') drawPnlChart(data.curve||[]);
   else if(chartMode==='candle'&&curSym) showCandles(curSym);
 });
-</script>
+"""
+
+HTML = r"""<!DOCTYPE html>
+<html lang="tr">
+<head>
+<meta charset="UTF-8">
+<title>AI Trading Bot v4</title>
+<link href="https://fonts.googleapis.com/css2?family=IBM+Plex+Mono:wght@300;400;500;600;700&family=Bebas+Neue&display=swap" rel="stylesheet">
+<link rel="stylesheet" href="%CSS%">
+</head>
+<body>
+
+<!-- CONN BAR -->
+<div style="background:#0a0f1a;border-bottom:1px solid #1a2744;padding:5px 20px;display:flex;align-items:center;gap:14px;font-size:10px;letter-spacing:.5px;flex-wrap:wrap">
+  <div style="display:flex;align-items:center;gap:6px">
+    <div id="c-dot" style="width:7px;height:7px;border-radius:50%;background:#ff3366"></div>
+    <span id="c-status" style="color:#4a6a8a">Bağlanıyor...</span>
+  </div>
+  <span style="color:#1a2744">|</span>
+  <span style="color:#4a6a8a">Bakiye: <b id="c-bal" style="color:#e0e8f0">--</b></span>
+  <span style="color:#1a2744">|</span>
+  <span style="color:#4a6a8a">Unrealized: <b id="c-unr" style="color:#e0e8f0">--</b></span>
+  <span style="color:#1a2744">|</span>
+  <span id="c-api" style="color:#f0b429">● API KEY GİRİLMEDİ</span>
+  <button onclick="document.getElementById('api-modal').style.display='flex'"
+    style="margin-left:auto;padding:3px 12px;border:1px solid #00d4ff;border-radius:2px;
+    background:none;color:#00d4ff;font-family:monospace;font-size:9px;font-weight:700;
+    letter-spacing:1.5px;cursor:pointer">⚙ API AYARLA</button>
+</div>
+
+<!-- TICKER -->
+<div class="ticker-wrap">
+  <div class="ticker-inner" id="ticker"></div>
+</div>
+
+<!-- API MODAL -->
+<div id="api-modal" style="display:none;position:fixed;inset:0;background:rgba(0,0,0,.85);
+  z-index:2000;align-items:center;justify-content:center">
+  <div style="background:#0d1421;border:1px solid #1a2744;border-radius:4px;width:420px;max-width:95vw;padding:24px">
+    <div style="font-family:'Orbitron',monospace;font-size:18px;letter-spacing:3px;color:#00d4ff;margin-bottom:16px">API BAĞLANTISI</div>
+    <div style="font-size:10px;color:#4a6a8a;line-height:1.7;margin-bottom:14px;
+      background:rgba(0,212,255,.04);border:1px solid rgba(0,212,255,.1);border-radius:3px;padding:10px">
+      <b>Binance Futures Testnet</b> API anahtarlarını gir.<br>
+      Anahtar: <b>testnet.binancefuture.com</b> → API Management
+    </div>
+    <div style="font-size:9px;letter-spacing:2px;color:#4a6a8a;margin-bottom:5px">API KEY</div>
+    <input id="am-key" type="text" placeholder="Testnet API Key..."
+      style="width:100%;background:#0a0f1a;border:1px solid #1a2744;border-radius:2px;
+      padding:9px 12px;color:#e0e8f0;font-family:monospace;font-size:11px;outline:none;
+      margin-bottom:12px;box-sizing:border-box">
+    <div style="font-size:9px;letter-spacing:2px;color:#4a6a8a;margin-bottom:5px">API SECRET</div>
+    <input id="am-sec" type="password" placeholder="Testnet API Secret..."
+      style="width:100%;background:#0a0f1a;border:1px solid #1a2744;border-radius:2px;
+      padding:9px 12px;color:#e0e8f0;font-family:monospace;font-size:11px;outline:none;
+      margin-bottom:16px;box-sizing:border-box">
+    <div style="display:flex;gap:10px">
+      <button onclick="saveApiKeys()"
+        style="flex:1;padding:10px;border:1px solid #00ff88;border-radius:2px;background:none;
+        color:#00ff88;font-family:monospace;font-size:10px;font-weight:700;letter-spacing:2px;cursor:pointer">✓ BAĞLAN</button>
+      <button onclick="document.getElementById('api-modal').style.display='none'"
+        style="flex:1;padding:10px;border:1px solid #ff3366;border-radius:2px;background:none;
+        color:#ff3366;font-family:monospace;font-size:10px;font-weight:700;letter-spacing:2px;cursor:pointer">✕ İPTAL</button>
+    </div>
+    <div id="am-st" style="font-size:11px;text-align:center;margin-top:10px;min-height:16px"></div>
+  </div>
+</div>
+
+<!-- HEADER -->
+<header>
+  <div>
+    <div class="logo">AI TRADING BOT <span style="display:inline;font-size:12px;-webkit-text-fill-color:var(--cyan)">V4.0</span></div>
+    <div style="font-size:10px;color:var(--dim);letter-spacing:1px;margin-top:2px">BINANCE FUTURES ● SIMULATED TRADING ● REAL DATA</div>
+  </div>
+  <div class="hdr-center">
+    <div class="stat-mini">
+      <div class="stat-mini-l">Bakiye</div>
+      <div class="stat-mini-v c-cyan" id="hdr-balance">$10,000</div>
+    </div>
+    <div style="width:1px;height:36px;background:var(--b)"></div>
+    <div class="stat-mini">
+      <div class="stat-mini-l">PnL</div>
+      <div class="stat-mini-v" id="hdr-pnl">$0</div>
+    </div>
+    <div style="width:1px;height:36px;background:var(--b)"></div>
+    <div class="stat-mini">
+      <div class="stat-mini-l">Win Rate</div>
+      <div class="stat-mini-v" id="hdr-wr">50%</div>
+    </div>
+  </div>
+  <div class="hdr-right">
+    <div class="pill pill-off" id="status-pill">DURDURULDU</div>
+    <button class="btn btn-go" id="btn-s" onclick="startBot()">▶ BASLAT</button>
+    <button class="btn btn-stop" id="btn-x" onclick="stopBot()" disabled>■ DURDUR</button>
+    <button class="btn btn-stop" id="btn-f" onclick="flattenAll()" title="Tum pozisyonlari kapat">✕ KAPAT</button>
+  </div>
+</header>
+
+<!-- TOOLTIP -->
+<div class="tooltip" id="tt"></div>
+
+<div class="grid">
+
+  <!-- STATS -->
+  <div class="stats-area">
+    <div class="sc"><div class="sc-l">Portfoy</div><div class="sc-v c-cyan" id="s-bal">$10,000</div><div class="sc-s">Baslangic: $10,000</div></div>
+    <div class="sc"><div class="sc-l">Toplam PnL</div><div class="sc-v" id="s-pnl">$0</div><div class="sc-s" id="s-pnl-pct">0.00%</div></div>
+    <div class="sc"><div class="sc-l">Toplam Trade</div><div class="sc-v c-purple" id="s-tr">0</div><div class="sc-s" id="s-wl">W:0 / L:0</div></div>
+    <div class="sc"><div class="sc-l">Win Rate</div><div class="sc-v" id="s-wr">50%</div><div class="sc-s">Ogreniyor...</div></div>
+    <div class="sc"><div class="sc-l">Acik Poz.</div><div class="sc-v c-cyan" id="s-act">0/6</div><div class="sc-s">Maks 6 pozisyon</div></div>
+    <div class="sc"><div class="sc-l">Coins</div><div class="sc-v c-yellow" id="s-coins">0</div><div class="sc-s">Futures Ciftleri</div></div>
+    <div class="sc"><div class="sc-l">En Iyi Strat.</div><div class="sc-v c-green" style="font-size:14px" id="s-best">--</div><div class="sc-s">Ogreniyor</div></div>
+  </div>
+
+  <!-- COINS -->
+  <div class="coins-area panel">
+    <div class="coins-top">
+      <div class="ph-title" style="font-size:14px">PIYASA</div>
+      <input class="srch" id="srch" placeholder="Coin ara..." oninput="filterCoins()">
+      <div style="margin-left:auto;font-size:10px;color:var(--dim)" id="coin-count-lbl">0 coin</div>
+    </div>
+    <div class="coins-grid" id="cg"><div class="empty">Yukleniyor...</div></div>
+  </div>
+
+  <!-- CHART -->
+  <div class="chart-area panel">
+    <div class="ph">
+      <div class="ph-title" id="chart-sym">PNL GRAFiGi</div>
+      <div class="ph-badge" id="chart-badge">PORTFOY</div>
+    </div>
+    <div class="chart-toolbar" id="chart-tb" style="display:none">
+      <span style="font-size:10px;color:var(--dim);margin-right:4px">ZAMAN:</span>
+      <button class="tf-btn active" onclick="setTf('1m',this)">1m</button>
+      <button class="tf-btn" onclick="setTf('5m',this)">5m</button>
+      <button class="tf-btn" onclick="setTf('15m',this)">15m</button>
+      <button class="tf-btn" onclick="setTf('1h',this)">1h</button>
+      <button class="tf-btn" onclick="setTf('4h',this)">4h</button>
+      <span style="margin-left:auto;font-size:10px;color:var(--dim)" id="chart-ohlc"></span>
+    </div>
+    <canvas id="cv" height="200"></canvas>
+    <div class="chart-info" id="chart-info"></div>
+  </div>
+
+  <!-- STRATEGIES -->
+  <div class="strat-area panel">
+    <div class="ph"><div class="ph-title">STRATEJI OGRENIMI</div><div class="ph-badge">CANLI</div></div>
+    <div class="pb" id="strats"></div>
+  </div>
+
+  <!-- POSITIONS -->
+  <div class="pos-area panel">
+    <div class="ph">
+      <div class="ph-title">ACIK POZISYONLAR</div>
+      <div class="ph-badge" id="pos-badge">0 AKTIF</div>
+    </div>
+    <div class="pb" id="positions"><div class="empty">Pozisyon bekleniyor...</div></div>
+  </div>
+
+  <!-- HISTORY -->
+  <div class="hist-area panel">
+    <div class="ph">
+      <div class="ph-title">TRADE GECMiSi</div>
+      <div class="ph-badge" id="hist-badge">0 TRADE</div>
+    </div>
+    <div class="pb" id="history"><div class="empty">Trade bekleniyor...</div></div>
+  </div>
+
+  <!-- LOG -->
+  <div class="log-area panel">
+    <div class="ph"><div class="ph-title">SiSTEM LOGU</div><div class="ph-badge green">CANLI</div></div>
+    <div class="pb" id="log"><div class="empty">Log bekleniyor...</div></div>
+  </div>
+
+</div>
+
+<!-- COIN MODAL -->
+<div class="modal-overlay" id="modal" onclick="if(event.target===this)closeModal()">
+  <div class="modal">
+    <div class="modal-head">
+      <div>
+        <div class="modal-sym" id="m-sym">--</div>
+        <div style="font-size:10px;color:var(--dim);margin-top:2px" id="m-sub">--</div>
+      </div>
+      <button class="modal-close" onclick="closeModal()">✕</button>
+    </div>
+    <div class="modal-body">
+      <div class="modal-stats">
+        <div class="ms"><div class="ms-l">Fiyat</div><div class="ms-v c-cyan" id="m-price">--</div></div>
+        <div class="ms"><div class="ms-l">24s Degisim</div><div class="ms-v" id="m-change">--</div></div>
+        <div class="ms"><div class="ms-l">24s Yuksek</div><div class="ms-v c-green" id="m-high">--</div></div>
+        <div class="ms"><div class="ms-l">24s Dusuk</div><div class="ms-v c-red" id="m-low">--</div></div>
+      </div>
+      <canvas id="modal-cv" height="180"></canvas>
+    </div>
+  </div>
+</div>
+
+<script src="%JS%"></script>
 </body>
 </html>
 """
 
+# Encoded and gzipped once at startup. CSS/JS live under content-hashed URLs and are
+# cached forever; the page itself revalidates with its strong ETag.
+Asset=namedtuple('Asset','body gz etag ctype cache')
+
+class Assets:
+    def __init__(self):
+        self.files={}
+        css=self._add('/static/app.{}.css',CSS,'text/css;charset=utf-8')
+        js=self._add('/static/app.{}.js',JS,'application/javascript;charset=utf-8')
+        page=HTML.replace('%CSS%',css).replace('%JS%',js)
+        self._add('/',page,'text/html;charset=utf-8',cache='no-cache')
+        self.files['/index.html']=self.files['/']
+
+    def _add(self,path,text,ctype,cache='public, max-age=31536000, immutable'):
+        body=text.encode('utf-8')
+        h=hashlib.sha256(body).hexdigest()[:16]
+        path=path.format(h)
+        self.files[path]=Asset(body,gzip.compress(body,9),f'"{h}"',ctype,cache)
+        return path
+
+    def get(self,path): return self.files.get(path)
+
+ASSETS=Assets()
+
 # ── WEB HANDLER ───────────────────────────────────────────
 engine_g = None
 
 class H(BaseHTTPRequestHandler):
+    protocol_version='HTTP/1.1'
+    timeout=5                       # idle keep-alive connections give their worker back (polling is 3 s)
+    GZIP_MIN=1024
+    GZIP_TYPES=('text/','application/json','application/javascript')
+
+    def setup(self):
+        super().setup()
+        # headers and body go out as separate writes; don't let Nagle hold the body
+        self.connection.setsockopt(socket.IPPROTO_TCP,socket.TCP_NODELAY,1)
+
+    def _send(self,code,body=b'',ctype='application/json',headers=None,gz=None):
+        # gz: pre-compressed variant of body, used when the client accepts gzip
+        accepts='gzip' in self.headers.get('Accept-Encoding','')
+        if accepts and gz is None and len(body)>=self.GZIP_MIN and ctype.startswith(self.GZIP_TYPES):
+            gz=gzip.compress(body,5)
+        use_gz=accepts and gz is not None and len(gz)<len(body)
+        out=gz if use_gz else body
+        self.send_response(code)
+        self.send_header('Content-type',ctype)
+        self.send_header('Access-Control-Allow-Origin','*')
+        for k,v in (headers or {}).items(): self.send_header(k,v)
+        if gz is not None or len(body)>=self.GZIP_MIN: self.send_header('Vary','Accept-Encoding')
+        if use_gz: self.send_header('Content-Encoding','gzip')
+        self.send_header('Content-Length',str(len(out)))
+        self.end_headers()
+        if self.command!='HEAD': self.wfile.write(out)
+
+    def _json(self,obj,code=200): self._send(code,json.dumps(obj).encode())
+
+    def _not_modified(self,etag,headers):
+        if etag not in [t.strip() for t in self.headers.get('If-None-Match','').split(',')]: return False
+        self.send_response(304)
+        for k,v in headers.items(): self.send_header(k,v)
+        self.send_header('Content-Length','0')
+        self.end_headers()
+        return True
+
     def do_POST(self):
         try:
             n=int(self.headers.get('Content-Length',0))
             body=json.loads(self.rfile.read(n)) if n else {}
-            if self.path=='/api/setkeys':
+            if self.path=='/api/flatten':
+                resp=engine_g.flatten() if engine_g else {'ok':False}
+            elif self.path=='/api/setkeys':
                 ak=body.get('api_key','').strip()
                 sk=body.get('api_secret','').strip()
                 engine_g.bc.set_keys(ak,sk)
+                if engine_g.user: engine_g.user.restart()
                 acc=engine_g.bc.fetch_account(force=True)
                 if acc and acc['wallet']>0:
                     engine_g.agent.balance=acc['wallet']
@@ -1590,54 +3510,125 @@ class H(BaseHTTPRequestHandler):
                     err=getattr(engine_g.bc,'_last_err','Hata')
                     engine_g.log(f"API hatasi: {err}","error")
                     resp={'ok':False,'balance':0,'err':str(err)}
+                engine_g.publish(network=False)
             else:
                 resp={'ok':False}
-            payload=json.dumps(resp).encode()
-            self.send_response(200)
-            self.send_header('Content-type','application/json')
-            self.send_header('Access-Control-Allow-Origin','*')
-            self.end_headers()
-            self.wfile.write(payload)
-        except BrokenPipeError: pass
+            self._json(resp)
+        except BrokenPipeError: self.close_connection=True
         except Exception as e:
+            self.close_connection=True
             print(f"POST err: {e}")
+
     def do_GET(self):
         try:
-            if self.path=='/':
-                self.send_response(200)
-                self.send_header('Content-type','text/html;charset=utf-8')
-                self.end_headers()
-                self.wfile.write(HTML.encode('utf-8'))
+            asset=ASSETS.get(self.path.split('?',1)[0])
+            if asset:
+                hdr={'ETag':asset.etag,'Cache-Control':asset.cache}
+                if not self._not_modified(asset.etag,hdr):
+                    self._send(200,asset.body,asset.ctype,hdr,gz=asset.gz)
             elif self.path=='/api/status':
-                self.send_response(200)
-                self.send_header('Content-type','application/json')
-                self.send_header('Access-Control-Allow-Origin','*')
-                self.end_headers()
-                self.wfile.write(json.dumps(engine_g.state() if engine_g else {}).encode())
+                if not engine_g: return self._json({})
+                snap=engine_g.snapshot()
+                hdr={'Cache-Control':'no-cache','ETag':snap.etag,'X-Snapshot-Version':str(snap.version)}
+                if not self._not_modified(snap.etag,hdr):
+                    self._send(200,snap.body,headers=hdr,gz=snap.gz)
+            elif self.path=='/api/stream':
+                self._sse()
+            elif self.path=='/api/metrics':
+                self._json(engine_g.metrics() if engine_g else {})
             elif self.path=='/api/start':
-                self.send_response(200)
-                self.send_header('Content-type','text/plain')
-                self.end_headers()
                 if engine_g and not engine_g.running:
                     threading.Thread(target=engine_g.start,daemon=True).start()
-                self.wfile.write(b'ok')
+                self._send(200,b'ok','text/plain')
             elif self.path=='/api/stop':
-                self.send_response(200)
-                self.send_header('Content-type','text/plain')
-                self.end_headers()
                 if engine_g: engine_g.stop()
-                self.wfile.write(b'ok')
-        except BrokenPipeError: pass
-        except Exception as e: print(f"req err: {e}")
+                self._send(200,b'ok','text/plain')
+            else:
+                self._send(404,b'not found','text/plain')
+        except (BrokenPipeError,ConnectionResetError): self.close_connection=True
+        except Exception as e:
+            self.close_connection=True
+            print(f"req err: {e}")
+
+    def do_HEAD(self):
+        # GET without the body, for side-effect-free routes only: start/stop act, the stream never ends
+        if ASSETS.get(self.path.split('?',1)[0]) or self.path in ('/api/status','/api/metrics'):
+            return self.do_GET()
+        try:
+            if self.path in ('/api/start','/api/stop','/api/stream'):
+                self._send(405,b'method not allowed','text/plain',{'Allow':'GET'})
+            else:
+                self._send(404,b'not found','text/plain')
+        except (BrokenPipeError,ConnectionResetError): self.close_connection=True
+
+    def _sse(self):
+        # long-lived: own concurrency cap, no Content-Length, connection closes at the end
+        self.close_connection=True
+        if not self.server.streams.acquire(blocking=False):
+            return self._send(503,b'too many streams','text/plain',{'Retry-After':'5'})
+        try:
+            self.send_response(200)
+            self.send_header('Content-type','text/event-stream')
+            self.send_header('Cache-Control','no-cache')
+            self.send_header('Connection','close')
+            self.send_header('X-Accel-Buffering','no')
+            self.end_headers()
+            if not engine_g: return
+            last=self.headers.get('Last-Event-ID','')
+            last=int(last) if last.isdigit() else None
+            self.wfile.write(b'retry: 2000\n\n')
+            while True:
+                msgs,last=engine_g.hub.since(last,engine_g.snapshot)
+                self.wfile.write(b''.join(msgs) if msgs else b': ping\n\n')
+                self.wfile.flush()
+        finally:
+            self.server.streams.release()
+
     def log_message(self,*a): pass
 
+# Thread per connection with a bounded number of workers; when all are busy a new connection
+# gets an immediate 503 instead of a thread, and the accept loop never waits. HTTPServer is looked up at import time, so run.py's
+# RailwayServer patch still decides the bind address.
+class DashServer(ThreadingMixIn,HTTPServer):
+    daemon_threads=True
+    max_workers=int(os.environ.get('BOT_HTTP_WORKERS',32))
+    max_streams=int(os.environ.get('BOT_HTTP_STREAMS',16))
+
+    def __init__(self,*a,**kw):
+        super().__init__(*a,**kw)
+        self.slots=threading.BoundedSemaphore(self.max_workers)
+        self.streams=threading.BoundedSemaphore(min(self.max_streams,self.max_workers-1))
+
+    BUSY=(b'HTTP/1.1 503 Service Unavailable\r\nContent-Type: text/plain\r\nContent-Length: 4\r\n'
+          b'Retry-After: 1\r\nConnection: close\r\n\r\nbusy')
+
+    def process_request(self,request,client_address):
+        # runs on the accept thread: blocking here would let idle keep-alive sockets hold
+        # /api/stop and the other control routes hostage
+        if not self.slots.acquire(blocking=False):
+            try:
+                request.setblocking(False)
+                try: request.recv(65536)     # take what already arrived, so close() doesn't reset
+                except OSError: pass
+                request.sendall(self.BUSY)
+            except OSError: pass
+            self.shutdown_request(request)
+            return
+        try: super().process_request(request,client_address)
+        except Exception:
+            self.slots.release(); raise
+
+    def process_request_thread(self,request,client_address):
+        try: super().process_request_thread(request,client_address)
+        finally: self.slots.release()
+
 def main():
     global engine_g
     print("="*50)
     print("AI TRADING BOT v4.0")
     print("="*50)
     engine_g=Engine()
-    srv=HTTPServer(('localhost',8000),H)
+    srv=DashServer(('localhost',8000),H)
     print("\nhttp://localhost:8000")
     time.sleep(1)
     webbrowser.open('http://localhost:8000')